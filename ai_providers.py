@@ -0,0 +1,274 @@
+"""
+Pluggable AI providers for SmartAdd.
+
+The SmartAdd endpoints only need "send a prompt plus some images, get text back".
+Each provider implements that one call and keeps its own latency/error metrics,
+so we can swap Gemini for a local stub (load tests, offline dev) or a local
+vision model without touching the endpoints.
+
+Provider selection is driven by environment variables:
+
+    AI_PROVIDER         gemini (default) | stub | local
+    AI_MODEL            model name, defaults depend on the provider
+    AI_STUB_FIXTURE     JSON file with canned responses for the stub provider
+    AI_STUB_LATENCY_MS  artificial latency for the stub provider
+    AI_LOCAL_URL        base URL of an Ollama-compatible server (local provider)
+"""
+import base64
+import io
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+DEFAULT_GEMINI_MODEL = "gemini-2.0-flash-exp"
+DEFAULT_LOCAL_MODEL = "llava"
+
+
+class AIProviderError(Exception):
+    """Raised when a provider fails to produce a response"""
+
+
+class AIProviderTimeout(AIProviderError):
+    """Raised when a provider does not answer within the call's timeout"""
+
+
+class ProviderMetrics:
+    """Thread-safe call/latency/error counters for a single provider"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def record(self, elapsed_ms: float, error: Optional[Exception] = None):
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_latency_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+                "max_latency_ms": round(self.max_ms, 2),
+                "last_error": self.last_error,
+            }
+
+
+class AIProvider(ABC):
+    """Base class: subclasses implement _generate()"""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+        self.metrics = ProviderMetrics()
+
+    def is_configured(self) -> bool:
+        return True
+
+    def not_configured_message(self) -> str:
+        return f"AI provider '{self.name}' is not configured"
+
+    def generate_content(self, prompt: str, images: List[Any], timeout: Optional[float] = None) -> str:
+        """
+        Run the model and return its raw text response, recording metrics. With a
+        timeout the call itself gives up (AIProviderTimeout) instead of leaving its
+        thread blocked
+        """
+        start = time.perf_counter()
+        try:
+            text = self._generate(prompt, images, timeout)
+        except Exception as e:
+            self.metrics.record((time.perf_counter() - start) * 1000, error=e)
+            raise
+        self.metrics.record((time.perf_counter() - start) * 1000)
+        return text
+
+    @abstractmethod
+    def _generate(self, prompt: str, images: List[Any], timeout: Optional[float] = None) -> str:
+        ...
+
+
+class GeminiProvider(AIProvider):
+    name = "gemini"
+
+    def __init__(self, model: str = DEFAULT_GEMINI_MODEL):
+        super().__init__(model)
+        self._client = None
+
+    def is_configured(self) -> bool:
+        return bool(os.getenv("GOOGLE_AI_API_KEY"))
+
+    def not_configured_message(self) -> str:
+        return "Gemini API key not configured"
+
+    def _generate(self, prompt: str, images: List[Any], timeout: Optional[float] = None) -> str:
+        if self._client is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=os.getenv("GOOGLE_AI_API_KEY"))
+            self._client = genai.GenerativeModel(self.model)
+        if timeout is None:
+            return self._client.generate_content([prompt] + images).text
+        from google.api_core import exceptions as google_exceptions
+
+        try:
+            response = self._client.generate_content([prompt] + images, request_options={"timeout": timeout})
+        except google_exceptions.DeadlineExceeded as e:
+            raise AIProviderTimeout(f"No response within {timeout:g}s") from e
+        return response.text
+
+
+class StubProvider(AIProvider):
+    """
+    Deterministic offline provider for load tests and local development.
+
+    Responses come from AI_STUB_FIXTURE, a JSON file with a "single" and/or
+    "batch" response object; batch prompts (which ask for an "items" list) get
+    the "batch" response. Without a fixture a canned response is returned.
+    """
+
+    name = "stub"
+
+    DEFAULT_RESPONSES: Dict[str, Dict[str, Any]] = {
+        "single": {
+            "name": "Stub Item",
+            "category": "Miscellaneous",
+            "quantity": 1,
+            "confidence": 0.9,
+            "custom_attributes": {"brand": "Stub"},
+        },
+        "batch": {
+            "items": [
+                {
+                    "name": "Stub Item",
+                    "category": "Miscellaneous",
+                    "quantity": 1,
+                    "confidence": 0.9,
+                    "custom_attributes": {"brand": "Stub"},
+                }
+            ],
+            "overall_confidence": 0.9,
+        },
+    }
+
+    def __init__(self, model: str = "stub", fixture_path: Optional[str] = None, latency_ms: float = 0.0):
+        super().__init__(model)
+        self.latency_ms = latency_ms
+        self.responses = dict(self.DEFAULT_RESPONSES)
+        if fixture_path:
+            with open(fixture_path) as f:
+                fixture = json.load(f)
+            if "single" in fixture or "batch" in fixture:
+                self.responses.update({k: v for k, v in fixture.items() if k in ("single", "batch")})
+            else:
+                self.responses = {"single": fixture, "batch": fixture}
+
+    def _generate(self, prompt: str, images: List[Any], timeout: Optional[float] = None) -> str:
+        if self.latency_ms:
+            if timeout is not None and self.latency_ms / 1000 > timeout:
+                time.sleep(timeout)
+                raise AIProviderTimeout(f"No response within {timeout:g}s")
+            time.sleep(self.latency_ms / 1000)
+        key = "batch" if '"items"' in prompt else "single"
+        return json.dumps(self.responses[key])
+
+
+class LocalVisionProvider(AIProvider):
+    """Vision model served locally through an Ollama-compatible /api/generate endpoint"""
+
+    name = "local"
+
+    def __init__(self, model: str = DEFAULT_LOCAL_MODEL, base_url: str = "http://localhost:11434", timeout: float = 120.0):
+        super().__init__(model)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _generate(self, prompt: str, images: List[Any], timeout: Optional[float] = None) -> str:
+        import urllib.request
+
+        timeout = timeout if timeout is not None else self.timeout
+
+        encoded = []
+        for image in images:
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, format="JPEG")
+            encoded.append(base64.b64encode(buffer.getvalue()).decode("ascii"))
+
+        payload = json.dumps({
+            "model": self.model,
+            "prompt": prompt,
+            "images": encoded,
+            "stream": False,
+        }).encode("utf-8")
+        req = urllib.request.Request(
+            f"{self.base_url}/api/generate",
+            data=payload,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                body = json.loads(resp.read().decode("utf-8"))
+        except OSError as e:
+            # A connect timeout arrives wrapped in URLError, a read timeout bare
+            if isinstance(e, TimeoutError) or isinstance(getattr(e, "reason", None), TimeoutError):
+                raise AIProviderTimeout(f"No response within {timeout:g}s") from e
+            raise AIProviderError(f"Local vision model unavailable: {e}") from e
+        return body.get("response", "")
+
+
+# One instance per (provider, model) so metrics accumulate across requests
+_providers: Dict[tuple, AIProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def _build_provider(name: str) -> AIProvider:
+    model = os.getenv("AI_MODEL")
+    if name == "gemini":
+        return GeminiProvider(model or DEFAULT_GEMINI_MODEL)
+    if name == "stub":
+        return StubProvider(
+            model or "stub",
+            fixture_path=os.getenv("AI_STUB_FIXTURE") or None,
+            latency_ms=float(os.getenv("AI_STUB_LATENCY_MS", "0")),
+        )
+    if name == "local":
+        return LocalVisionProvider(
+            model or DEFAULT_LOCAL_MODEL,
+            base_url=os.getenv("AI_LOCAL_URL", "http://localhost:11434"),
+        )
+    raise AIProviderError(f"Unknown AI provider: {name}")
+
+
+def get_ai_provider() -> AIProvider:
+    """Return the provider selected by AI_PROVIDER / AI_MODEL"""
+    name = os.getenv("AI_PROVIDER", "gemini").lower()
+    key = (name, os.getenv("AI_MODEL"), os.getenv("AI_STUB_FIXTURE"), os.getenv("AI_STUB_LATENCY_MS"))
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _build_provider(name)
+            _providers[key] = provider
+        return provider
+
+
+def provider_metrics() -> List[Dict[str, Any]]:
+    """Metrics for every provider used by this process"""
+    with _providers_lock:
+        providers = list(_providers.values())
+    return [
+        {"provider": p.name, "model": p.model, **p.metrics.snapshot()}
+        for p in providers
+    ]
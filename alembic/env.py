@@ -0,0 +1,52 @@
+"""
+Alembic environment.
+
+The app passes its own connection in config.attributes["connection"] when it
+upgrades on startup; the alembic CLI connects to DATABASE_URL instead.
+"""
+import os
+
+from alembic import context
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+load_dotenv()
+
+config = context.config
+
+
+def target_metadata():
+    # Only autogenerate needs the models; importing main pulls in the whole API
+    if getattr(config.cmd_opts, "autogenerate", False):
+        from main import Base
+        return Base.metadata
+    return None
+
+
+def run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata(),
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_offline():
+    context.configure(url=os.environ["DATABASE_URL"], target_metadata=target_metadata(), literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif config.attributes.get("connection") is not None:
+    run_migrations(config.attributes["connection"])
+else:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL environment variable is not set.")
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        run_migrations(connection)
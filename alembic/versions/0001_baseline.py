@@ -0,0 +1,76 @@
+"""Baseline schema
+
+Databases created before migrations existed were built by create_all() plus
+ad-hoc ALTERs, so this revision is idempotent: it creates missing tables,
+columns and indexes and leaves everything else alone.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _tables(metadata: sa.MetaData):
+    return [
+        sa.Table(
+            "items", metadata,
+            sa.Column("id", sa.Integer, primary_key=True, index=True),
+            sa.Column("name", sa.String, index=True, nullable=False),
+            sa.Column("category", sa.String, index=True, nullable=False),
+            sa.Column("quantity", sa.Integer, nullable=False),
+            sa.Column("custom_attributes", sa.JSON, nullable=False),
+            sa.Column("image_url", sa.String, nullable=True),
+            sa.Column("qr_code_url", sa.String, nullable=True),
+            sa.Column("reorder_threshold", sa.Integer, nullable=True),
+            sa.Column("low_stock", sa.Boolean, server_default=sa.false(), nullable=False),
+            sa.Column("expiry_date", sa.Date, nullable=True, index=True),
+            sa.Column("image_hash", sa.String(16), nullable=True),
+            sa.Index(
+                "ix_items_low_stock", "category", "id",
+                sqlite_where=sa.text("low_stock = 1"),
+                postgresql_where=sa.text("low_stock"),
+            ),
+        ),
+        sa.Table(
+            "job_state", metadata,
+            sa.Column("name", sa.String, primary_key=True),
+            sa.Column("value", sa.String, nullable=False),
+        ),
+        sa.Table(
+            "item_barcodes", metadata,
+            sa.Column("code", sa.String, primary_key=True),
+            sa.Column("item_id", sa.Integer, index=True, nullable=False),
+        ),
+        sa.Table(
+            "category_thresholds", metadata,
+            sa.Column("category", sa.String, primary_key=True),
+            sa.Column("reorder_threshold", sa.Integer, nullable=False),
+        ),
+    ]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table in _tables(sa.MetaData()):
+        if not inspector.has_table(table.name):
+            table.create(bind)
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                op.add_column(table.name, column._copy())
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+
+def downgrade() -> None:
+    for table in reversed(_tables(sa.MetaData())):
+        op.drop_table(table.name)
@@ -0,0 +1,64 @@
+"""Indexes for the real access paths, items.updated_at
+
+- (category, name) serves category listings and name lookups within a category
+- (category, id) serves keyset paging of GET /items/?category=...&after_id=...
+- the single-column id and category indexes are covered by the primary key
+  and the composites, so they are dropped
+- expression indexes on the JSON attributes most items carry (brand, color,
+  material); queries must use the identical expression to hit them, e.g.
+  json_extract(custom_attributes, '$.color') on SQLite
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXED_ATTRIBUTES = ("brand", "color", "material")
+
+
+def _attribute_expression(dialect: str, key: str):
+    if dialect == "sqlite":
+        return sa.text(f"json_extract(custom_attributes, '$.{key}')")
+    if dialect == "postgresql":
+        return sa.text(f"(custom_attributes ->> '{key}')")
+    return None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = {index["name"] for index in sa.inspect(bind).get_indexes("items")}
+
+    op.add_column("items", sa.Column("updated_at", sa.DateTime, nullable=True))
+    op.execute("UPDATE items SET updated_at = CURRENT_TIMESTAMP")
+    op.create_index("ix_items_updated_at", "items", ["updated_at"])
+    op.create_index("ix_items_category_name", "items", ["category", "name"])
+    op.create_index("ix_items_category_id", "items", ["category", "id"])
+    for name in ("ix_items_id", "ix_items_category"):
+        if name in existing:
+            op.drop_index(name, table_name="items")
+
+    for key in INDEXED_ATTRIBUTES:
+        expression = _attribute_expression(bind.dialect.name, key)
+        if expression is not None:
+            op.create_index(f"ix_items_attr_{key}", "items", [expression])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    for key in INDEXED_ATTRIBUTES:
+        if _attribute_expression(bind.dialect.name, key) is not None:
+            op.drop_index(f"ix_items_attr_{key}", table_name="items")
+    op.create_index("ix_items_category", "items", ["category"])
+    op.create_index("ix_items_id", "items", ["id"])
+    op.drop_index("ix_items_category_id", table_name="items")
+    op.drop_index("ix_items_category_name", table_name="items")
+    op.drop_index("ix_items_updated_at", table_name="items")
+    with op.batch_alter_table("items") as batch:
+        batch.drop_column("updated_at")
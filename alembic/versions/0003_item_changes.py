@@ -0,0 +1,35 @@
+"""Item change log for the change feed
+
+Every item write appends a row in the same transaction; seq is the feed's
+sequence number, so it is AUTOINCREMENT on SQLite to stay monotonic after
+old rows are pruned.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "item_changes",
+        sa.Column("seq", sa.Integer, primary_key=True),
+        sa.Column("item_id", sa.Integer, nullable=False),
+        sa.Column("op", sa.String(8), nullable=False),
+        sa.Column("changes", sa.JSON, nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+        sqlite_autoincrement=True,
+    )
+    op.create_index("ix_item_changes_created_at", "item_changes", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_item_changes_created_at", table_name="item_changes")
+    op.drop_table("item_changes")
@@ -0,0 +1,69 @@
+"""Per-item version column and sync mutation ids
+
+- items.version is bumped by every write; offline clients send back the version
+  they last saw so conflicting edits are detected instead of overwritten
+- item_changes.mutation_id records which client mutation made a change, so a
+  retried POST /sync batch is applied once
+- on SQLite, items is rebuilt with AUTOINCREMENT: without it the id of the
+  newest item is reused after that item is deleted, and a client's tombstone
+  (or a stale offline delete) would then point at a different item. Index
+  definitions are replayed from sqlite_master so the partial and expression
+  indexes survive the copy
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def _rebuild_items_with_autoincrement(bind):
+    index_sql = list(bind.execute(sa.text(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'items' AND sql IS NOT NULL"
+    )).scalars())
+    op.create_table(
+        "items_autoincrement",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("category", sa.String, nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("custom_attributes", sa.JSON, nullable=False),
+        sa.Column("image_url", sa.String, nullable=True),
+        sa.Column("qr_code_url", sa.String, nullable=True),
+        sa.Column("reorder_threshold", sa.Integer, nullable=True),
+        sa.Column("low_stock", sa.Boolean, server_default=sa.false(), nullable=False),
+        sa.Column("expiry_date", sa.Date, nullable=True),
+        sa.Column("image_hash", sa.String(16), nullable=True),
+        sa.Column("updated_at", sa.DateTime, nullable=True),
+        sa.Column("version", sa.Integer, nullable=False, server_default=sa.text("1")),
+        sqlite_autoincrement=True,
+    )
+    columns = ", ".join(column["name"] for column in sa.inspect(bind).get_columns("items"))
+    op.execute(f"INSERT INTO items_autoincrement ({columns}) SELECT {columns} FROM items")
+    op.drop_table("items")
+    op.rename_table("items_autoincrement", "items")
+    for sql in index_sql:
+        op.execute(sql)
+
+
+def upgrade() -> None:
+    op.add_column("items", sa.Column("version", sa.Integer, nullable=False, server_default=sa.text("1")))
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        _rebuild_items_with_autoincrement(bind)
+    op.add_column("item_changes", sa.Column("mutation_id", sa.String(64), nullable=True))
+    op.create_index("ix_item_changes_mutation_id", "item_changes", ["mutation_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_item_changes_mutation_id", table_name="item_changes")
+    with op.batch_alter_table("item_changes") as batch:
+        batch.drop_column("mutation_id")
+    with op.batch_alter_table("items") as batch:
+        batch.drop_column("version")
@@ -0,0 +1,34 @@
+"""Stats rollups
+
+Per-category totals and per-attribute-value breakdowns behind the /stats
+endpoints. Item writes increment the affected rows; the table is filled from
+the items on first use (and whenever STATS_ROLLUP_ATTRIBUTES changes), so this
+revision only creates it.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_rollups",
+        sa.Column("category", sa.String, primary_key=True),
+        sa.Column("attribute", sa.String, primary_key=True),
+        sa.Column("value", sa.String, primary_key=True),
+        sa.Column("items", sa.Integer, nullable=False),
+        sa.Column("total_quantity", sa.Integer, nullable=False),
+        sa.Column("low_stock", sa.Integer, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stats_rollups")
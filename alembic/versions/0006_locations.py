@@ -0,0 +1,46 @@
+"""Storage locations
+
+A locations tree (room -> shelf -> bin) with a closure table holding every
+(ancestor, descendant) pair, and items.location_id. Subtree and path lookups
+are single indexed queries on location_closure.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "locations",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("parent_id", sa.Integer, nullable=True),
+    )
+    op.create_index("ix_locations_parent_id", "locations", ["parent_id"])
+    op.create_table(
+        "location_closure",
+        sa.Column("ancestor_id", sa.Integer, primary_key=True),
+        sa.Column("descendant_id", sa.Integer, primary_key=True),
+        sa.Column("depth", sa.Integer, nullable=False),
+    )
+    op.create_index("ix_location_closure_descendant", "location_closure", ["descendant_id", "depth"])
+    op.add_column("items", sa.Column("location_id", sa.Integer, nullable=True))
+    op.create_index("ix_items_location_id", "items", ["location_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_items_location_id", table_name="items")
+    with op.batch_alter_table("items") as batch:
+        batch.drop_column("location_id")
+    op.drop_index("ix_location_closure_descendant", table_name="location_closure")
+    op.drop_table("location_closure")
+    op.drop_index("ix_locations_parent_id", table_name="locations")
+    op.drop_table("locations")
@@ -0,0 +1,23 @@
+"""Index items.image_url
+
+The orphaned media collector asks, a batch of uploads at a time, which ones an
+item still points at; the index keeps that an index lookup instead of a scan.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_items_image_url", "items", ["image_url"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_items_image_url", table_name="items")
@@ -0,0 +1,91 @@
+"""
+Alert delivery for inventory events (e.g. low stock).
+
+Sinks are configured through environment variables:
+
+    ALERT_WEBHOOK_URL   POST each alert as JSON to this URL
+    ALERT_FILE          append each alert as a JSON line to this file
+
+Webhook delivery happens on a small background pool so a slow receiver never
+holds up the request that triggered the alert.
+"""
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class AlertSink(ABC):
+    @abstractmethod
+    def send(self, alert: Dict[str, Any]):
+        ...
+
+
+class FileSink(AlertSink):
+    """Append alerts to a local JSON-lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert: Dict[str, Any]):
+        line = json.dumps(alert)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class WebhookSink(AlertSink):
+    """POST alerts to a webhook URL without blocking the caller"""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="alert-webhook")
+
+    def send(self, alert: Dict[str, Any]):
+        self._executor.submit(self._post, alert)
+
+    def _post(self, alert: Dict[str, Any]):
+        import urllib.request
+
+        req = urllib.request.Request(
+            self.url,
+            data=json.dumps(alert).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout):
+                pass
+        except OSError as e:
+            logger.warning("Alert webhook delivery failed: %s", e)
+
+
+def create_alert_sinks() -> List[AlertSink]:
+    sinks: List[AlertSink] = []
+    if os.getenv("ALERT_WEBHOOK_URL"):
+        sinks.append(WebhookSink(os.environ["ALERT_WEBHOOK_URL"]))
+    if os.getenv("ALERT_FILE"):
+        sinks.append(FileSink(os.environ["ALERT_FILE"]))
+    return sinks
+
+
+def dispatch_alert(sinks: List[AlertSink], alert_type: str, **payload: Any) -> Dict[str, Any]:
+    """Stamp an alert and hand it to every configured sink"""
+    alert = {
+        "type": alert_type,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        **payload,
+    }
+    for sink in sinks:
+        try:
+            sink.send(alert)
+        except Exception as e:
+            logger.warning("Alert sink %s failed: %s", type(sink).__name__, e)
+    return alert
@@ -0,0 +1,164 @@
+"""
+Local barcode / QR decoding for SmartAdd.
+
+Decoding runs before any AI call: a Stuf QR code (".../item/{id}") or a known
+UPC/EAN resolves straight to an existing item without leaving the machine.
+
+pyzbar is preferred (QR, UPC, EAN, Code128, ...). When it or the zbar shared
+library is missing, OpenCV's QR and barcode detectors are used instead. With
+neither installed decoding is simply skipped.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+ITEM_URL_PATTERN = re.compile(r"/item/(\d+)(?:[/?#]|$)")
+
+_decoder = None
+
+
+@dataclass(frozen=True)
+class DecodedCode:
+    type: str
+    data: str
+
+    @property
+    def item_id(self) -> Optional[int]:
+        """Item id when this is a Stuf item QR code"""
+        match = ITEM_URL_PATTERN.search(self.data)
+        return int(match.group(1)) if match else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "data": self.data}
+
+
+def _pyzbar_decoder():
+    from pyzbar import pyzbar
+
+    def decode(image) -> List[DecodedCode]:
+        return [
+            DecodedCode(type=symbol.type, data=symbol.data.decode("utf-8", errors="replace"))
+            for symbol in pyzbar.decode(image)
+        ]
+    return decode
+
+
+def _opencv_decoder():
+    import cv2
+    import numpy as np
+
+    qr_detector = cv2.QRCodeDetector()
+    barcode_detector = cv2.barcode.BarcodeDetector() if hasattr(cv2, "barcode") else None
+
+    def decode(image) -> List[DecodedCode]:
+        array = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        codes = []
+        found, values, _points, _straight = qr_detector.detectAndDecodeMulti(array)
+        if found:
+            codes.extend(DecodedCode(type="QRCODE", data=value) for value in values if value)
+        if barcode_detector is not None:
+            if hasattr(barcode_detector, "detectAndDecodeWithType"):
+                found, values, types, _points = barcode_detector.detectAndDecodeWithType(array)
+            else:
+                found, values, types, _points = barcode_detector.detectAndDecode(array)
+            if found:
+                codes.extend(
+                    DecodedCode(type=str(kind), data=value)
+                    for value, kind in zip(values, types) if value
+                )
+        return codes
+    return decode
+
+
+def _get_decoder():
+    global _decoder
+    if _decoder is None:
+        for factory in (_pyzbar_decoder, _opencv_decoder):
+            try:
+                _decoder = factory()
+                break
+            except (ImportError, OSError, AttributeError):
+                continue
+        else:
+            _decoder = lambda image: []  # noqa: E731
+    return _decoder
+
+
+def decode_image(image) -> List[DecodedCode]:
+    """Decode every barcode / QR code in a PIL image"""
+    try:
+        return _get_decoder()(image)
+    except Exception:
+        # A decoder failure must never block the AI fallback
+        return []
+
+
+def decode_images(images: List[Any]) -> List[DecodedCode]:
+    codes: List[DecodedCode] = []
+    seen = set()
+    for image in images:
+        for code in decode_image(image):
+            if code.data not in seen:
+                seen.add(code.data)
+                codes.append(code)
+    return codes
+
+
+class CodeIndex:
+    """
+    In-memory code -> item id map for the scan fast path.
+
+    Loaded in one query on first use and kept current by the write paths of this
+    process. Writes in other workers bump a shared version (see cache.py); a
+    version change or ttl expiry triggers a reload.
+    """
+
+    def __init__(self, version: Callable[[], int] = lambda: 0, ttl: float = 60.0):
+        self._version = version
+        self.ttl = ttl
+        self._codes: Optional[Dict[str, int]] = None
+        self._loaded_version = 0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh_codes(self, version: int) -> Optional[Dict[str, int]]:
+        codes = self._codes
+        if codes is not None and version == self._loaded_version and time.monotonic() - self._loaded_at < self.ttl:
+            return codes
+        return None
+
+    def lookup(self, code: str, loader: Callable[[], Dict[str, int]]) -> Optional[int]:
+        """Resolve a code, (re)loading the whole map through loader when stale"""
+        version = self._version()
+        codes = self._fresh_codes(version)
+        if codes is None:
+            with self._lock:
+                codes = self._fresh_codes(version)
+                if codes is None:
+                    codes = loader()
+                    self._codes = codes
+                    self._loaded_version = version
+                    self._loaded_at = time.monotonic()
+        return codes.get(code)
+
+    def put(self, code: str, item_id: int):
+        with self._lock:
+            if self._codes is not None:
+                self._codes[code] = item_id
+
+    def discard(self, code: str, item_id: int):
+        """Forget code if it still points at item_id"""
+        with self._lock:
+            if self._codes is not None and self._codes.get(code) == item_id:
+                del self._codes[code]
+
+    def discard_item(self, item_id: int):
+        with self._lock:
+            if self._codes is not None:
+                self._codes = {code: iid for code, iid in self._codes.items() if iid != item_id}
+
+    def clear(self):
+        with self._lock:
+            self._codes = None
@@ -0,0 +1,84 @@
+"""
+Benchmark: the two GET /items/ bodies for 10k items, today's JSON (a list of
+objects) and the columnar MessagePack served for Accept: application/msgpack,
+uncompressed and with each available Content-Encoding.
+
+Serialize is the server's cost (Starlette's json.dumps settings for JSON,
+MsgPackResponse for MessagePack), parse the client's. Encodings whose package
+is missing are skipped; pip install -r requirements-optional.txt for all of them.
+
+    python benchmarks/bench_item_encoding.py [items] [repeat]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_encoding import available_codecs, columnar, msgpack_available  # noqa: E402
+
+CATEGORIES = ["Filament", "Ammunition", "IoT", "Pantry", "Tools", "Batteries"]
+COLORS = ["red", "black", "white", "blue", "green", None]
+
+
+def make_items(count):
+    """Rows shaped like item_to_dict() output"""
+    items = []
+    for index in range(1, count + 1):
+        color = COLORS[index % len(COLORS)]
+        attributes = {"brand": f"Brand {index % 40}", "material": "PLA" if index % 2 else "PETG"}
+        if color:
+            attributes["color"] = color
+        items.append({
+            "id": index,
+            "name": f"Item {index} {CATEGORIES[index % len(CATEGORIES)]}",
+            "category": CATEGORIES[index % len(CATEGORIES)],
+            "quantity": index % 97,
+            "custom_attributes": attributes,
+            "image_url": f"/uploads/item-{index}.jpg" if index % 3 == 0 else None,
+            "qr_code_url": f"/qrcodes/{index}.png",
+            "reorder_threshold": 5 if index % 4 == 0 else None,
+            "low_stock": index % 11 == 0,
+            "expiry_date": f"2027-{index % 12 + 1:02d}-15" if index % 5 == 0 else None,
+            "updated_at": "2026-10-19T12:00:00",
+            "version": 1 + index % 7,
+            "location_id": index % 30 or None,
+        })
+    return items
+
+
+def dumps(content):
+    # starlette.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def formats(items):
+    yield "json objects (today)", lambda: dumps(items), lambda body: json.loads(body)
+    if msgpack_available():
+        import msgpack
+
+        yield ("msgpack columnar", lambda: msgpack.packb(columnar(items), use_bin_type=True),
+               lambda body: msgpack.unpackb(body))
+
+
+def best(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    items = make_items(count)
+    codecs = available_codecs()
+    print(f"{count} items; encodings: {', '.join(sorted(codecs))}; msgpack: {'yes' if msgpack_available() else 'not installed'}")
+    print(f"{'format':22s} {'bytes':>10s} {'serialize ms':>13s} {'parse ms':>9s}  " +
+          "  ".join(f"{name + ' bytes':>11s} {name + ' ms':>8s}" for name in sorted(codecs)))
+    for name, serialize, parse in formats(items):
+        body = serialize()
+        row = f"{name:22s} {len(body):10d} {best(serialize, repeat):13.1f} {best(lambda: parse(body), repeat):9.1f}  "
+        row += "  ".join(
+            f"{len(codecs[encoding](body)):11d} {best(lambda: codecs[encoding](body), repeat):8.1f}"
+            for encoding in sorted(codecs)
+        )
+        print(row)
@@ -0,0 +1,112 @@
+"""
+Microbenchmark: precompiled extraction engine vs. the original per-call pattern lists.
+
+The legacy path includes turning matches into structured values the way main.py
+used to (Decimal for prices, strptime over a format list for expiry dates), since
+the engine returns structured values too.
+
+    python benchmarks/bench_text_extraction.py [iterations]
+"""
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_extraction import get_extractor  # noqa: E402
+
+SAMPLES = [
+    "Organic milk 1L Price: $3.49 best by 11/02/2025",
+    "PLA filament 1kg 24.99 USD lot 4471",
+    "Batteries AA x24 exp 15 Jan 2027",
+    "Receipt total 12.50 dollars thank you for shopping",
+    "Screws M3 assorted, no price or date visible on the packaging",
+] * 20
+
+
+def legacy_extract_price(text):
+    price_patterns = [
+        r'\$\d+\.?\d*',
+        r'\d+\.?\d*\s*(?:USD|usd|\$)',
+        r'(?:Price|price|PRICE)[\s:]*\$?\d+\.?\d*',
+        r'\d+\.?\d*\s*(?:dollars?|cents?)',
+    ]
+    for pattern in price_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group()
+    return None
+
+
+def legacy_extract_expiry(text):
+    date_patterns = [
+        r'(?:exp|expire[sd]?|expiry|best\s+by|use\s+by)[\s:]*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})',
+        r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})(?:\s*(?:exp|expire[sd]?))?',
+        r'(?:exp|expire[sd]?|expiry)[\s:]*(\d{1,2}\s+\w+\s+\d{2,4})',
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1)
+    return None
+
+
+LEGACY_DATE_FORMATS = (
+    "%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%m-%d-%Y", "%m-%d-%y",
+    "%d %b %Y", "%d %B %Y", "%b %d %Y", "%B %d %Y", "%b %Y", "%B %Y", "%m/%Y",
+)
+
+
+def legacy_structured(text):
+    price = legacy_extract_price(text)
+    if price:
+        try:
+            price = Decimal(re.sub(r"[^\d.]", "", price))
+        except InvalidOperation:
+            price = None
+    expiry = legacy_extract_expiry(text)
+    if expiry:
+        for fmt in LEGACY_DATE_FORMATS:
+            try:
+                expiry = datetime.strptime(expiry, fmt).date()
+                break
+            except ValueError:
+                continue
+    return price, expiry
+
+
+def legacy():
+    for text in SAMPLES:
+        legacy_extract_price(text)
+        legacy_extract_expiry(text)
+
+
+def legacy_with_parsing():
+    for text in SAMPLES:
+        legacy_structured(text)
+
+
+def engine():
+    extractor = get_extractor()
+    for text in SAMPLES:
+        extractor.extract(text)
+
+
+def engine_batch():
+    get_extractor().extract_batch(SAMPLES)
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    calls = iterations * len(SAMPLES)
+    for name, func in [
+        ("legacy match only", legacy),
+        ("legacy structured", legacy_with_parsing),
+        ("precompiled engine", engine),
+        ("engine batch", engine_batch),
+    ]:
+        seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+        print(f"{name:20s} {seconds / calls * 1e6:8.2f} us per text")
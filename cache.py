@@ -0,0 +1,261 @@
+"""
+Cache backends shared by the API endpoints.
+
+Reads for items, categories and AI results go through a small cache interface
+so the backend can be chosen per deployment:
+
+    CACHE_BACKEND       none (default) | memory | sqlite | redis
+    CACHE_TTL           default entry lifetime in seconds (300)
+    CACHE_MAX_ENTRIES   size of the in-process LRU (1024)
+    CACHE_PATH          file used by the sqlite backend (./cache.sqlite3)
+    REDIS_URL           used by the redis backend (redis://localhost:6379/0)
+
+`memory` is only safe with a single worker process. `sqlite` and `redis` are
+shared between workers, so a write in one worker invalidates the others.
+
+Invalidation is namespace based: cached keys embed a namespace version, and
+writers bump that version (a single atomic increment) instead of hunting down
+every key that might be stale. Entries under old versions simply age out.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+
+
+class CacheBackend(ABC):
+    """Base class: subclasses implement the raw key/value and version operations"""
+
+    name = "base"
+
+    def __init__(self, ttl: int = DEFAULT_TTL):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        ...
+
+    @abstractmethod
+    def get_version(self, namespace: str) -> int:
+        ...
+
+    @abstractmethod
+    def bump_version(self, namespace: str) -> int:
+        ...
+
+    def key(self, namespace: str, key: Any) -> str:
+        return f"{namespace}:{self.get_version(namespace)}:{key}"
+
+    def get_or_load(self, namespace: str, key: Any, loader: Callable[[], Any], ttl: Optional[int] = None,
+                    store: bool = True) -> Any:
+        """Return the cached value for namespace/key, calling loader on a miss (and caching it unless store is False)"""
+        full_key = self.key(namespace, key)
+        value = self.get(full_key)
+        if value is None:
+            value = loader()
+            if value is not None and store:
+                self.set(full_key, value, ttl)
+        return value
+
+    def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            self.bump_version(namespace)
+
+
+class NullCache(CacheBackend):
+    """Caching disabled: every read goes to the loader"""
+
+    name = "none"
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        pass
+
+    def delete(self, *keys: str):
+        pass
+
+    def get_version(self, namespace: str) -> int:
+        return 0
+
+    def bump_version(self, namespace: str) -> int:
+        return 0
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU with per-entry TTL; only consistent with a single worker"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, ttl: int = DEFAULT_TTL):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        # Versions live outside the LRU so they are never evicted
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def get_version(self, namespace: str) -> int:
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def bump_version(self, namespace: str) -> int:
+        with self._lock:
+            version = self._versions.get(namespace, 0) + 1
+            self._versions[namespace] = version
+            return version
+
+
+class SQLiteCache(CacheBackend):
+    """Cache stored in a shared SQLite file (WAL mode) so all workers on a host agree"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "cache.sqlite3", ttl: int = DEFAULT_TTL):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_versions (namespace TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + (ttl or self.ttl)),
+        )
+        # Entries under old namespace versions are never read again; purge them now and then
+        self._sets += 1
+        if self._sets % 500 == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, *keys: str):
+        if keys:
+            self._conn().executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+    def get_version(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT version FROM cache_versions WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, namespace: str) -> int:
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO cache_versions (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET version = version + 1",
+            (namespace,),
+        )
+        return self.get_version(namespace)
+
+
+class RedisCache(CacheBackend):
+    """Cache stored in Redis; shared by every worker and host pointing at it"""
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: int = DEFAULT_TTL):
+        super().__init__(ttl)
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self.client.set(key, json.dumps(value), ex=ttl or self.ttl)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+    def get_version(self, namespace: str) -> int:
+        raw = self.client.get(f"__version__:{namespace}")
+        return int(raw) if raw is not None else 0
+
+    def bump_version(self, namespace: str) -> int:
+        return int(self.client.incr(f"__version__:{namespace}"))
+
+
+def create_cache(backend: Optional[str] = None, ttl: Optional[int] = None, max_entries: Optional[int] = None,
+                 path: Optional[str] = None, redis_url: Optional[str] = None) -> CacheBackend:
+    """Build the cache backend selected by CACHE_BACKEND; arguments override the environment"""
+    backend = (backend or os.getenv("CACHE_BACKEND", "none")).lower()
+    ttl = ttl if ttl is not None else int(os.getenv("CACHE_TTL", str(DEFAULT_TTL)))
+
+    if backend == "redis":
+        try:
+            return RedisCache(redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+        except Exception as e:
+            # No redis package or no local instance: fall back to the shared file cache
+            logger.warning("Redis cache unavailable (%s), falling back to sqlite", e)
+            backend = "sqlite"
+    if backend == "sqlite":
+        return SQLiteCache(path or os.getenv("CACHE_PATH", "cache.sqlite3"), ttl=ttl)
+    if backend == "memory":
+        return LRUCache(max_entries or int(os.getenv("CACHE_MAX_ENTRIES", "1024")), ttl=ttl)
+    return NullCache(ttl=ttl)
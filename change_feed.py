@@ -0,0 +1,156 @@
+"""
+Item change feed.
+
+Every item write appends a row to the item_changes log in the same transaction,
+and the row's autoincrementing key is the event's sequence number. Events are
+compact deltas:
+
+    {"seq": 42, "op": "update", "item_id": 7, "changes": {"quantity": 3, ...}, "at": "..."}
+
+`create` carries the full item, `update` only the fields that changed and
+`delete` no fields. Clients catch up with GET /items/changes?since=<seq> and
+follow live events over GET /items/changes/stream (Server-Sent Events, resumes
+from Last-Event-ID) or the /items/changes/ws WebSocket.
+
+    CHANGE_FEED_POLL_INTERVAL   seconds between log reads while anyone is subscribed;
+                                local writes wake the reader immediately, so this only
+                                bounds the delay for other workers' writes
+    CHANGE_FEED_RETENTION_DAYS  log entries older than this are pruned by the expiry
+                                sweep job; clients further behind get 410 and reload
+
+One reader task per process tails the log and fans events out to bounded
+per-subscriber queues. A subscriber that falls a full queue behind is dropped
+and reconnects from its last sequence number instead of holding memory.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+
+
+class _Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class ChangeFeed:
+    """Tails the change log and fans new events out to in-process subscribers"""
+
+    def __init__(self, load_since: Callable[[int, int], List[Event]], load_latest: Callable[[], int],
+                 poll_interval: float = 1.0, batch_size: int = 500, queue_size: int = 1000):
+        self._load_since = load_since
+        self._load_latest = load_latest
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._subscribers: Set[_Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._last_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def notify(self):
+        """Wake the reader after a local commit; safe to call from any thread"""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass
+
+    async def _start(self, subscriber: _Subscriber):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (tests, worker restart): drop state bound to the old one
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._start_lock = asyncio.Lock()
+            self._subscribers = set()
+            self._reader = None
+        async with self._start_lock:
+            self._subscribers.add(subscriber)
+            if self._reader is None or self._reader.done():
+                self._last_seq = await asyncio.to_thread(self._load_latest)
+                self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while self._subscribers:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while True:
+                    events = await asyncio.to_thread(self._load_since, self._last_seq, self.batch_size)
+                    if events:
+                        self._last_seq = events[-1]["seq"]
+                        self._publish(events)
+                    if len(events) < self.batch_size:
+                        break
+            except Exception as e:
+                logger.warning("Change feed read failed: %s", e)
+
+    def _publish(self, events: List[Event]):
+        for subscriber in list(self._subscribers):
+            for event in events:
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+                    break
+
+    async def stream(self, since: Optional[int] = None, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Event]]:
+        """
+        Events after `since` (from now when None): the backlog from the log first,
+        then live events. Yields None every `heartbeat` idle seconds so transports
+        can send keep-alives, and ends if this subscriber is dropped for lagging
+        """
+        subscriber = _Subscriber(self.queue_size)
+        await self._start(subscriber)
+        try:
+            last = self._last_seq if since is None else since
+            # Subscribed before reading the backlog, so nothing falls between the two
+            while True:
+                backlog = await asyncio.to_thread(self._load_since, last, self.batch_size)
+                for event in backlog:
+                    last = event["seq"]
+                    yield event
+                if len(backlog) < self.batch_size:
+                    break
+            while True:
+                if subscriber.dropped and subscriber.queue.empty():
+                    return
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event["seq"] > last:
+                    last = event["seq"]
+                    yield event
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+def format_sse(event: Optional[Event]) -> str:
+    """One Server-Sent Events message; None becomes a keep-alive comment"""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['seq']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def diff_fields(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields of `after` whose value differs from `before`"""
+    return {key: value for key, value in after.items() if before.get(key) != value}
@@ -0,0 +1,141 @@
+"""
+Read-replica routing for read-only endpoints.
+
+    DATABASE_READ_URLS          comma-separated replica URLs (reads use the primary when empty)
+    READ_YOUR_WRITES_SECONDS    after a client writes, its reads stay on the primary this long
+    REPLICA_MAX_LAG_SECONDS     replicas further behind than this are skipped (Postgres)
+    REPLICA_HEALTH_INTERVAL     seconds between health probes of each replica
+
+A client's own writes are remembered two ways: a `stuf_last_write` cookie (works
+across workers) and an in-process map keyed by client address (for clients that
+don't send cookies back). Replicas are probed lazily when picked, at most once per
+interval; a failed probe or a database error during a request takes the replica
+out of rotation until a later probe succeeds, and the failed read is retried on the
+primary. With no healthy replica, reads fall back to the primary.
+"""
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+WRITE_COOKIE = "stuf_last_write"
+
+# 0 when the replica has replayed everything it received, otherwise the age of the last replayed commit
+_PG_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.checked_at = float("-inf")
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaRouter:
+    def __init__(self, engines: List[Engine], read_your_writes: float = 5.0, max_lag: float = 10.0,
+                 health_interval: float = 5.0, clock=time.monotonic, wall_clock=time.time):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.read_your_writes = read_your_writes
+        self.max_lag = max_lag
+        self.health_interval = health_interval
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._turn = itertools.count()
+        self._recent_writers: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    # -- read-your-writes --------------------------------------------------
+
+    def record_write(self, client_key: Optional[str]) -> str:
+        """Remember a write by this client; returns the cookie value to send back"""
+        now = self._wall_clock()
+        if client_key:
+            with self._lock:
+                self._recent_writers[client_key] = now
+                if len(self._recent_writers) > 10_000:
+                    cutoff = now - self.read_your_writes
+                    self._recent_writers = {k: t for k, t in self._recent_writers.items() if t >= cutoff}
+        return f"{now:.3f}"
+
+    def wrote_recently(self, client_key: Optional[str], cookie: Optional[str]) -> bool:
+        cutoff = self._wall_clock() - self.read_your_writes
+        if cookie:
+            try:
+                if float(cookie) >= cutoff:
+                    return True
+            except ValueError:
+                pass
+        return bool(client_key) and self._recent_writers.get(client_key, float("-inf")) >= cutoff
+
+    # -- health and selection ----------------------------------------------
+
+    def _probe(self, replica: Replica):
+        try:
+            with replica.engine.connect() as conn:
+                if replica.engine.dialect.name == "postgresql":
+                    replica.lag = float(conn.execute(_PG_LAG_QUERY).scalar() or 0.0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    replica.lag = 0.0
+            healthy = replica.lag <= self.max_lag
+            replica.last_error = None if healthy else f"replication lag {replica.lag:.1f}s"
+        except Exception as e:
+            healthy = False
+            replica.last_error = str(e)
+        if healthy != replica.healthy:
+            logger.warning("Read replica %s is now %s", replica.engine.url.render_as_string(hide_password=True),
+                           "healthy" if healthy else f"unavailable ({replica.last_error})")
+        replica.healthy = healthy
+        replica.checked_at = self._clock()
+
+    def choose(self) -> Optional[Engine]:
+        """Next healthy replica (round robin), or None to use the primary"""
+        count = len(self.replicas)
+        start = next(self._turn)
+        for offset in range(count):
+            replica = self.replicas[(start + offset) % count]
+            if self._clock() - replica.checked_at >= self.health_interval:
+                self._probe(replica)
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    def route(self, client_key: Optional[str], cookie: Optional[str]) -> Optional[Engine]:
+        if self.wrote_recently(client_key, cookie):
+            return None
+        return self.choose()
+
+    def mark_failed(self, engine: Engine, error: Exception):
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.healthy = False
+                replica.last_error = str(error)
+                replica.checked_at = self._clock()
+                logger.warning("Read replica %s failed, using the primary: %s",
+                               engine.url.render_as_string(hide_password=True), error)
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [replica.to_dict() for replica in self.replicas]
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose()
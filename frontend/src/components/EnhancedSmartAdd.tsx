@@ -35,6 +35,7 @@ interface EnhancedSmartAddResponse {
     quantity: number;
     custom_attributes: Record<string, string | number | boolean>;
     confidence: number;
+    photos?: number[];
     similar_items?: Array<{
       id: number;
       name: string;
@@ -58,6 +59,7 @@ interface EnhancedSmartAddResponse {
   expiry_date?: string;
   barcode_data?: string;
   error_message?: string;
+  failed_photos?: Array<{ photo: number; error: string }>;
 }
 
 interface EnhancedSmartAddProps {
@@ -124,6 +126,8 @@ const EnhancedSmartAdd: React.FC<EnhancedSmartAddProps> = ({
       const response = await axios.post<EnhancedSmartAddResponse>(apiUrl, {
         photos: base64Photos,
         batch_mode: batchMode,
+        // One AI call per photo, so a single bad photo doesn't fail the whole batch
+        parallel: batchMode && base64Photos.length > 1,
         detect_price: detectPrice,
         detect_expiry: detectExpiry
       });
@@ -348,6 +352,11 @@ const EnhancedSmartAdd: React.FC<EnhancedSmartAddProps> = ({
                     <h4 className="font-semibold">
                       Found {analysisResult.batch_results.length} items:
                     </h4>
+                    {analysisResult.failed_photos && (
+                      <p className="text-xs text-muted-foreground">
+                        Could not analyze photo {analysisResult.failed_photos.map(failure => failure.photo + 1).join(', ')}
+                      </p>
+                    )}
                     {analysisResult.batch_results.map((item, index) => (
                       <Card key={index} className="p-3">
                         <div className="flex items-center justify-between mb-2">
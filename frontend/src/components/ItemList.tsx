@@ -43,6 +43,7 @@ import {
   Minus
 } from 'lucide-react';
 import { getApiUrl, getAssetUrl } from '../lib/config';
+import { applyItemChange, subscribeToItemChanges } from '../lib/changeFeed';
 
 type SortOption = 'name-asc' | 'name-desc' | 'quantity-asc' | 'quantity-desc' | 'category-asc' | 'category-desc';
 
@@ -96,8 +97,34 @@ const ItemList: React.FC = () => {
       }
     };
 
-    fetchItems();
+    // Read the feed position before the list so no change falls in between;
+    // after that, writes from this and other devices arrive as change events
+    let unsubscribe = () => {};
+    let cancelled = false;
+    const loadAndFollow = async () => {
+      unsubscribe();
+      try {
+        const { data } = await axios.get(getApiUrl('/items/changes'));
+        await fetchItems();
+        if (!cancelled) {
+          unsubscribe = subscribeToItemChanges(
+            data.last_seq,
+            change => setItems(current => applyItemChange(current, change)),
+            loadAndFollow,
+          );
+        }
+      } catch (error) {
+        console.error('Error starting change feed:', error);
+        await fetchItems();
+      }
+    };
+
+    loadAndFollow();
     fetchCategories();
+    return () => {
+      cancelled = true;
+      unsubscribe();
+    };
   }, []);
 
   // Advanced filtering and sorting logic
@@ -231,8 +258,7 @@ const ItemList: React.FC = () => {
         )
       );
       
-      // Refresh items list
-      await fetchItems();
+      // The change feed applies the updates to the list
       setSelectedItems(new Set());
       setBulkMode(false);
     } catch (error) {
@@ -258,8 +284,7 @@ const ItemList: React.FC = () => {
         )
       );
       
-      // Refresh items list
-      await fetchItems();
+      // The change feed applies the updates to the list
       setSelectedItems(new Set());
       setBulkCategory('');
     } catch (error) {
@@ -301,8 +326,7 @@ const ItemList: React.FC = () => {
         })
       );
       
-      // Refresh items list
-      await fetchItems();
+      // The change feed applies the updates to the list
       setSelectedItems(new Set());
       setBulkQuantityChange('');
     } catch (error) {
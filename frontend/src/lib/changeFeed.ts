@@ -0,0 +1,49 @@
+// Live item updates from the server-side change feed (GET /items/changes/stream)
+import type { Item } from '../types/Item';
+import { getApiUrl } from './config';
+
+export interface ItemChange {
+  seq: number;
+  op: 'create' | 'update' | 'delete';
+  item_id: number;
+  // Full item for creates, only the changed fields for updates, null for deletes
+  changes: Partial<Item> | null;
+  at: string;
+}
+
+/**
+ * Apply one change event to a list of items
+ */
+export const applyItemChange = (items: Item[], change: ItemChange): Item[] => {
+  switch (change.op) {
+    case 'create':
+      return [...items.filter(item => item.id !== change.item_id), change.changes as Item];
+    case 'update':
+      return items.map(item => (item.id === change.item_id ? { ...item, ...change.changes } : item));
+    case 'delete':
+      return items.filter(item => item.id !== change.item_id);
+    default:
+      return items;
+  }
+};
+
+/**
+ * Follow item changes after `since`. EventSource reconnects by itself and resumes
+ * from the last event id; onReset is called when the feed can't resume (the
+ * server pruned past our position), and the caller should reload the list.
+ * Returns a function that closes the stream.
+ */
+export const subscribeToItemChanges = (
+  since: number,
+  onChange: (change: ItemChange) => void,
+  onReset: () => void,
+): (() => void) => {
+  const source = new EventSource(getApiUrl(`/items/changes/stream?since=${since}`));
+  source.onmessage = event => onChange(JSON.parse(event.data) as ItemChange);
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) {
+      onReset();
+    }
+  };
+  return () => source.close();
+};
@@ -6,6 +6,12 @@ interface Item {
   custom_attributes: Record<string, string | number | boolean>;
   image_url?: string;
   qr_code_url?: string;
+  reorder_threshold?: number | null;
+  low_stock?: boolean;
+  expiry_date?: string | null;
+  updated_at?: string | null;
+  version?: number;
+  location_id?: number | null;
 }
 
 export type { Item };
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""
+Perceptual hashes and a near-duplicate index for item photos.
+
+pHash (DCT of a 32x32 grayscale thumbnail) and dHash (horizontal gradient) both
+reduce an image to 64 bits; visually similar photos differ in only a few bits.
+
+HashIndex stores those 64-bit hashes with banded LSH: the hash is split into
+`bands` 8-bit bands and every band value has a bucket. Two hashes within
+Hamming distance < bands must agree exactly on at least one band, so a query
+only verifies the handful of items sharing a bucket instead of every image.
+Larger radii fall back to a vectorized scan over a packed uint64 array.
+
+NumPy and PIL are imported on first use so importing this module stays cheap.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+_POPCOUNT = None
+
+
+def _popcount_table():
+    global _POPCOUNT
+    if _POPCOUNT is None:
+        import numpy as np
+
+        _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return _POPCOUNT
+
+
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """Difference hash: is each pixel brighter than its right neighbour"""
+    import numpy as np
+    from PIL import Image
+
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT_CACHE: Dict[int, Any] = {}
+
+
+def _dct_matrix(n: int):
+    matrix = _DCT_CACHE.get(n)
+    if matrix is None:
+        import numpy as np
+
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+        _DCT_CACHE[n] = matrix
+    return matrix
+
+
+def phash(image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """Perceptual hash: low-frequency DCT coefficients compared to their median"""
+    import numpy as np
+    from PIL import Image
+
+    size = hash_size * highfreq_factor
+    small = image.convert("L").resize((size, size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+    dct = _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+
+class HashIndex:
+    """Banded-LSH index of 64-bit image hashes keyed by item id"""
+
+    def __init__(self, bands: int = 8, version: Callable[[], int] = lambda: 0, ttl: float = 300.0):
+        if 64 % bands:
+            raise ValueError("bands must divide 64")
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self._version = version
+        self.ttl = ttl
+        self._hashes: Dict[Hashable, int] = {}
+        self._buckets: List[Dict[int, Set[Hashable]]] = [{} for _ in range(bands)]
+        self._packed: Optional[Tuple[List[Hashable], Any]] = None
+        self._loaded = False
+        self._loaded_version = 0
+        self._loaded_at = 0.0
+        self._watermark: Any = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _band_values(self, value: int):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, (value >> (band * self.band_bits)) & mask
+
+    def add(self, key: Hashable, value: int):
+        with self._lock:
+            self.remove(key)
+            self._hashes[key] = value
+            for band, band_value in self._band_values(value):
+                self._buckets[band].setdefault(band_value, set()).add(key)
+            self._packed = None
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            value = self._hashes.pop(key, None)
+            if value is None:
+                return
+            for band, band_value in self._band_values(value):
+                bucket = self._buckets[band].get(band_value)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band][band_value]
+            self._packed = None
+
+    def clear(self):
+        with self._lock:
+            self._hashes = {}
+            self._buckets = [{} for _ in range(self.bands)]
+            self._packed = None
+            self._loaded = False
+
+    def _fresh(self, version: int) -> bool:
+        return self._loaded and version == self._loaded_version and time.monotonic() - self._loaded_at < self.ttl
+
+    def ensure_synced(self, loader: Callable[[Any], Tuple[Dict[Hashable, Optional[int]], Any]]):
+        """
+        Sync on first use, after a shared version bump or ttl expiry. loader(since)
+        returns (hashes, watermark): every hash when since is None, otherwise only
+        the keys changed since the previous sync's watermark, None for a key whose
+        image was removed. Deleted keys are not reported; callers remove() them
+        when a query turns them up
+        """
+        version = self._version()
+        if self._fresh(version):
+            return
+        with self._lock:
+            if self._fresh(version):
+                return
+            since = self._watermark if self._loaded else None
+            entries, watermark = loader(since)
+            if since is None:
+                self.clear()
+            for key, value in entries.items():
+                if value is None:
+                    self.remove(key)
+                else:
+                    self.add(key, value)
+            self._loaded = True
+            self._watermark = watermark
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+
+    def query(self, value: int, max_distance: int) -> List[Tuple[Hashable, int]]:
+        """Keys within max_distance bits of value, nearest first"""
+        with self._lock:
+            if max_distance < self.bands:
+                candidates: Set[Hashable] = set()
+                for band, band_value in self._band_values(value):
+                    candidates |= self._buckets[band].get(band_value, set())
+                matches = [(key, hamming(value, self._hashes[key])) for key in candidates]
+            else:
+                matches = self._scan(value)
+        return sorted(
+            [(key, distance) for key, distance in matches if distance <= max_distance],
+            key=lambda match: (match[1], str(match[0])),
+        )
+
+    def _scan(self, value: int) -> List[Tuple[Hashable, int]]:
+        import numpy as np
+
+        if self._packed is None:
+            keys = list(self._hashes)
+            self._packed = (keys, np.array([self._hashes[k] for k in keys], dtype=np.uint64))
+        keys, packed = self._packed
+        if not keys:
+            return []
+        xor = np.bitwise_xor(packed, np.uint64(value))
+        distances = _popcount_table()[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        return list(zip(keys, distances.tolist()))
@@ -1,69 +1,267 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, File, UploadFile, Form, Request
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, File, UploadFile, Form, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from sqlalchemy import create_engine, Column, Integer, String, JSON
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, Mapped, mapped_column
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal, Tuple
+from sqlalchemy import (
+    create_engine, Column, Integer, String, JSON, Boolean, Date, DateTime, Index, text, case, false, func, literal,
+    inspect, literal_column, select, true, update,
+)
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import aliased, declarative_base, sessionmaker, Session, Mapped, mapped_column
+from sqlalchemy.orm.exc import StaleDataError
 import os
-import shutil
-import qrcode
-from qrcode.constants import ERROR_CORRECT_L
-import google.generativeai as genai
 import json
 import base64
-from PIL import Image
 import io
 from dotenv import load_dotenv
 import re
-from datetime import datetime, timedelta
+import hashlib
+from datetime import date, datetime, timedelta
+import asyncio
+import itertools
+import logging
+import threading
+import time
+import uuid
+from ai_providers import AIProviderTimeout, get_ai_provider, provider_metrics
+from cache import CacheBackend, NullCache, create_cache
+from alerts import create_alert_sinks, dispatch_alert
+from text_extraction import get_extractor, normalize_locale
+from barcodes import decode_images, DecodedCode, CodeIndex, ITEM_URL_PATTERN
+from image_index import HashIndex, phash, hash_to_hex, hex_to_hash
+from semantic_index import EmbeddingIndex, create_embedder, item_text
+from settings import Settings
+from db_routing import ReplicaRouter, WRITE_COOKIE
+from change_feed import ChangeFeed, diff_fields, format_sse
+from media_storage import CHUNK_SIZE, LocalStorage, MediaStorage, create_media_storage
+from rate_limit import AdmissionGate, AdmissionMiddleware, create_rate_limiter
+from response_encoding import CompressionMiddleware, MsgPackResponse, columnar, msgpack_available, wants_msgpack
 
 load_dotenv()
 
-app = FastAPI(title="Stuf - Smart Inventory Management", description="API for managing household items like 3D printer filament, ammunition, IoT supplies, etc.")
+logger = logging.getLogger(__name__)
 
-# Environment-based CORS configuration for better security
-DEBUG_MODE = os.getenv("DEBUG", "true").lower() == "true"
-ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",") if not DEBUG_MODE else ["*"]
+# Every endpoint is registered on this router; create_app() mounts it on a configured app
+router = APIRouter()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,  # Environment-configurable origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Process-wide resources, bound to a Settings by configure() (called from create_app)
+settings: Optional[Settings] = None
+engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# Optional read replicas (DATABASE_READ_URLS); None sends every read to the primary
+read_router: Optional[ReplicaRouter] = None
+
+class FailoverSession(Session):
+    """
+    Session on a read replica. A database error takes the replica out of rotation and
+    the statement is retried on the primary, which serves the rest of the request, so
+    a replica failing mid-request costs the client nothing
+    """
+    def _failover(self, run, statement, *args, **kwargs):
+        try:
+            return run(statement, *args, **kwargs)
+        except DBAPIError as e:
+            if not self.info.get("replica"):
+                raise
+            read_router.mark_failed(self.get_bind(), e)
+            self.rollback()
+            self.bind = engine
+            self.info["replica"] = False
+            return run(statement, *args, **kwargs)
 
-# Serve static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.mount("/qrcodes", StaticFiles(directory="qrcodes"), name="qrcodes")
+    def execute(self, statement, *args, **kwargs):
+        return self._failover(super().execute, statement, *args, **kwargs)
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+    def scalar(self, statement, *args, **kwargs):
+        return self._failover(super().scalar, statement, *args, **kwargs)
 
-if not SQLALCHEMY_DATABASE_URL:
-    raise RuntimeError("DATABASE_URL environment variable is not set.")
+    def scalars(self, statement, *args, **kwargs):
+        return self._failover(super().scalars, statement, *args, **kwargs)
 
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-    )
-else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSession = sessionmaker(class_=FailoverSession, autocommit=False, autoflush=False)
 Base = declarative_base()
 
 class Item(Base):  # type: ignore
     __tablename__ = 'items'
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String, index=True)
-    category: Mapped[str] = mapped_column(String, index=True)
+    # Indexed through the (category, name) and (category, id) composites below
+    category: Mapped[str] = mapped_column(String)
     quantity: Mapped[int] = mapped_column(Integer)
     custom_attributes: Mapped[dict] = mapped_column(JSON, default={})
-    image_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # Indexed for the orphaned media collector's "is this upload still used" lookups
+    image_url: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
     qr_code_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # Per-item reorder threshold; falls back to the category threshold when unset
+    reorder_threshold: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Maintained on every quantity/threshold write so low-stock lookups never scan
+    low_stock: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false(), nullable=False)
+    # Normalized from the expiry attribute in custom_attributes on every write
+    expiry_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True, index=True)
+    # 64-bit perceptual hash (hex) of the uploaded item image, for near-duplicate lookups
+    image_hash: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    # Storage location (room -> shelf -> bin); subtree queries go through location_closure
+    location_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime, nullable=True, index=True, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    # Bumped by every write (optimistic locking); offline clients send it back to detect conflicts
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default=text("1"))
+
+    # Schema changes go through Alembic migrations (alembic/versions), which also
+    # create the JSON attribute expression indexes that can't be declared portably here
+    __table_args__ = (
+        Index("ix_items_category_name", "category", "name"),
+        Index("ix_items_category_id", "category", "id"),
+        Index(
+            "ix_items_low_stock", "category", "id",
+            sqlite_where=text("low_stock = 1"),
+            postgresql_where=text("low_stock"),
+        ),
+        # Never reuse a deleted item's id (sync tombstones and offline deletes refer to ids)
+        {"sqlite_autoincrement": True},
+    )
+    # The ORM checks the version in every UPDATE/DELETE; record_change() bumps it once per write
+    __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
 
-Base.metadata.create_all(bind=engine)
+class JobState(Base):  # type: ignore
+    """Small key/value store for background job watermarks shared by all workers"""
+    __tablename__ = 'job_state'
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str] = mapped_column(String)
+
+def claim_job_state(db: Session, name: str, expected: Optional[str], value: str) -> bool:
+    """
+    Move a job_state value from `expected` (None: no row yet) to `value` and commit,
+    as one conditional write. False when another worker changed it first, so a
+    window of background work is claimed by exactly one worker
+    """
+    try:
+        if expected is None:
+            db.add(JobState(name=name, value=value))
+            db.commit()
+            return True
+        claimed = db.execute(
+            update(JobState).where(JobState.name == name, JobState.value == expected).values(value=value)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return claimed == 1
+    except IntegrityError:
+        # Another worker inserted the row first
+        db.rollback()
+        return False
+
+class ItemBarcode(Base):  # type: ignore
+    """Local barcode (UPC/EAN/...) -> item index used to skip AI calls on re-stock scans"""
+    __tablename__ = 'item_barcodes'
+    code: Mapped[str] = mapped_column(String, primary_key=True)
+    item_id: Mapped[int] = mapped_column(Integer, index=True)
+
+class CategoryThreshold(Base):  # type: ignore
+    __tablename__ = 'category_thresholds'
+    category: Mapped[str] = mapped_column(String, primary_key=True)
+    reorder_threshold: Mapped[int] = mapped_column(Integer)
+
+class ItemChange(Base):  # type: ignore
+    """Append-only item change log; seq orders the change feed (see change_feed.py)"""
+    __tablename__ = 'item_changes'
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True)
+    item_id: Mapped[int] = mapped_column(Integer)
+    op: Mapped[str] = mapped_column(String(8))
+    changes: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    # Client-generated id of the /sync mutation that made this change, so retried batches apply once
+    mutation_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, unique=True, index=True)
+
+    # AUTOINCREMENT so SQLite never reuses a pruned sequence number
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class StatsRollup(Base):  # type: ignore
+    """
+    Per-category totals (attribute and value '') and per-attribute-value breakdowns
+    for STATS_ROLLUP_ATTRIBUTES, incremented by every item write
+    """
+    __tablename__ = 'stats_rollups'
+    category: Mapped[str] = mapped_column(String, primary_key=True)
+    attribute: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str] = mapped_column(String, primary_key=True)
+    items: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total_quantity: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    low_stock: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+class Location(Base):  # type: ignore
+    """Storage location (room, shelf, bin, ...); location_closure indexes the tree"""
+    __tablename__ = 'locations'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String)
+    parent_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+
+class LocationClosure(Base):  # type: ignore
+    """
+    Every (ancestor, descendant) pair of the location tree, including each location
+    with itself at depth 0: a subtree is the rows for one ancestor (primary key
+    prefix) and a path the rows for one descendant, with no recursion
+    """
+    __tablename__ = 'location_closure'
+    ancestor_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    depth: Mapped[int] = mapped_column(Integer)
+
+    __table_args__ = (Index("ix_location_closure_descendant", "descendant_id", "depth"),)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+# Latest revision in alembic/versions; lets startup skip importing Alembic when the schema is current
+SCHEMA_REVISION = "0007"
+
+def schema_revision(bind=None) -> Optional[str]:
+    bind = bind if bind is not None else engine
+    try:
+        with bind.connect() as conn:
+            return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except DBAPIError:
+        return None
+
+# pg_advisory_xact_lock key that serializes workers migrating on startup (see lock_migrations)
+MIGRATION_LOCK_KEY = 0x4D696772
+
+def lock_migrations(conn) -> None:
+    """
+    Hold the migration lock until this transaction ends, so workers that start together
+    run the DDL one at a time; each re-reads the version under the lock and the later
+    ones find the schema already current. SQLite serializes writers on its own
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+def upgrade_database(bind=None) -> bool:
+    """
+    Apply pending Alembic migrations; returns True when migrations ran. When the
+    schema is current this is a single SELECT and Alembic is never imported
+    """
+    bind = bind if bind is not None else engine
+    if schema_revision(bind) == SCHEMA_REVISION:
+        return False
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    with bind.begin() as conn:
+        lock_migrations(conn)
+        # Another worker may have migrated while this one waited for the lock
+        if inspect(conn).has_table("alembic_version") and conn.execute(
+                text("SELECT version_num FROM alembic_version")).scalar() == SCHEMA_REVISION:
+            return False
+        config.attributes["connection"] = conn
+        command.upgrade(config, "head")
+    return True
+
+def migrate_on_startup():
+    if settings.auto_migrate and upgrade_database():
+        logger.info("Database schema upgraded to the latest migration")
 
 class ItemCreate(BaseModel):
     name: str
@@ -71,6 +269,8 @@ class ItemCreate(BaseModel):
     quantity: int
     custom_attributes: Optional[Dict[str, Any]] = {}
     image_url: Optional[str] = None
+    reorder_threshold: Optional[int] = None
+    location_id: Optional[int] = None
 
 class ItemBase(BaseModel):
     id: int
@@ -80,117 +280,1547 @@ class ItemBase(BaseModel):
     custom_attributes: Optional[Dict[str, Any]] = {}
     image_url: Optional[str] = None
     qr_code_url: Optional[str] = None
+    reorder_threshold: Optional[int] = None
+    low_stock: bool = False
+    expiry_date: Optional[date] = None
+    updated_at: Optional[datetime] = None
+    version: int = 1
+    location_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+# Shared cache for item, category and AI reads (see cache.py for backends)
+# Replaced by the configured backend in configure()
+cache: CacheBackend = NullCache()
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "3600"))
+# Caps simultaneous provider calls in this process (Settings.ai_max_concurrency)
+ai_slots = threading.BoundedSemaphore(4)
+# Uploaded photos and QR codes (see media_storage.py); replaced in configure()
+media: MediaStorage = LocalStorage({"uploads": "uploads", "qrcodes": "qrcodes"})
+MEDIA_PREFIXES = ("uploads", "qrcodes")
+
+def media_key(url: Optional[str]) -> Optional[str]:
+    """Storage key behind a stored media URL ("/uploads/a.jpg" -> "uploads/a.jpg")"""
+    if url and url.startswith(tuple(f"/{prefix}/" for prefix in MEDIA_PREFIXES)):
+        return url[1:]
+    return None
+
+def item_to_dict(item: Item) -> Dict[str, Any]:
+    return ItemBase.model_validate(item).model_dump(mode="json")
+
+def invalidate_item_caches(db_item: Optional[Item] = None, categories: bool = True):
+    """
+    Write-through invalidation after an item write: bump the item (and category)
+    namespaces so every worker stops serving stale lists, then store the fresh row
+    """
+    cache.invalidate("items", *(["categories"] if categories else []))
+    if db_item is not None:
+        cache.set(cache.key("items", f"id:{db_item.id}"), item_to_dict(db_item))
+
+# Change feed (see change_feed.py)
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "1"))
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv("CHANGE_FEED_RETENTION_DAYS", "30"))
+CHANGE_FEED_HEARTBEAT = 15.0
+CHANGE_FEED_PAGE_SIZE = 500
+# pg_advisory_xact_lock key that serializes change log writers (see lock_change_log)
+CHANGE_LOG_LOCK_KEY = 0x53747566
+
+def lock_change_log(db: Session):
+    """
+    Hold the change log until this transaction ends, so seq order is commit order and
+    a reader that saw seq N can never later find a smaller seq commit (catch-up and
+    /sync page with seq > cursor). Postgres allocates seq without waiting for earlier
+    transactions, so writers take an advisory lock before their first change row;
+    SQLite already serializes writers
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_LOG_LOCK_KEY})
+
+def record_change(db: Session, op: str, item: Item, before: Optional[Dict[str, Any]] = None,
+                  mutation_id: Optional[str] = None):
+    """
+    Append an item change to the change log in the caller's transaction and apply it
+    to the stats rollups. Creates carry the full item, updates only the fields that
+    differ from `before`, deletes nothing; an update that changed nothing is not
+    logged. Updates bump item.version once per write. `mutation_id` marks changes
+    made by a /sync mutation. Call change_feed.notify() after the commit
+    """
+    lock_change_log(db)
+    if op == "delete":
+        changes = None
+        update_rollups(db, item_to_dict(item), None)
+    else:
+        if op == "update" and db.is_modified(item):
+            item.version = item.version + 1
+        db.flush()
+        after = item_to_dict(item)
+        changes = after if before is None else diff_fields(before, after)
+        if not changes:
+            return
+        update_rollups(db, before, after)
+    db.add(ItemChange(item_id=item.id, op=op, changes=changes, mutation_id=mutation_id))
+
+def change_to_dict(change: ItemChange) -> Dict[str, Any]:
+    return {
+        "seq": change.seq,
+        "op": change.op,
+        "item_id": change.item_id,
+        "changes": change.changes,
+        "at": change.created_at.isoformat(),
+    }
+
+def load_item_changes(db: Session, since: int, limit: int) -> List[Dict[str, Any]]:
+    changes = db.query(ItemChange).filter(ItemChange.seq > since).order_by(ItemChange.seq).limit(limit)
+    return [change_to_dict(change) for change in changes]
+
+def latest_change_seq(db: Session) -> int:
+    return db.query(func.max(ItemChange.seq)).scalar() or 0
+
+def change_log_floor(db: Session) -> int:
+    """Highest pruned sequence number; catching up from below it would miss changes"""
+    state = db.get(JobState, "item_changes_pruned")
+    return int(state.value) if state is not None else 0
+
+def check_change_cursor(db: Session, since: Optional[int]):
+    if since is not None and since < change_log_floor(db):
+        raise HTTPException(status_code=410, detail="Changes since this sequence number were pruned; reload /items/")
+
+def prune_item_changes(db: Session, retention_days: int = CHANGE_FEED_RETENTION_DAYS,
+                       now: Optional[datetime] = None) -> int:
+    """Drop change log entries older than the retention window; returns rows deleted"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    last = db.query(func.max(ItemChange.seq)).filter(ItemChange.created_at < cutoff).scalar()
+    if last is None:
+        return 0
+    deleted = db.query(ItemChange).filter(ItemChange.seq <= last).delete(synchronize_session=False)
+    state = db.get(JobState, "item_changes_pruned")
+    if state is None:
+        db.add(JobState(name="item_changes_pruned", value=str(last)))
+    else:
+        state.value = str(last)
+    db.commit()
+    return deleted
+
+def _with_session(load):
+    def run(*args):
+        db = SessionLocal()
+        try:
+            return load(db, *args)
+        finally:
+            db.close()
+    return run
+
+change_feed = ChangeFeed(
+    _with_session(load_item_changes), _with_session(latest_change_seq),
+    poll_interval=CHANGE_FEED_POLL_INTERVAL, batch_size=CHANGE_FEED_PAGE_SIZE,
+)
+
+# Stats rollups: per-category totals plus value breakdowns for these attribute keys
+STATS_ROLLUP_ATTRIBUTES = tuple(
+    key.strip() for key in os.getenv("STATS_ROLLUP_ATTRIBUTES", "brand,color,material").split(",") if key.strip()
+)
+STATS_VALUE_MAX_LENGTH = 200
+
+def stat_value(value: Any) -> str:
+    """Attribute value as a grouping key; non-strings use their JSON form (true, 1.75)"""
+    text_value = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+    return text_value[:STATS_VALUE_MAX_LENGTH]
+
+def rollup_keys(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    category = state.get("category") or ""
+    attributes = state.get("custom_attributes") or {}
+    keys = [(category, "", "")]
+    for attribute in STATS_ROLLUP_ATTRIBUTES:
+        value = attributes.get(attribute)
+        if value not in (None, ""):
+            keys.append((category, attribute, stat_value(value)))
+    return keys
+
+def increment_rollup(db: Session, key: Tuple[str, str, str], items: int, quantity: int, low_stock: int):
+    """Atomic += on one rollup row (upsert), so concurrent writers never lose an increment"""
+    category, attribute, value = key
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(StatsRollup).values(
+            category=category, attribute=attribute, value=value,
+            items=items, total_quantity=quantity, low_stock=low_stock,
+        )
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["category", "attribute", "value"],
+            set_={
+                "items": StatsRollup.items + statement.excluded["items"],
+                "total_quantity": StatsRollup.total_quantity + statement.excluded["total_quantity"],
+                "low_stock": StatsRollup.low_stock + statement.excluded["low_stock"],
+            },
+        ))
+        return
+    updated = db.execute(
+        update(StatsRollup)
+        .where(StatsRollup.category == category, StatsRollup.attribute == attribute, StatsRollup.value == value)
+        .values(items=StatsRollup.items + items, total_quantity=StatsRollup.total_quantity + quantity,
+                low_stock=StatsRollup.low_stock + low_stock)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        db.add(StatsRollup(category=category, attribute=attribute, value=value,
+                           items=items, total_quantity=quantity, low_stock=low_stock))
+
+def update_rollups(db: Session, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+    """Move one item's contribution from its `before` state to its `after` state (None = absent)"""
+    deltas: Dict[Tuple[str, str, str], List[int]] = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        contribution = (sign, sign * (state.get("quantity") or 0), sign * int(bool(state.get("low_stock"))))
+        for key in rollup_keys(state):
+            totals = deltas.setdefault(key, [0, 0, 0])
+            for index, amount in enumerate(contribution):
+                totals[index] += amount
+    for key, (items, quantity, low_stock) in deltas.items():
+        if items or quantity or low_stock:
+            increment_rollup(db, key, items, quantity, low_stock)
+
+def rebuild_stats_rollups(db: Session):
+    """
+    Recompute every rollup row from the items: category totals with one GROUP BY,
+    attribute breakdowns by streaming only the items' attribute columns
+    """
+    db.query(StatsRollup).delete(synchronize_session=False)
+    rollups: Dict[Tuple[str, str, str], List[int]] = {}
+    low_stock = func.sum(case((Item.low_stock == True, 1), else_=0))  # noqa: E712
+    categories = (
+        db.query(Item.category, func.count(Item.id), func.coalesce(func.sum(Item.quantity), 0), low_stock)
+        .group_by(Item.category)
+    )
+    for category, items, quantity, low in categories:
+        totals = rollups.setdefault((category or "", "", ""), [0, 0, 0])
+        totals[0] += items
+        totals[1] += quantity
+        totals[2] += low or 0
+    if STATS_ROLLUP_ATTRIBUTES:
+        rows = db.query(Item.category, Item.quantity, Item.low_stock, Item.custom_attributes).yield_per(1000)
+        for category, quantity, low, attributes in rows:
+            state = {"category": category, "quantity": quantity, "low_stock": low, "custom_attributes": attributes}
+            for key in rollup_keys(state)[1:]:
+                totals = rollups.setdefault(key, [0, 0, 0])
+                totals[0] += 1
+                totals[1] += quantity or 0
+                totals[2] += int(bool(low))
+    for (category, attribute, value), (items, quantity, low) in rollups.items():
+        db.add(StatsRollup(category=category, attribute=attribute, value=value,
+                           items=items, total_quantity=quantity, low_stock=low))
+    state = db.get(JobState, "stats_rollups")
+    if state is None:
+        db.add(JobState(name="stats_rollups", value=",".join(STATS_ROLLUP_ATTRIBUTES)))
+    else:
+        state.value = ",".join(STATS_ROLLUP_ATTRIBUTES)
+    db.commit()
+
+# Set once this process has confirmed the rollups match STATS_ROLLUP_ATTRIBUTES
+stats_rollups_checked = False
+
+def ensure_stats_rollups():
+    """Build the rollups on first use, or after STATS_ROLLUP_ATTRIBUTES changed"""
+    global stats_rollups_checked
+    if stats_rollups_checked:
+        return
+    db = SessionLocal()
+    try:
+        state = db.get(JobState, "stats_rollups")
+        if state is None or state.value != ",".join(STATS_ROLLUP_ATTRIBUTES):
+            rebuild_stats_rollups(db)
+    finally:
+        db.close()
+    stats_rollups_checked = True
+
+alert_sinks = create_alert_sinks()
+
+def update_low_stock(db: Session, item: Item) -> Optional[int]:
+    """
+    Recompute item.low_stock from its effective reorder threshold. Returns that
+    threshold when the item just dropped into low stock (caller alerts after
+    commit), None otherwise
+    """
+    threshold = item.reorder_threshold
+    if threshold is None:
+        category_threshold = db.get(CategoryThreshold, item.category)
+        threshold = category_threshold.reorder_threshold if category_threshold else None
+    was_low = bool(item.low_stock)
+    item.low_stock = threshold is not None and item.quantity <= threshold
+    return threshold if item.low_stock and not was_low else None
+
+def send_low_stock_alert(item: Item, threshold: Optional[int] = None):
+    dispatch_alert(
+        alert_sinks, "low_stock",
+        item_id=item.id,
+        name=item.name,
+        category=item.category,
+        quantity=item.quantity,
+        reorder_threshold=threshold if threshold is not None else item.reorder_threshold,
+    )
+
+EXPIRY_ALERT_DAYS = int(os.getenv("EXPIRY_ALERT_DAYS", "30"))
+
+def update_expiry_date(db: Session, item: Item):
+    """
+    Normalize the expiry attribute into the indexed expiry_date column. Items that
+    land inside the window already covered by the expiry sweep are alerted here,
+    since the sweep will not look at that range again.
+    """
+    new_expiry = expiry_from_attributes(item.custom_attributes)
+    if new_expiry == item.expiry_date:
+        return None
+    item.expiry_date = new_expiry
+    if new_expiry is None:
+        return None
+    state = db.get(JobState, "expiry_sweep")
+    if state is not None and date.today() <= new_expiry <= date.fromisoformat(state.value):
+        return new_expiry
+    return None
+
+def send_expiry_alert(item: Item):
+    dispatch_alert(
+        alert_sinks, "expiring_soon",
+        item_id=item.id,
+        name=item.name,
+        category=item.category,
+        quantity=item.quantity,
+        expiry_date=item.expiry_date.isoformat(),
+    )
+
+def sweep_expiring_items(db: Session, window_days: int = EXPIRY_ALERT_DAYS, today: Optional[date] = None) -> int:
+    """
+    Emit expiring_soon alerts for items whose expiry entered the alert window since
+    the last sweep. Only the newly covered date range is read, via the expiry index.
+    The range is claimed by advancing the watermark before anything is read, so
+    when several workers sweep at once only the one that won the range alerts.
+    """
+    today = today or date.today()
+    horizon = today + timedelta(days=window_days)
+    state = db.get(JobState, "expiry_sweep")
+    covered = state.value if state is not None else None
+    if covered is not None and horizon.isoformat() <= covered:
+        return 0
+    if not claim_job_state(db, "expiry_sweep", covered, horizon.isoformat()):
+        return 0
+
+    query = db.query(Item).filter(Item.expiry_date <= horizon)
+    if covered is not None:
+        query = query.filter(Item.expiry_date > max(date.fromisoformat(covered), today - timedelta(days=1)))
+    else:
+        query = query.filter(Item.expiry_date >= today)
+    expiring = query.order_by(Item.expiry_date).all()
+
+    for item in expiring:
+        send_expiry_alert(item)
+    return len(expiring)
+
+async def run_expiry_sweeps():
+    """Expiry alerts and change log pruning, every EXPIRY_SWEEP_INTERVAL seconds"""
+    while True:
+        def sweep():
+            db = SessionLocal()
+            try:
+                sweep_expiring_items(db)
+                prune_item_changes(db)
+            finally:
+                db.close()
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception as e:
+            logger.warning("Expiry sweep failed: %s", e)
+        await asyncio.sleep(settings.expiry_sweep_interval)
+
+# Strong references to running background jobs so they aren't garbage collected
+background_tasks = set()
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def start_expiry_sweeps():
+    if settings.expiry_sweep_interval > 0:
+        start_background_task(run_expiry_sweeps())
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+def client_key(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+async def get_db(request: Request, response: Response):
+    """Primary session; a write request also starts the client's read-your-writes window"""
+    if read_router is not None and request.method not in READ_METHODS:
+        response.set_cookie(
+            WRITE_COOKIE, read_router.record_write(client_key(request)),
+            max_age=max(1, int(read_router.read_your_writes)), httponly=True, samesite="lax",
+        )
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    """
+    Session for read-only endpoints: a healthy replica when configured, unless this
+    client wrote within the read-your-writes window. The primary session is only
+    connected if it is actually used; a replica that fails mid-request hands the
+    remaining reads to the primary (see FailoverSession)
+    """
+    replica_engine = None
+    if read_router is not None:
+        replica_engine = read_router.route(client_key(request), request.cookies.get(WRITE_COOKIE))
+    if replica_engine is None:
+        yield primary
+        return
+    db = ReplicaSession(bind=replica_engine, info={"replica": True})
+    try:
+        yield db
+    finally:
+        db.close()
+
+def cached_read(db: Session, namespace: str, key: Any, loader):
+    """
+    cache.get_or_load for read endpoints. Replica results may predate a write that
+    already bumped the namespace version, so they are served but never stored: a
+    client reading its own writes from the primary must not find them in the cache
+    """
+    return cache.get_or_load(namespace, key, loader, store=not db.info.get("replica"))
+
+def generate_qr_code(item_id: int, host: str = "localhost:5174"):
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_L
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    # The QR code will contain the URL to the item's detail page
+    # Use the provided host (which could be an IP address for mobile access)
+    qr.add_data(f"http://{host}/item/{item_id}")
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer)
+    media.write_bytes(f"qrcodes/{item_id}.png", buffer.getvalue(), "image/png")
+    return f"/qrcodes/{item_id}.png"
+
+def backfill_qr_codes():
+    db = SessionLocal()
+    try:
+        generate_all_qr_codes(db)
+    finally:
+        db.close()
+
+async def run_qr_backfill():
+    try:
+        await asyncio.to_thread(backfill_qr_codes)
+    except Exception as e:
+        logger.warning("QR code backfill failed: %s", e)
+
+def start_qr_backfill():
+    """Render missing QR codes in the background instead of holding up startup"""
+    start_background_task(run_qr_backfill())
+
+def upload_key(filename: Optional[str]) -> str:
+    # Only the last path component, so a crafted filename cannot leave the uploads prefix
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail="No filename provided")
+    return f"uploads/{name}"
+
+@router.post("/upload/")
+async def upload_image(file: UploadFile = File(...)):
+    """Store an item photo, streaming it to the media backend in chunks"""
+    key = upload_key(file.filename)
+
+    async def chunks():
+        while chunk := await file.read(CHUNK_SIZE):
+            yield chunk
+
+    await media.save(key, chunks(), file.content_type)
+    return {"image_url": f"/{key}"}
+
+class PresignRequest(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+
+@router.post("/upload/presign")
+def presign_upload(request: PresignRequest):
+    """
+    A URL the client can PUT the photo to directly, so the bytes skip the API. Save
+    the returned image_url on the item once the upload succeeds
+    """
+    key = upload_key(request.filename)
+    upload = media.upload_url(key, request.content_type)
+    if upload is None:
+        raise HTTPException(status_code=501, detail=f"The {media.name} media backend takes uploads through POST /upload/")
+    return {"image_url": f"/{key}", "upload": upload}
+
+# Orphaned media collection (uploads no item uses, QR codes of deleted items)
+MEDIA_GC_GRACE_HOURS = float(os.getenv("MEDIA_GC_GRACE_HOURS", "24"))
+MEDIA_GC_MODE = os.getenv("MEDIA_GC_MODE", "off").lower()  # off | delete | archive (--worker sweeps only)
+MEDIA_GC_MAX_OBJECTS = int(os.getenv("MEDIA_GC_MAX_OBJECTS", "5000"))
+MEDIA_GC_INTERVAL = int(os.getenv("MEDIA_GC_INTERVAL", "3600"))
+MEDIA_GC_BATCH_SIZE = 500
+# One collector at a time: a run holds the media_gc_lease job_state row, renewed every batch
+MEDIA_GC_LEASE_SECONDS = 600
+
+def referenced_media(db: Session, keys: List[str]) -> set:
+    """The keys of one listing batch that an item still points at, in two indexed lookups"""
+    uploads = [f"/{key}" for key in keys if key.startswith("uploads/")]
+    # QR codes are always /qrcodes/{item id}.png, so the primary key answers for them
+    qr_codes = {}
+    for key in keys:
+        match = re.fullmatch(r"qrcodes/(\d+)\.png", key)
+        if match:
+            qr_codes[int(match.group(1))] = key
+    referenced = set()
+    if uploads:
+        referenced.update(url[1:] for (url,) in db.query(Item.image_url).filter(Item.image_url.in_(uploads)).distinct())
+    if qr_codes:
+        referenced.update(qr_codes[item_id] for (item_id,) in db.query(Item.id).filter(Item.id.in_(list(qr_codes))))
+    return referenced
+
+def media_listing(start_after: Optional[str]):
+    """Every media object in key order, resuming after start_after"""
+    for prefix in sorted(MEDIA_PREFIXES):
+        # "0" sorts right after "/", so a cursor at or past "{prefix}0" is beyond every key of prefix
+        if start_after and start_after >= f"{prefix}0":
+            continue
+        yield from media.list(prefix, start_after if start_after and start_after.startswith(f"{prefix}/") else None)
+
+def claim_media_gc_lease(db: Session, holding: Optional[str] = None) -> Optional[str]:
+    """
+    Take the media GC lease ("{expires} {owner}"), or extend the one passed as
+    holding. None when another run holds an unexpired lease (or took over ours)
+    """
+    current_state = db.get(JobState, "media_gc_lease")
+    current = current_state.value if current_state is not None else None
+    if current and current != holding and float(current.split(" ", 1)[0]) > time.time():
+        return None
+    owner = holding.split(" ", 1)[1] if holding else uuid.uuid4().hex
+    lease = f"{time.time() + MEDIA_GC_LEASE_SECONDS:.0f} {owner}"
+    return lease if claim_job_state(db, "media_gc_lease", current, lease) else None
+
+def collect_orphaned_media(grace_hours: float = MEDIA_GC_GRACE_HOURS, archive: bool = False, dry_run: bool = False,
+                           max_objects: Optional[int] = None, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Delete (or archive) media no item points at. The storage listing is walked in
+    key order, MEDIA_GC_BATCH_SIZE objects at a time, each batch checked in one
+    short read, so the database is never locked for the length of the job.
+    Objects younger than the grace period are kept: uploads not yet saved on an
+    item, QR codes of items still being created. With max_objects a run stops
+    early and the next one resumes from the cursor kept in job_state. Returns
+    None without doing anything while another run holds the lease
+    """
+    cutoff = (now if now is not None else time.time()) - grace_hours * 3600
+    report = {"scanned": 0, "orphaned": 0, "reclaimed_bytes": 0, "recent": 0,
+              "action": "none" if dry_run else "archive" if archive else "delete", "complete": True}
+    lease = None
+    with SessionLocal() as db:
+        if not dry_run:
+            lease = claim_media_gc_lease(db)
+            if lease is None:
+                return None
+        state = db.get(JobState, "media_gc")
+        cursor = state.value if state is not None and state.value else None
+
+    try:
+        listing = media_listing(cursor)
+        while True:
+            batch = list(itertools.islice(listing, MEDIA_GC_BATCH_SIZE))
+            if not batch:
+                cursor = None  # full pass done: the next run starts over
+                break
+            with SessionLocal() as db:
+                if lease is not None:
+                    lease = claim_media_gc_lease(db, lease)
+                    if lease is None:
+                        # Our lease ran out and another run took over; it owns the cursor now
+                        report["complete"] = False
+                        return report
+                referenced = referenced_media(db, [obj.key for obj in batch])
+                for obj in batch:
+                    report["scanned"] += 1
+                    if obj.key in referenced:
+                        continue
+                    if obj.modified > cutoff:
+                        report["recent"] += 1
+                        continue
+                    # Check again right before removing: an item may have taken the upload since the batch query
+                    if not dry_run and referenced_media(db, [obj.key]):
+                        continue
+                    report["orphaned"] += 1
+                    report["reclaimed_bytes"] += obj.size
+                    if not dry_run:
+                        (media.archive if archive else media.delete)(obj.key)
+            cursor = batch[-1].key
+            if max_objects is not None and report["scanned"] >= max_objects:
+                report["complete"] = False
+                break
+        if not dry_run:
+            with SessionLocal() as db:
+                state = db.get(JobState, "media_gc")
+                if state is None:
+                    db.add(JobState(name="media_gc", value=cursor or ""))
+                else:
+                    state.value = cursor or ""
+                db.commit()
+    finally:
+        if lease is not None:
+            with SessionLocal() as db:
+                claim_job_state(db, "media_gc_lease", lease, "")
+    return report
+
+async def run_media_gc_sweeps():
+    """
+    Orphaned media collection in the --worker process, every MEDIA_GC_INTERVAL seconds.
+    Each sweep checks a bounded slice; the next one resumes from the stored cursor
+    """
+    while True:
+        try:
+            report = await asyncio.to_thread(
+                collect_orphaned_media, archive=MEDIA_GC_MODE == "archive", max_objects=MEDIA_GC_MAX_OBJECTS
+            )
+            if report is not None and report["orphaned"]:
+                logger.info("Media GC: %s", report)
+        except Exception as e:
+            logger.warning("Media GC sweep failed: %s", e)
+        await asyncio.sleep(MEDIA_GC_INTERVAL)
+
+@router.post("/media/gc")
+def collect_media(dry_run: bool = False, archive: bool = False, max_objects: Optional[int] = Query(None, ge=1),
+                  grace_hours: float = Query(MEDIA_GC_GRACE_HOURS, ge=0)):
+    """
+    Remove uploads and QR codes no item uses (archive=true moves them aside instead);
+    dry_run reports what would be reclaimed
+    """
+    report = collect_orphaned_media(grace_hours, archive=archive, dry_run=dry_run, max_objects=max_objects)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Media GC is already running")
+    return report
+
+def media_redirect(prefix: str):
+    """GET /{prefix}/{name} for remote backends: send the client to the object itself"""
+    def redirect(name: str):
+        return RedirectResponse(media.download_url(f"{prefix}/{name}"))
+    return redirect
+
+@router.get("/items/", response_model=List[ItemBase])
+def get_items(request: Request, response: Response, category: str = Query(None), after_id: Optional[int] = Query(None),
+              limit: Optional[int] = Query(None, ge=1, le=1000), db: Session = Depends(get_read_db)):
+    """
+    Items in id order, optionally one category. Pass limit and the last id seen as
+    after_id to page through large inventories (keyset paging on (category, id)).
+    Send Accept: application/msgpack for the compact columnar form
+    """
+    def load_items():
+        query = db.query(Item)
+        if category:
+            query = query.filter(Item.category == category)
+        if after_id is not None:
+            query = query.filter(Item.id > after_id)
+        query = query.order_by(Item.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [item_to_dict(item) for item in query]
+    items = cached_read(db, "items", f"list:{category or ''}:{after_id}:{limit}", load_items)
+    if wants_msgpack(request.headers.get("accept")) and msgpack_available():
+        return MsgPackResponse(columnar(items), headers={"Vary": "Accept"})
+    response.headers["Vary"] = "Accept"
+    return items
+
+def parse_within(within: str) -> timedelta:
+    """Parse a window like '30d', '2w' or '45' (days)"""
+    match = re.fullmatch(r'\s*(\d+)\s*([dw]?)\s*', within.lower())
+    if not match:
+        raise HTTPException(status_code=422, detail="within must look like '30d' or '2w'")
+    amount = int(match.group(1))
+    return timedelta(weeks=amount) if match.group(2) == 'w' else timedelta(days=amount)
+
+@router.get("/items/expiring", response_model=List[ItemBase])
+def get_expiring_items(within: str = Query("30d"), include_expired: bool = Query(False), db: Session = Depends(get_read_db)):
+    """
+    Items expiring within the given window, as an index range scan on expiry_date
+    """
+    today = date.today()
+    query = db.query(Item).filter(Item.expiry_date <= today + parse_within(within))
+    if not include_expired:
+        query = query.filter(Item.expiry_date >= today)
+    else:
+        query = query.filter(Item.expiry_date.isnot(None))
+    return query.order_by(Item.expiry_date, Item.id).all()
+
+class SemanticSearchResult(ItemBase):
+    score: float
+
+@router.get("/items/semantic-search", response_model=List[SemanticSearchResult])
+def semantic_item_search(q: str = Query(..., min_length=1), k: int = Query(10, ge=1, le=100),
+                         category: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """
+    Items ranked by embedding similarity to q (name, category and attribute values)
+    """
+    hits = semantic_search(db, [q], k, category=category)[0]
+    return [{**ItemBase.model_validate(item).model_dump(), "score": score} for item, score in hits]
+
+class ItemChangeEvent(BaseModel):
+    seq: int
+    op: str
+    item_id: int
+    changes: Optional[Dict[str, Any]] = None
+    at: datetime
+
+class ItemChangesPage(BaseModel):
+    changes: List[ItemChangeEvent]
+    last_seq: int
+    has_more: bool
+
+@router.get("/items/changes", response_model=ItemChangesPage)
+def get_item_changes(since: Optional[int] = Query(None, ge=0),
+                     limit: int = Query(CHANGE_FEED_PAGE_SIZE, ge=1, le=CHANGE_FEED_PAGE_SIZE),
+                     db: Session = Depends(get_read_db)):
+    """
+    Item changes after sequence number `since`, oldest first, for catching up after
+    a reconnect. Without `since` only the current sequence number is returned: read
+    it before loading /items/, then follow the feed from there
+    """
+    if since is None:
+        return {"changes": [], "last_seq": latest_change_seq(db), "has_more": False}
+    check_change_cursor(db, since)
+    changes = load_item_changes(db, since, limit)
+    return {
+        "changes": changes,
+        "last_seq": changes[-1]["seq"] if changes else since,
+        "has_more": len(changes) == limit,
+    }
+
+def _check_change_cursor(since: Optional[int]):
+    db = SessionLocal()
+    try:
+        check_change_cursor(db, since)
+    finally:
+        db.close()
+
+@router.get("/items/changes/stream")
+async def stream_item_changes(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """
+    Server-Sent Events feed of item changes after `since` (or from now). Each event's
+    id is its sequence number, so a reconnecting EventSource resumes via Last-Event-ID
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    await asyncio.to_thread(_check_change_cursor, since)
+
+    async def events():
+        yield "retry: 3000\n\n"
+        async for event in change_feed.stream(since, heartbeat=CHANGE_FEED_HEARTBEAT):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/items/changes/ws")
+async def item_changes_websocket(websocket: WebSocket, since: Optional[int] = Query(None, ge=0)):
+    """Item changes after `since` (or from now) as JSON messages, one per change"""
+    await websocket.accept()
+    try:
+        await asyncio.to_thread(_check_change_cursor, since)
+    except HTTPException as e:
+        await websocket.close(code=4410, reason=e.detail)
+        return
+
+    async def forward():
+        async for event in change_feed.stream(since):
+            await websocket.send_json(event)
+        # Dropped for falling behind: the client reconnects from its last seq
+        await websocket.close(code=4000)
+
+    forwarder = asyncio.create_task(forward())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        forwarder.cancel()
+
+def save_new_item(db: Session, item: ItemCreate, mutation_id: Optional[str] = None) -> Item:
+    """Insert an item with its QR code, change log entry and index updates"""
+    db_item = Item(**item.dict())
+    db_item.image_hash = compute_image_hash(db_item.image_url)
+    low_threshold = update_low_stock(db, db_item)
+    expiry_alert = update_expiry_date(db, db_item)
+    db.add(db_item)
+    db.flush()  # assigns the id
+    barcodes_changed = sync_item_barcodes(db, db_item)
+
+    # Generate QR code
+    db_item.qr_code_url = generate_qr_code(db_item.id)
+    record_change(db, "create", db_item, mutation_id=mutation_id)
+    db.commit()
+    db.refresh(db_item)
+    change_feed.notify()
+    if barcodes_changed:
+        cache.invalidate("barcodes")
+    if db_item.image_hash:
+        update_image_index(db_item.id, db_item.image_hash)
+    update_semantic_index(db_item.id, db_item)
+
+    invalidate_item_caches(db_item)
+    if low_threshold is not None:
+        send_low_stock_alert(db_item, low_threshold)
+    if expiry_alert:
+        send_expiry_alert(db_item)
+    return db_item
+
+@router.post("/items/", response_model=ItemBase)
+def create_item(item: ItemCreate, db: Session = Depends(get_db)):
+    check_item_location(db, item)
+    return save_new_item(db, item)
+
+@router.get("/items/{item_id}", response_model=ItemBase)
+def read_item(item_id: int, db: Session = Depends(get_read_db)):
+    def load_item():
+        item = db.query(Item).filter(Item.id == item_id).first()
+        return item_to_dict(item) if item is not None else None
+    item = cached_read(db, "items", f"id:{item_id}", load_item)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item
+
+def save_item_update(db: Session, item: Item, updated_item: ItemCreate, mutation_id: Optional[str] = None) -> Item:
+    before = item_to_dict(item)
+    item.name = updated_item.name
+    item.category = updated_item.category
+    item.quantity = updated_item.quantity
+    item.custom_attributes = updated_item.custom_attributes
+    image_changed = item.image_url != updated_item.image_url
+    item.image_url = updated_item.image_url
+    if image_changed:
+        item.image_hash = compute_image_hash(item.image_url)
+    if "reorder_threshold" in updated_item.model_fields_set:
+        item.reorder_threshold = updated_item.reorder_threshold
+    if "location_id" in updated_item.model_fields_set:
+        item.location_id = updated_item.location_id
+    low_threshold = update_low_stock(db, item)
+    expiry_alert = update_expiry_date(db, item)
+    barcodes_changed = sync_item_barcodes(db, item, before["custom_attributes"])
+    record_change(db, "update", item, before, mutation_id=mutation_id)
+    db.commit()
+    db.refresh(item)
+    change_feed.notify()
+    invalidate_item_caches(item)
+    if barcodes_changed:
+        cache.invalidate("barcodes")
+    if image_changed:
+        update_image_index(item.id, item.image_hash)
+    update_semantic_index(item.id, item)
+    if low_threshold is not None:
+        send_low_stock_alert(item, low_threshold)
+    if expiry_alert:
+        send_expiry_alert(item)
+    return item
+
+@router.put("/items/{item_id}", response_model=ItemBase)
+def update_item(item_id: int, updated_item: ItemCreate, db: Session = Depends(get_db)):
+    item = db.query(Item).filter(Item.id == item_id).first()
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    check_item_location(db, updated_item)
+    return save_item_update(db, item, updated_item)
+
+def delete_item_row(db: Session, item: Item, mutation_id: Optional[str] = None):
+    item_id = item.id
+    record_change(db, "delete", item, mutation_id=mutation_id)
+    db.delete(item)
+    db.query(ItemBarcode).filter(ItemBarcode.item_id == item_id).delete(synchronize_session=False)
+    db.commit()
+    change_feed.notify()
+    invalidate_item_caches()
+    scan_codes.discard_item(item_id)
+    cache.invalidate("barcodes")
+    update_image_index(item_id, None)
+    update_semantic_index(item_id)
+
+@router.delete("/items/{item_id}")
+def delete_item(item_id: int, db: Session = Depends(get_db)):
+    item = db.query(Item).filter(Item.id == item_id).first()
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    delete_item_row(db, item)
+    return {"detail": "Item deleted successfully"}
+
+@router.get("/categories/", response_model=List[str])
+def get_categories(db: Session = Depends(get_read_db)):
+    def load_categories():
+        categories = db.query(Item.category).distinct().all()
+        return [cat[0] for cat in categories]
+    return cached_read(db, "categories", "all", load_categories)
+
+class StatsTotals(BaseModel):
+    items: int
+    total_quantity: int
+    low_stock: int
+
+class StatsSummary(StatsTotals):
+    categories: int
+
+class CategoryStats(StatsTotals):
+    category: str
+
+class AttributeValueStats(StatsTotals):
+    value: str
+
+class AttributeStats(BaseModel):
+    attribute: str
+    category: Optional[str] = None
+    # "rollup" for STATS_ROLLUP_ATTRIBUTES, "query" for a GROUP BY over the JSON attribute
+    source: str
+    values: List[AttributeValueStats]
+
+ATTRIBUTE_KEY_PATTERN = re.compile(r"^\w{1,64}$")
+
+def attribute_expression(db: Session, key: str):
+    """custom_attributes[key] as SQL, spelled like the expression indexes from migration 0002"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return literal_column(f"json_extract(custom_attributes, '$.{key}')")
+    if dialect == "postgresql":
+        return literal_column(f"(custom_attributes ->> '{key}')")
+    return Item.custom_attributes[key].as_string()
+
+def stats_totals(query) -> Dict[str, int]:
+    items, quantity, low_stock = query.one()
+    return {"items": items or 0, "total_quantity": quantity or 0, "low_stock": low_stock or 0}
+
+@router.get("/stats/summary", response_model=StatsSummary)
+def get_stats_summary(db: Session = Depends(get_read_db)):
+    """
+    Inventory totals, read from the per-category rollups (one row per category)
+    """
+    ensure_stats_rollups()
+    rows = db.query(StatsRollup).filter(StatsRollup.attribute == "", StatsRollup.items > 0)
+    totals = stats_totals(rows.with_entities(
+        func.sum(StatsRollup.items), func.sum(StatsRollup.total_quantity), func.sum(StatsRollup.low_stock)
+    ))
+    return {**totals, "categories": rows.count()}
+
+@router.get("/stats/categories", response_model=List[CategoryStats])
+def get_category_stats(db: Session = Depends(get_read_db)):
+    """
+    Item count, total quantity and low-stock count per category
+    """
+    ensure_stats_rollups()
+    rows = (
+        db.query(StatsRollup)
+        .filter(StatsRollup.attribute == "", StatsRollup.items > 0)
+        .order_by(StatsRollup.category)
+    )
+    return [
+        {"category": row.category, "items": row.items, "total_quantity": row.total_quantity, "low_stock": row.low_stock}
+        for row in rows
+    ]
+
+@router.get("/stats/attributes/{attribute}", response_model=AttributeStats)
+def get_attribute_stats(attribute: str, category: Optional[str] = Query(None),
+                        limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_read_db)):
+    """
+    Breakdown of items by the value of one custom attribute (e.g. filament by material),
+    optionally within a category, largest groups first. Attributes in
+    STATS_ROLLUP_ATTRIBUTES come from the rollups; any other key is grouped in the
+    database and cached until the next item write
+    """
+    if attribute in STATS_ROLLUP_ATTRIBUTES:
+        ensure_stats_rollups()
+        items = func.sum(StatsRollup.items)
+        query = db.query(
+            StatsRollup.value, items, func.sum(StatsRollup.total_quantity), func.sum(StatsRollup.low_stock)
+        ).filter(StatsRollup.attribute == attribute)
+        if category is not None:
+            query = query.filter(StatsRollup.category == category)
+        rows = query.group_by(StatsRollup.value).having(items > 0).order_by(items.desc(), StatsRollup.value).limit(limit)
+        values = [
+            {"value": value, "items": count, "total_quantity": quantity, "low_stock": low}
+            for value, count, quantity, low in rows
+        ]
+        return {"attribute": attribute, "category": category, "source": "rollup", "values": values}
+
+    if not ATTRIBUTE_KEY_PATTERN.match(attribute):
+        raise HTTPException(status_code=422, detail="Attribute keys may only contain letters, digits and underscores")
+
+    def load_breakdown():
+        value = attribute_expression(db, attribute)
+        items = func.count(Item.id)
+        query = db.query(
+            value, items, func.coalesce(func.sum(Item.quantity), 0),
+            func.sum(case((Item.low_stock == True, 1), else_=0)),  # noqa: E712
+        ).filter(value.isnot(None))
+        if category is not None:
+            query = query.filter(Item.category == category)
+        rows = query.group_by(value).order_by(items.desc(), value).limit(limit)
+        return [
+            {"value": stat_value(raw), "items": count, "total_quantity": quantity, "low_stock": low or 0}
+            for raw, count, quantity, low in rows
+        ]
+    # Item writes bump the "items" namespace, so cached breakdowns never outlive a change
+    values = cached_read(db, "items", f"stats:{attribute}:{category}:{limit}", load_breakdown)
+    return {"attribute": attribute, "category": category, "source": "query", "values": values}
+
+@router.post("/stats/rebuild", response_model=StatsSummary)
+def rebuild_stats(db: Session = Depends(get_db)):
+    """
+    Recompute the rollups from the items (after bulk imports or manual database edits)
+    """
+    rebuild_stats_rollups(db)
+    return get_stats_summary(db)
+
+class LocationCreate(BaseModel):
+    name: str
+    parent_id: Optional[int] = None
+
+class LocationUpdate(BaseModel):
+    name: Optional[str] = None
+    # Sending parent_id (null for the top level) moves the location with its whole subtree
+    parent_id: Optional[int] = None
+
+class LocationBase(BaseModel):
+    id: int
+    name: str
+    parent_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class LocationDetail(LocationBase):
+    path: List[LocationBase]
+    children: List[LocationBase]
+
+class LocationCount(LocationBase):
+    items: int
+    total_quantity: int
+
+class LocationStats(BaseModel):
+    location: LocationCount
+    children: List[LocationCount]
+
+def unknown_location(db: Session, item: ItemCreate) -> bool:
+    return item.location_id is not None and db.get(Location, item.location_id) is None
+
+def check_item_location(db: Session, item: ItemCreate):
+    if unknown_location(db, item):
+        raise HTTPException(status_code=422, detail=f"Location {item.location_id} not found")
+
+def get_location_or_404(db: Session, location_id: int) -> Location:
+    location = db.get(Location, location_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return location
+
+def location_path(db: Session, location_id: int) -> List[Location]:
+    """The location's ancestors from the top level down, itself last: one lookup per level"""
+    return (
+        db.query(Location)
+        .join(LocationClosure, LocationClosure.ancestor_id == Location.id)
+        .filter(LocationClosure.descendant_id == location_id)
+        .order_by(LocationClosure.depth.desc())
+        .all()
+    )
+
+def subtree_ids(location_id: int):
+    """Subquery of the ids of a location and everything below it"""
+    return select(LocationClosure.descendant_id).where(LocationClosure.ancestor_id == location_id)
+
+def link_location(db: Session, location_id: int, parent_id: Optional[int]):
+    """Closure rows for a new leaf: itself at depth 0, then every ancestor of the parent one level further"""
+    db.add(LocationClosure(ancestor_id=location_id, descendant_id=location_id, depth=0))
+    if parent_id is not None:
+        ancestors = select(
+            LocationClosure.ancestor_id, literal(location_id), LocationClosure.depth + 1
+        ).where(LocationClosure.descendant_id == parent_id)
+        db.execute(LocationClosure.__table__.insert().from_select(["ancestor_id", "descendant_id", "depth"], ancestors))
+
+def move_location_subtree(db: Session, location: Location, parent_id: Optional[int]):
+    """
+    Re-parent a location with everything below it in two statements: drop the links
+    from the old ancestors into the subtree, then link every new ancestor to every
+    subtree node. Links inside the subtree are untouched
+    """
+    if parent_id is not None:
+        if db.get(LocationClosure, (location.id, parent_id)) is not None:
+            raise HTTPException(status_code=409, detail="Cannot move a location into its own subtree")
+    db.flush()
+    db.query(LocationClosure).filter(
+        LocationClosure.descendant_id.in_(subtree_ids(location.id)),
+        LocationClosure.ancestor_id.notin_(subtree_ids(location.id)),
+    ).delete(synchronize_session=False)
+    if parent_id is not None:
+        above = aliased(LocationClosure)
+        below = aliased(LocationClosure)
+        # Every new ancestor times every subtree node
+        links = (
+            select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+            .select_from(above)
+            .join(below, true())
+            .where(above.descendant_id == parent_id, below.ancestor_id == location.id)
+        )
+        db.execute(LocationClosure.__table__.insert().from_select(["ancestor_id", "descendant_id", "depth"], links))
+    location.parent_id = parent_id
+
+def location_detail(db: Session, location: Location) -> Dict[str, Any]:
+    children = db.query(Location).filter(Location.parent_id == location.id).order_by(Location.name).all()
+    return {
+        "id": location.id, "name": location.name, "parent_id": location.parent_id,
+        "path": location_path(db, location.id), "children": children,
+    }
+
+@router.post("/locations", response_model=LocationDetail)
+def create_location(location: LocationCreate, db: Session = Depends(get_db)):
+    if location.parent_id is not None:
+        get_location_or_404(db, location.parent_id)
+    db_location = Location(name=location.name, parent_id=location.parent_id)
+    db.add(db_location)
+    db.flush()  # assigns the id
+    link_location(db, db_location.id, location.parent_id)
+    db.commit()
+    return location_detail(db, db_location)
+
+@router.get("/locations", response_model=List[LocationBase])
+def list_locations(db: Session = Depends(get_read_db)):
+    """Every location, flat; clients build the tree from parent_id"""
+    return db.query(Location).order_by(Location.parent_id, Location.name).all()
+
+@router.get("/locations/{location_id}", response_model=LocationDetail)
+def read_location(location_id: int, db: Session = Depends(get_read_db)):
+    return location_detail(db, get_location_or_404(db, location_id))
+
+@router.put("/locations/{location_id}", response_model=LocationDetail)
+def update_location(location_id: int, update: LocationUpdate, db: Session = Depends(get_db)):
+    """Rename a location, or move it with its whole subtree by sending parent_id"""
+    location = get_location_or_404(db, location_id)
+    if update.name is not None:
+        location.name = update.name
+    if "parent_id" in update.model_fields_set and update.parent_id != location.parent_id:
+        if update.parent_id is not None:
+            get_location_or_404(db, update.parent_id)
+        move_location_subtree(db, location, update.parent_id)
+    db.commit()
+    return location_detail(db, location)
+
+@router.delete("/locations/{location_id}")
+def delete_location(location_id: int, db: Session = Depends(get_db)):
+    """Delete an empty location; move or delete its children and items first"""
+    location = get_location_or_404(db, location_id)
+    if db.query(Location.id).filter(Location.parent_id == location_id).first() is not None:
+        raise HTTPException(status_code=409, detail="Location has child locations")
+    if db.query(Item.id).filter(Item.location_id == location_id).first() is not None:
+        raise HTTPException(status_code=409, detail="Location still holds items")
+    db.query(LocationClosure).filter(LocationClosure.descendant_id == location_id).delete(synchronize_session=False)
+    db.delete(location)
+    db.commit()
+    return {"detail": "Location deleted successfully"}
+
+@router.get("/locations/{location_id}/items", response_model=List[ItemBase])
+def read_location_items(location_id: int, recursive: bool = True, category: Optional[str] = None,
+                        after_id: int = 0, limit: int = Query(100, ge=1, le=1000),
+                        db: Session = Depends(get_read_db)):
+    """
+    Items stored at a location, and with recursive (the default) everything below
+    it, in one indexed query. Page with after_id like GET /items/
+    """
+    get_location_or_404(db, location_id)
+    query = db.query(Item)
+    if recursive:
+        query = query.join(LocationClosure, LocationClosure.descendant_id == Item.location_id).filter(
+            LocationClosure.ancestor_id == location_id
+        )
+    else:
+        query = query.filter(Item.location_id == location_id)
+    if category is not None:
+        query = query.filter(Item.category == category)
+    return query.filter(Item.id > after_id).order_by(Item.id).limit(limit).all()
+
+@router.get("/locations/{location_id}/stats", response_model=LocationStats)
+def read_location_stats(location_id: int, db: Session = Depends(get_read_db)):
+    """Item counts and total quantity for a location's subtree and each child's subtree"""
+    location = get_location_or_404(db, location_id)
+    children = db.query(Location).filter(Location.parent_id == location_id).order_by(Location.name).all()
+    # One grouped query: each item counts towards every listed location above it
+    rows = (
+        db.query(LocationClosure.ancestor_id, func.count(Item.id), func.coalesce(func.sum(Item.quantity), 0))
+        .join(Item, Item.location_id == LocationClosure.descendant_id)
+        .filter(LocationClosure.ancestor_id.in_([location_id] + [child.id for child in children]))
+        .group_by(LocationClosure.ancestor_id)
+        .all()
+    )
+    counts = {ancestor_id: (count, quantity) for ancestor_id, count, quantity in rows}
+
+    def with_counts(node: Location) -> Dict[str, Any]:
+        count, quantity = counts.get(node.id, (0, 0))
+        return {"id": node.id, "name": node.name, "parent_id": node.parent_id, "items": count, "total_quantity": quantity}
+
+    return {"location": with_counts(location), "children": [with_counts(child) for child in children]}
+
+class ReorderThresholdUpdate(BaseModel):
+    reorder_threshold: Optional[int] = None
+
+@router.put("/categories/{category}/reorder-threshold")
+def set_category_reorder_threshold(category: str, update: ReorderThresholdUpdate, db: Session = Depends(get_db)):
+    """
+    Set (or clear, with null) the reorder threshold for every item in a category
+    that has no threshold of its own
+    """
+    threshold = update.reorder_threshold
+    existing = db.get(CategoryThreshold, category)
+    if threshold is None:
+        if existing is not None:
+            db.delete(existing)
+    elif existing is None:
+        db.add(CategoryThreshold(category=category, reorder_threshold=threshold))
+    else:
+        existing.reorder_threshold = threshold
+
+    inherits_threshold = db.query(Item).filter(Item.category == category, Item.reorder_threshold.is_(None))
+    newly_low = []
+    if threshold is not None:
+        newly_low = inherits_threshold.filter(Item.low_stock == False, Item.quantity <= threshold).all()  # noqa: E712
+    low_expr = (Item.quantity <= threshold) if threshold is not None else false()
+    flipping = inherits_threshold.filter(Item.low_stock != low_expr)
+    flipped = flipping.with_entities(Item.id, Item.low_stock, Item.version, Item.quantity, Item.custom_attributes).all()
+    if flipped:
+        lock_change_log(db)
+    flipping.update({Item.low_stock: low_expr, Item.version: Item.version + 1}, synchronize_session=False)
+    for item_id, was_low, version, quantity, attributes in flipped:
+        before = {"category": category, "quantity": quantity, "low_stock": was_low, "custom_attributes": attributes}
+        update_rollups(db, before, {**before, "low_stock": not was_low})
+        db.add(ItemChange(item_id=item_id, op="update", changes={"low_stock": not was_low, "version": version + 1}))
+    db.commit()
+
+    if flipped:
+        change_feed.notify()
+    invalidate_item_caches(categories=False)
+    for item in newly_low:
+        db.refresh(item)
+        send_low_stock_alert(item, threshold)
+    return {"category": category, "reorder_threshold": threshold}
+
+@router.post("/alerts/expiry-sweep")
+def trigger_expiry_sweep(db: Session = Depends(get_db)):
+    """
+    Run the expiry sweep now (it also runs every EXPIRY_SWEEP_INTERVAL seconds)
+    """
+    return {"alerts_sent": sweep_expiring_items(db)}
+
+@router.get("/alerts/low-stock", response_model=List[ItemBase])
+def get_low_stock_items(category: str = Query(None), db: Session = Depends(get_read_db)):
+    """
+    Items at or below their reorder threshold, served from the partial low-stock index
+    """
+    query = db.query(Item).filter(Item.low_stock == True)  # noqa: E712
+    if category:
+        query = query.filter(Item.category == category)
+    return query.order_by(Item.category, Item.id).all()
+
+@router.post("/generate-all-qr-codes/")
+def generate_all_qr_codes(db: Session = Depends(get_db)):
+    items = db.query(Item).filter(Item.qr_code_url.is_(None)).all()
+    for item in items:
+        before = item_to_dict(item)
+        item.qr_code_url = generate_qr_code(item.id)
+        record_change(db, "update", item, before)
+    if items:
+        db.commit()
+        change_feed.notify()
+        invalidate_item_caches(categories=False)
+    return {"detail": "QR codes generated for all existing items."}
+
+def generate_ai_response(provider, prompt: str, images: List[Any], photos: List[str],
+                         timeout: Optional[float] = None) -> str:
+    """
+    Call the AI provider, reusing a cached answer for identical prompt + photos.
+    timeout bounds the provider call once it holds an ai_slots permit; waiting for
+    the permit does not count against it
+    """
+    digest = hashlib.sha256()
+    for part in [provider.name, provider.model, prompt, *photos]:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    def call_provider():
+        with ai_slots:
+            return provider.generate_content(prompt, images, timeout=timeout)
+    return cache.get_or_load("ai", digest.hexdigest(), call_provider, ttl=AI_CACHE_TTL)
+
+BARCODE_DECODING = os.getenv("BARCODE_DECODING", "true").lower() == "true"
+BARCODE_ATTRIBUTE_KEYS = ("barcode", "upc", "ean", "gtin")
+
+def normalize_barcode(code: str) -> str:
+    code = re.sub(r'\s+', '', str(code))
+    # Decoders report UPC-A either as 12 digits or as the equivalent EAN-13
+    if code.isdigit() and len(code) == 12:
+        code = "0" + code
+    return code
+
+def find_item_by_barcode(db: Session, code: str) -> Optional[Item]:
+    row = db.get(ItemBarcode, normalize_barcode(code))
+    return db.get(Item, row.item_id) if row is not None else None
+
+# code -> item id map for /scan; other workers' barcode writes bump the shared "barcodes" version
+scan_codes = CodeIndex(version=lambda: cache.get_version("barcodes"), ttl=float(os.getenv("SCAN_CODE_TTL", "60")))
+
+# Perceptual-hash index of item images; other workers' writes bump the shared "image_hashes" version
+image_hashes = HashIndex(version=lambda: cache.get_version("image_hashes"))
+# Incremental syncs re-read rows this close to the watermark: workers' clocks and commit order differ slightly
+IMAGE_SYNC_OVERLAP = timedelta(seconds=60)
+IMAGE_MATCH_DISTANCE = int(os.getenv("IMAGE_MATCH_DISTANCE", "6"))
+
+def open_photo(photo_b64: str):
+    """Decode a base64 photo (optionally a data: URL) into a PIL image"""
+    from PIL import Image
+
+    image_data = base64.b64decode(photo_b64.split(',')[1] if ',' in photo_b64 else photo_b64)
+    return Image.open(io.BytesIO(image_data))
 
-    class Config:
-        from_attributes = True
+def compute_image_hash(image_url: Optional[str]) -> Optional[str]:
+    """pHash of an uploaded image, or None when there is no readable upload"""
+    key = media_key(image_url)
+    if key is None or not key.startswith("uploads/"):
+        return None
+    from PIL import Image
 
-async def get_db():
-    db = SessionLocal()
     try:
-        yield db
-    finally:
-        db.close()
+        data = media.read(key)
+        if data is None:
+            return None
+        with Image.open(io.BytesIO(data)) as image:
+            return hash_to_hex(phash(image))
+    except (OSError, ValueError):
+        return None
 
-def generate_qr_code(item_id: int, host: str = "localhost:5174"):
-    os.makedirs("qrcodes", exist_ok=True)
-    qr_code_path = os.path.join("qrcodes", f"{item_id}.png")
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    # The QR code will contain the URL to the item's detail page
-    # Use the provided host (which could be an IP address for mobile access)
-    qr.add_data(f"http://{host}/item/{item_id}")
-    qr.make(fit=True)
+def update_image_index(item_id: int, image_hash: Optional[str]):
+    if image_hash:
+        image_hashes.add(item_id, hex_to_hash(image_hash))
+    else:
+        image_hashes.remove(item_id)
+    cache.invalidate("image_hashes")
 
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(qr_code_path)
-    return f"/qrcodes/{item_id}.png"
+def load_image_hashes(db: Session, since: Optional[datetime]) -> Tuple[Dict[int, Optional[int]], datetime]:
+    """
+    Image hashes for the near-duplicate index: every hashed item when since is None,
+    otherwise the items written since the watermark (None for an image removed).
+    Returns the new watermark, the newest updated_at seen
+    """
+    watermark = since or datetime.utcnow()
+    query = db.query(Item.id, Item.image_hash, Item.updated_at)
+    if since is None:
+        query = query.filter(Item.image_hash.isnot(None))
+    else:
+        query = query.filter(Item.updated_at >= since - IMAGE_SYNC_OVERLAP)
+    hashes = {}
+    for item_id, value, updated_at in query:
+        hashes[item_id] = hex_to_hash(value) if value else None
+        if updated_at is not None and updated_at > watermark:
+            watermark = updated_at
+    return hashes, watermark
 
-def generate_all_qr_codes_on_startup():
-    db = SessionLocal()
-    generate_all_qr_codes(db)
-    db.close()
+def find_visual_matches(db: Session, images: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Existing items whose photo is a near-duplicate of any of the given images.
+    Blocking (hashing, database reads): async handlers run it in a thread
+    """
+    image_hashes.ensure_synced(lambda since: load_image_hashes(db, since))
+    if not len(image_hashes):
+        return []
+    best: Dict[int, int] = {}
+    for image in images:
+        for item_id, distance in image_hashes.query(phash(image), IMAGE_MATCH_DISTANCE):
+            best[item_id] = min(distance, best.get(item_id, distance))
+    if not best:
+        return []
+    items = db.query(Item).filter(Item.id.in_(list(best))).all()
+    # Deleted by another worker; incremental syncs only see items that still exist
+    for item_id in best.keys() - {item.id for item in items}:
+        image_hashes.remove(item_id)
+    return sorted(
+        ({'id': item.id, 'name': item.name, 'quantity': item.quantity, 'category': item.category,
+          'distance': best[item.id]} for item in items),
+        key=lambda match: (match['distance'], match['id'])
+    )
 
-app.add_event_handler("startup", generate_all_qr_codes_on_startup)
+def attach_visual_matches(suggestions: Dict[str, Any], visual_matches: List[Dict[str, Any]]):
+    if not visual_matches:
+        return
+    suggestions['visual_matches'] = visual_matches
+    similar = suggestions.setdefault('similar_items', [])
+    known = {item['id'] for item in similar}
+    similar.extend(
+        {k: v for k, v in match.items() if k != 'distance'}
+        for match in visual_matches if match['id'] not in known
+    )
 
-@app.post("/upload/")
-async def upload_image(file: UploadFile = File(...)):
-    os.makedirs("uploads", exist_ok=True)
-    if file.filename is None:
-        raise HTTPException(status_code=400, detail="No filename provided")
-    file_path = os.path.join("uploads", file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"image_url": f"/uploads/{file.filename}"}
+# Embedding index for semantic search; other workers' writes bump the shared "embeddings" version
+semantic_index = EmbeddingIndex(
+    embedder_factory=create_embedder,
+    path=os.getenv("EMBEDDING_INDEX_PATH") or None,
+    version=lambda: cache.get_version("embeddings"),
+)
+SEMANTIC_MATCH_SCORE = float(os.getenv("SEMANTIC_MATCH_SCORE", "0.35"))
+SEMANTIC_MATCH_LIMIT = 5
+# Incremental syncs re-read rows this close to the watermark: workers' clocks and commit order differ slightly
+SEMANTIC_SYNC_OVERLAP = timedelta(seconds=60)
 
-@app.get("/items/", response_model=List[ItemBase])
-def get_items(category: str = Query(None), db: Session = Depends(get_db)):
-    if category:
-        items = db.query(Item).filter(Item.category == category).all()
+
+def update_semantic_index(item_id: int, item: Optional[Item] = None):
+    if item is not None:
+        semantic_index.upsert(item_id, item_text(item.name, item.category, item.custom_attributes))
     else:
-        items = db.query(Item).all()
-    return items
+        semantic_index.remove(item_id)
+    cache.invalidate("embeddings")
 
-@app.post("/items/", response_model=ItemBase)
-def create_item(item: ItemCreate, db: Session = Depends(get_db)):
-    db_item = Item(**item.dict())
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+def load_semantic_documents(db: Session, since: Optional[datetime]) -> Tuple[Dict[int, str], datetime]:
+    """
+    Item texts for the embedding index: every item when since is None, otherwise
+    those written since the watermark (through the updated_at index). Returns the
+    new watermark, the newest updated_at seen
+    """
+    watermark = since or datetime.utcnow()
+    query = db.query(Item.id, Item.name, Item.category, Item.custom_attributes, Item.updated_at)
+    if since is not None:
+        query = query.filter(Item.updated_at >= since - SEMANTIC_SYNC_OVERLAP)
+    documents = {}
+    for item_id, name, category, custom_attributes, updated_at in query:
+        documents[item_id] = item_text(name, category, custom_attributes)
+        if updated_at is not None and updated_at > watermark:
+            watermark = updated_at
+    return documents, watermark
 
-    # Generate QR code
-    db_item.qr_code_url = generate_qr_code(db_item.id)
-    db.commit()
-    db.refresh(db_item)
+def semantic_search(db: Session, queries: List[str], k: int, min_score: float = 0.0,
+                    category: Optional[str] = None) -> List[List[Tuple[Item, float]]]:
+    """
+    Top-k items per query by cosine similarity, all queries in one batched lookup.
+    With a category only its items are scored
+    """
+    semantic_index.ensure_synced(lambda since: load_semantic_documents(db, since))
+    candidates = None
+    if category is not None:
+        candidates = [item_id for (item_id,) in db.query(Item.id).filter(Item.category == category)]
+    while True:
+        results = semantic_index.search(queries, k, min_score, candidates)
+        ids = {item_id for hits in results for item_id, _ in hits}
+        items = {item.id: item for item in db.query(Item).filter(Item.id.in_(ids))} if ids else {}
+        missing = ids - items.keys()
+        if not missing:
+            break
+        # Deleted by another worker; incremental syncs only see items that still exist
+        for item_id in missing:
+            semantic_index.remove(item_id)
+    return [[(items[item_id], score) for item_id, score in hits] for hits in results]
 
-    return db_item
+def attach_similar_items(db: Session, suggestion_sets: List[Dict[str, Any]]):
+    """
+    Existing items semantically close to each suggestion (name, category and attributes).
+    Blocking (index sync, NumPy search, database reads): async handlers run it in a thread
+    """
+    queries = [
+        item_text(suggestions['name'], suggestions['category'], suggestions.get('custom_attributes'))
+        for suggestions in suggestion_sets
+    ]
+    matches = semantic_search(db, queries, SEMANTIC_MATCH_LIMIT, SEMANTIC_MATCH_SCORE)
+    for suggestions, hits in zip(suggestion_sets, matches):
+        if hits:
+            suggestions['similar_items'] = [
+                {'id': item.id, 'name': item.name, 'quantity': item.quantity,
+                 'category': item.category, 'score': round(score, 3)}
+                for item, score in hits
+            ]
 
-@app.get("/items/{item_id}", response_model=ItemBase)
-def read_item(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(Item).filter(Item.id == item_id).first()
-    if item is None:
-        raise HTTPException(status_code=404, detail="Item not found")
-    return item
+def register_barcode(db: Session, code: str, item_id: int) -> bool:
+    """Upsert a code -> item mapping; returns True when it changed (caller commits)"""
+    code = normalize_barcode(code)
+    row = db.get(ItemBarcode, code)
+    if row is not None and row.item_id == item_id:
+        return False
+    if row is None:
+        db.add(ItemBarcode(code=code, item_id=item_id))
+    else:
+        row.item_id = item_id
+    scan_codes.put(code, item_id)
+    return True
 
-@app.put("/items/{item_id}", response_model=ItemBase)
-def update_item(item_id: int, updated_item: ItemCreate, db: Session = Depends(get_db)):
-    item = db.query(Item).filter(Item.id == item_id).first()
-    if item is None:
-        raise HTTPException(status_code=404, detail="Item not found")
-    item.name = updated_item.name
-    item.category = updated_item.category
-    item.quantity = updated_item.quantity
-    item.custom_attributes = updated_item.custom_attributes
-    item.image_url = updated_item.image_url
-    db.commit()
-    db.refresh(item)
-    return item
+def attribute_barcodes(custom_attributes: Optional[Dict[str, Any]]) -> set:
+    return {
+        normalize_barcode(value) for key, value in (custom_attributes or {}).items()
+        if key.strip().lower() in BARCODE_ATTRIBUTE_KEYS and value
+    }
 
-@app.delete("/items/{item_id}")
-def delete_item(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(Item).filter(Item.id == item_id).first()
-    if item is None:
-        raise HTTPException(status_code=404, detail="Item not found")
-    db.delete(item)
-    db.commit()
-    return {"detail": "Item deleted successfully"}
+def sync_item_barcodes(db: Session, item: Item, previous_attributes: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Index barcode-like custom attributes (barcode, upc, ean, gtin) for this item and
+    unindex the ones previous_attributes had that are gone now. Codes assigned
+    through POST /items/{id}/barcodes are not attributes and stay
+    """
+    codes = attribute_barcodes(item.custom_attributes)
+    changed = False
+    for code in codes:
+        changed = register_barcode(db, code, item.id) or changed
+    removed = attribute_barcodes(previous_attributes) - codes
+    if removed:
+        deleted = db.query(ItemBarcode).filter(
+            ItemBarcode.item_id == item.id, ItemBarcode.code.in_(removed)
+        ).delete(synchronize_session=False)
+        for code in removed:
+            scan_codes.discard(code, item.id)
+        changed = changed or deleted > 0
+    return changed
 
-@app.get("/categories/", response_model=List[str])
-def get_categories(db: Session = Depends(get_db)):
-    categories = db.query(Item.category).distinct().all()
-    return [cat[0] for cat in categories]
+def resolve_decoded_codes(db: Session, images: List[Any]) -> Tuple[List[DecodedCode], Optional[Item]]:
+    """
+    Decode barcodes / QR codes locally and resolve the first one that maps to an item:
+    Stuf QR codes carry the item id, other codes go through the barcode index.
+    Blocking (image decoding, database lookups): async handlers run it in a thread
+    """
+    if not BARCODE_DECODING:
+        return [], None
+    codes = decode_images(images)
+    for code in codes:
+        item = db.get(Item, code.item_id) if code.item_id is not None else find_item_by_barcode(db, code.data)
+        if item is not None:
+            return codes, item
+    return codes, None
 
-@app.post("/generate-all-qr-codes/")
-def generate_all_qr_codes(db: Session = Depends(get_db)):
-    items = db.query(Item).all()
-    for item in items:
-        if not item.qr_code_url:
-            item.qr_code_url = generate_qr_code(item.id)
-            db.commit()
-    return {"detail": "QR codes generated for all existing items."}
+def existing_item_suggestions(item: Item) -> Dict[str, Any]:
+    summary = {'id': item.id, 'name': item.name, 'quantity': item.quantity, 'category': item.category}
+    return {
+        'name': item.name,
+        'category': item.category,
+        'quantity': 1,
+        'custom_attributes': dict(item.custom_attributes or {}),
+        'matched_item': summary,
+        'similar_items': [summary],
+    }
+
+def barcode_prompt_hint(codes: List[DecodedCode]) -> str:
+    if not codes:
+        return ""
+    return "Barcodes decoded from the images: " + ", ".join(f"{code.type} {code.data}" for code in codes)
+
+def attach_unmatched_barcode(suggestions: Dict[str, Any], codes: List[DecodedCode]):
+    """Carry an unknown product barcode into the suggestion so saving the item indexes it"""
+    product_codes = [code for code in codes if code.item_id is None and code.type != "QRCODE"]
+    if product_codes:
+        suggestions.setdefault('custom_attributes', {})['barcode'] = product_codes[0].data
 
 class SmartAddRequest(BaseModel):
     photos: List[str]  # Base64 encoded images
@@ -200,36 +1830,23 @@ class SmartAddResponse(BaseModel):
     confidence: float
     suggestions: Optional[Dict[str, Any]] = None
     error_message: Optional[str] = None
+    source: Optional[str] = None  # "barcode" when resolved locally, "ai" otherwise
+    decoded_codes: Optional[List[Dict[str, str]]] = None
 
-@app.post("/smart-add/", response_model=SmartAddResponse)
+@router.post("/smart-add/", response_model=SmartAddResponse)
 async def smart_add_analyze(request: SmartAddRequest, db: Session = Depends(get_db)):
     """
-    Analyze photos using Google Gemini to suggest item attributes
+    Analyze photos using the configured AI provider to suggest item attributes
     """
     try:
-        # Configure Gemini API
-        api_key = os.getenv("GOOGLE_AI_API_KEY")
-        if not api_key:
-            return SmartAddResponse(
-                success=False,
-                confidence=0.0,
-                error_message="Gemini API key not configured"
-            )
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
         # Get existing categories for context
-        existing_categories = db.query(Item.category).distinct().all()
-        categories_list = [cat[0] for cat in existing_categories]
+        categories_list = await asyncio.to_thread(get_categories, db)
         
         # Prepare images for Gemini
         images = []
         for photo_b64 in request.photos[:3]:  # Max 3 photos
             try:
-                # Decode base64 image
-                image_data = base64.b64decode(photo_b64.split(',')[1] if ',' in photo_b64 else photo_b64)
-                image = Image.open(io.BytesIO(image_data))
+                image = open_photo(photo_b64)
                 images.append(image)
             except Exception as e:
                 return SmartAddResponse(
@@ -238,11 +1855,35 @@ async def smart_add_analyze(request: SmartAddRequest, db: Session = Depends(get_
                     error_message=f"Failed to process image: {str(e)}"
                 )
         
+        # Local barcode / QR decoding: a known code skips the AI call entirely
+        decoded_codes, matched_item = await asyncio.to_thread(resolve_decoded_codes, db, images)
+        if matched_item is not None:
+            return SmartAddResponse(
+                success=True,
+                confidence=1.0,
+                suggestions=existing_item_suggestions(matched_item),
+                source="barcode",
+                decoded_codes=[code.to_dict() for code in decoded_codes]
+            )
+        
+        # Resolve the configured AI provider (Gemini, local stub, local vision model)
+        provider = get_ai_provider()
+        if not provider.is_configured():
+            return SmartAddResponse(
+                success=False,
+                confidence=0.0,
+                error_message=provider.not_configured_message()
+            )
+        
+        # Visually near-duplicate items from the perceptual-hash index
+        visual_matches = await asyncio.to_thread(find_visual_matches, db, images)
+        
         # Create prompt for Gemini with more confident language
         prompt = f"""
         Analyze these images and identify the household inventory item. Provide your most confident assessment without hedging language.
         
         Existing categories in the system: {', '.join(categories_list) if categories_list else 'None'}
+        {barcode_prompt_hint(decoded_codes)}
         
         Provide a JSON response with this exact structure:
         {{
@@ -269,11 +1910,8 @@ async def smart_add_analyze(request: SmartAddRequest, db: Session = Depends(get_
         - Set confidence based on image clarity and your certainty of identification
         """
         
-        # Send request to Gemini
-        response = model.generate_content([prompt] + images)
-        
-        # Parse response
-        response_text = response.text.strip()
+        # Send request to the AI provider
+        response_text = (await asyncio.to_thread(generate_ai_response, provider, prompt, images, request.photos)).strip()
         
         # Extract JSON from response (handle potential markdown formatting)
         if "```json" in response_text:
@@ -303,37 +1941,16 @@ async def smart_add_analyze(request: SmartAddRequest, db: Session = Depends(get_
             'custom_attributes': cleaned_attrs
         }
         
-        # Check for existing similar items in the same category
-        similar_items = []
-        suggested_category = final_suggestions['category']
-        suggested_name = final_suggestions['name'].lower()
-        
-        if suggested_category:
-            # Get all items in the suggested category
-            category_items = db.query(Item).filter(Item.category == suggested_category).all()
-            
-            # Check for similar names using simple string matching
-            for item in category_items:
-                item_name_lower = item.name.lower()
-                # Check if names are similar (contains, or high overlap)
-                if (suggested_name in item_name_lower or 
-                    item_name_lower in suggested_name or
-                    len(set(suggested_name.split()) & set(item_name_lower.split())) >= 2):
-                    similar_items.append({
-                        'id': item.id,
-                        'name': item.name,
-                        'quantity': item.quantity,
-                        'category': item.category
-                    })
-        
-        # Add similar items to response if found
-        if similar_items:
-            final_suggestions['similar_items'] = similar_items
+        await asyncio.to_thread(attach_similar_items, db, [final_suggestions])
         
+        attach_unmatched_barcode(final_suggestions, decoded_codes)
+        attach_visual_matches(final_suggestions, visual_matches)
         return SmartAddResponse(
             success=True,
             confidence=confidence,
-            suggestions=final_suggestions
+            suggestions=final_suggestions,
+            source="ai",
+            decoded_codes=[code.to_dict() for code in decoded_codes] or None
         )
         
     except Exception as e:
@@ -343,71 +1960,388 @@ async def smart_add_analyze(request: SmartAddRequest, db: Session = Depends(get_
             error_message=f"SmartAdd analysis failed: {str(e)}"
         )
 
-@app.post("/items/{item_id}/increment")
+@router.get("/ai/metrics")
+def get_ai_metrics():
+    """
+    Latency and error metrics for each AI provider used by this process
+    """
+    return {"providers": provider_metrics()}
+
+@router.get("/health/database")
+def get_database_health():
+    """
+    Read replica status as of each replica's last health probe
+    """
+    return {"replicas": read_router.status() if read_router is not None else []}
+
+@router.post("/items/{item_id}/increment")
 def increment_item_quantity(item_id: int, increment_by: int = 1, db: Session = Depends(get_db)):
     """
-    Increment the quantity of an existing item
+    Increment the quantity of an existing item, as one atomic UPDATE (see apply_quantity_deltas)
     """
-    item = db.query(Item).filter(Item.id == item_id).first()
+    new_quantities = apply_quantity_deltas(db, {item_id: increment_by})
+    if item_id not in new_quantities:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {"detail": f"Item quantity incremented by {increment_by}", "new_quantity": new_quantities[item_id]}
+
+# Delta sync for offline clients: the token is a change log sequence number
+class SyncPage(BaseModel):
+    token: str
+    # True when `items` is the whole inventory and replaces the client's copy
+    full: bool
+    items: List[ItemBase]
+    deleted: List[int]
+    has_more: bool
+
+@router.get("/sync", response_model=SyncPage)
+def pull_changes(since: Optional[str] = Query(None),
+                 limit: int = Query(CHANGE_FEED_PAGE_SIZE, ge=1, le=CHANGE_FEED_PAGE_SIZE),
+                 db: Session = Depends(get_read_db)):
+    """
+    Items created or updated since the token, plus tombstones (ids) for deleted ones.
+    Without a token, or with one older than the retained change log, the whole
+    inventory is returned with full=true. Pull again with the returned token while
+    has_more is true
+    """
+    if since is not None and not since.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    cursor = int(since) if since is not None else None
+    if cursor is None or cursor < change_log_floor(db):
+        # Token first: anything written while the items are read is sent again next time
+        token = latest_change_seq(db)
+        items = db.query(Item).order_by(Item.id).all()
+        return {"token": str(token), "full": True, "items": items, "deleted": [], "has_more": False}
+
+    # Safe because seq order is commit order (lock_change_log): nothing below the token can still appear
+    changes = (
+        db.query(ItemChange.seq, ItemChange.item_id)
+        .filter(ItemChange.seq > cursor)
+        .order_by(ItemChange.seq)
+        .limit(limit)
+        .all()
+    )
+    item_ids = {change.item_id for change in changes}
+    items = db.query(Item).filter(Item.id.in_(item_ids)).order_by(Item.id).all() if item_ids else []
+    return {
+        "token": str(changes[-1].seq if changes else cursor),
+        "full": False,
+        "items": items,
+        "deleted": sorted(item_ids - {item.id for item in items}),
+        "has_more": len(changes) == limit,
+    }
+
+class SyncMutation(BaseModel):
+    # Client-generated id; a mutation already applied under this id is not applied again
+    mutation_id: str = Field(..., min_length=1, max_length=64)
+    op: Literal["create", "update", "delete", "increment"]
+    item_id: Optional[int] = None
+    # Item version the client last saw; updates and deletes conflict when it differs (omit to overwrite)
+    base_version: Optional[int] = None
+    item: Optional[ItemCreate] = None
+    delta: int = 0
+
+class SyncPush(BaseModel):
+    mutations: List[SyncMutation] = Field(..., max_length=CHANGE_FEED_PAGE_SIZE)
+
+class SyncResult(BaseModel):
+    mutation_id: str
+    status: Literal["applied", "duplicate", "conflict", "not_found", "invalid"]
+    item_id: Optional[int] = None
+    # Server state after the mutation, or the state it conflicted with
+    item: Optional[ItemBase] = None
+    detail: Optional[str] = None
+
+class SyncPushResponse(BaseModel):
+    results: List[SyncResult]
+
+def apply_sync_mutation(db: Session, mutation: SyncMutation) -> Dict[str, Any]:
+    # Items are copied into the result: later mutations in the batch may change the same row
+    result: Dict[str, Any] = {"mutation_id": mutation.mutation_id, "item_id": mutation.item_id}
+    applied = db.query(ItemChange.item_id).filter(ItemChange.mutation_id == mutation.mutation_id).first()
+    if applied is not None:
+        item = db.get(Item, applied.item_id)
+        return {**result, "status": "duplicate", "item_id": applied.item_id,
+                "item": item_to_dict(item) if item is not None else None}
+    if mutation.op in ("create", "update") and mutation.item is None:
+        return {**result, "status": "invalid", "detail": f"{mutation.op} needs an item"}
+    if mutation.item is not None and unknown_location(db, mutation.item):
+        return {**result, "status": "invalid", "detail": f"Location {mutation.item.location_id} not found"}
+    if mutation.op == "create":
+        item = save_new_item(db, mutation.item, mutation.mutation_id)
+        return {**result, "status": "applied", "item_id": item.id, "item": item_to_dict(item)}
+
+    item = db.get(Item, mutation.item_id) if mutation.item_id is not None else None
     if item is None:
+        return {**result, "status": "not_found"}
+    # Increments are deltas, so they merge with concurrent changes instead of conflicting
+    if mutation.op != "increment" and mutation.base_version is not None and mutation.base_version != item.version:
+        return {**result, "status": "conflict", "item": item_to_dict(item)}
+    if mutation.op == "delete":
+        delete_item_row(db, item, mutation.mutation_id)
+        return {**result, "status": "applied"}
+    if mutation.op == "update":
+        item = save_item_update(db, item, mutation.item, mutation.mutation_id)
+    elif item.id not in apply_quantity_deltas(db, {item.id: mutation.delta}, mutation.mutation_id):
+        return {**result, "status": "not_found"}
+    return {**result, "status": "applied", "item": item_to_dict(item)}
+
+@router.post("/sync", response_model=SyncPushResponse)
+def push_changes(push: SyncPush, db: Session = Depends(get_db)):
+    """
+    Apply a batch of offline mutations in order, each in its own transaction. A
+    retried batch is safe: mutations already applied come back as duplicates.
+    Pull with GET /sync afterwards to pick up the new versions
+    """
+    results = []
+    for mutation in push.mutations:
+        try:
+            results.append(apply_sync_mutation(db, mutation))
+        except StaleDataError:
+            # Another request wrote the item between our read and our write
+            db.rollback()
+            item = db.get(Item, mutation.item_id)
+            results.append({"mutation_id": mutation.mutation_id, "item_id": mutation.item_id,
+                            "status": "conflict" if item is not None else "not_found",
+                            "item": item_to_dict(item) if item is not None else None})
+    return {"results": results}
+
+@router.post("/image-index/rebuild")
+def rebuild_image_index(batch_size: int = 200, db: Session = Depends(get_db)):
+    """
+    Hash uploaded item images that have no perceptual hash yet, in id-ordered batches
+    """
+    hashed = 0
+    last_id = 0
+    while True:
+        batch = (
+            db.query(Item)
+            .filter(Item.id > last_id, Item.image_hash.is_(None), Item.image_url.isnot(None))
+            .order_by(Item.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for item in batch:
+            before = item_to_dict(item)
+            item.image_hash = compute_image_hash(item.image_url)
+            if item.image_hash is not None:
+                hashed += 1
+                # Only the version and updated_at are visible, but sync clients need the new version
+                record_change(db, "update", item, before)
+        last_id = batch[-1].id
+        db.commit()
+    if hashed:
+        change_feed.notify()
+    image_hashes.clear()
+    cache.invalidate("image_hashes")
+    return {"hashed": hashed}
+
+class BarcodeAssignment(BaseModel):
+    code: str
+
+@router.post("/items/{item_id}/barcodes")
+def add_item_barcode(item_id: int, assignment: BarcodeAssignment, db: Session = Depends(get_db)):
+    """
+    Map a product barcode (UPC/EAN/...) to an item so scans resolve it without AI
+    """
+    if db.get(Item, item_id) is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    
-    # Fix SQLAlchemy column assignment issue
-    current_quantity = item.quantity if isinstance(item.quantity, int) else 0
-    item.quantity = current_quantity + increment_by
+    if register_barcode(db, assignment.code, item_id):
+        db.commit()
+        cache.invalidate("barcodes")
+    return {"code": normalize_barcode(assignment.code), "item_id": item_id}
+
+@router.get("/barcodes/{code}", response_model=ItemBase)
+def get_item_by_barcode(code: str, db: Session = Depends(get_read_db)):
+    item = find_item_by_barcode(db, code)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Barcode not found")
+    return item
+
+SCAN_ITEM_ID_MAX_DIGITS = 9  # longer numeric codes are product barcodes, not item ids
+
+class ScanEntry(BaseModel):
+    code: str  # Stuf QR URL, UPC/EAN, or item id
+    delta: int = 1
+
+class ScanRequest(BaseModel):
+    code: Optional[str] = None
+    delta: int = 1
+    scans: Optional[List[ScanEntry]] = None  # Batch of scans applied in one transaction
+
+def resolve_scan_code(db: Session, code: str) -> Optional[int]:
+    code = code.strip()
+    match = ITEM_URL_PATTERN.search(code)
+    if match:
+        return int(match.group(1))
+    item_id = scan_codes.lookup(
+        normalize_barcode(code),
+        lambda: dict(db.query(ItemBarcode.code, ItemBarcode.item_id).all())
+    )
+    if item_id is None and code.isdigit() and len(code) <= SCAN_ITEM_ID_MAX_DIGITS:
+        item_id = int(code)
+    return item_id
+
+def apply_quantity_deltas(db: Session, deltas: Dict[int, int], mutation_id: Optional[str] = None) -> Dict[int, int]:
+    """
+    Apply quantity += delta per item as single atomic UPDATE ... RETURNING statements
+    in one transaction (no read-modify-write race between devices). Returns new quantities.
+    `mutation_id` marks the change rows of a /sync increment.
+    """
+    new_quantities: Dict[int, int] = {}
+    newly_low = []
+    lock_change_log(db)
+    for item_id, delta in deltas.items():
+        row = db.execute(
+            update(Item)
+            .where(Item.id == item_id)
+            .values(quantity=Item.quantity + delta, version=Item.version + 1)
+            .returning(Item.id, Item.name, Item.category, Item.quantity, Item.reorder_threshold, Item.low_stock,
+                       Item.updated_at, Item.version, Item.custom_attributes)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            continue
+        new_quantities[item_id] = row.quantity
+        changes = {"quantity": row.quantity, "version": row.version,
+                   "updated_at": row.updated_at.isoformat() if row.updated_at else None}
+
+        threshold = row.reorder_threshold
+        if threshold is None:
+            category_threshold = db.get(CategoryThreshold, row.category)
+            threshold = category_threshold.reorder_threshold if category_threshold else None
+        is_low = threshold is not None and row.quantity <= threshold
+        if is_low != bool(row.low_stock):
+            db.execute(
+                update(Item).where(Item.id == item_id).values(low_stock=is_low)
+                .execution_options(synchronize_session=False)
+            )
+            changes["low_stock"] = is_low
+            if is_low:
+                newly_low.append((row, threshold))
+        before = {"category": row.category, "quantity": row.quantity - delta, "low_stock": row.low_stock,
+                  "custom_attributes": row.custom_attributes}
+        update_rollups(db, before, {**before, "quantity": row.quantity, "low_stock": is_low})
+        db.add(ItemChange(item_id=item_id, op="update", changes=changes, mutation_id=mutation_id))
     db.commit()
-    db.refresh(item)
-    return {"detail": f"Item quantity incremented by {increment_by}", "new_quantity": item.quantity}
 
-# Simplified helper functions (no OpenCV required)
-def extract_price_from_text(text: str) -> Optional[str]:
+    if new_quantities:
+        change_feed.notify()
+        invalidate_item_caches(categories=False)
+    for row, threshold in newly_low:
+        send_low_stock_alert(row, threshold)
+    return new_quantities
+
+@router.post("/scan")
+def scan_items(request: ScanRequest, db: Session = Depends(get_db)):
+    """
+    Scan-to-increment fast path: resolve each code through the in-memory code map and
+    atomically apply its delta. Repeated scans of one item are folded into one update.
+    """
+    if request.scans is not None:
+        entries = request.scans
+    elif request.code:
+        entries = [ScanEntry(code=request.code, delta=request.delta)]
+    else:
+        raise HTTPException(status_code=422, detail="Provide a code or a list of scans")
+
+    resolved = [(entry, resolve_scan_code(db, entry.code)) for entry in entries]
+    deltas: Dict[int, int] = {}
+    for entry, item_id in resolved:
+        if item_id is not None:
+            deltas[item_id] = deltas.get(item_id, 0) + entry.delta
+    new_quantities = apply_quantity_deltas(db, deltas)
+
+    results = []
+    for entry, item_id in resolved:
+        if item_id in new_quantities:
+            results.append({"code": entry.code, "item_id": item_id, "new_quantity": new_quantities[item_id]})
+        else:
+            results.append({"code": entry.code, "error": "Unknown code"})
+
+    if request.scans is None:
+        if "error" in results[0]:
+            raise HTTPException(status_code=404, detail="Unknown code")
+        return results[0]
+    return {"results": results}
+
+# Text extraction helpers (patterns are precompiled in text_extraction.py)
+def resolve_locale(locale: Optional[str], fallback: str) -> str:
+    """A supported extraction locale for locale, or fallback (with a warning) when there is none"""
+    normalized = normalize_locale(locale)
+    if normalized is None:
+        logger.warning("Unsupported extraction locale %r, using %s", locale, fallback)
+        return fallback
+    return normalized
+
+# Checked once here, so a bad value cannot fail item writes later
+EXTRACTION_LOCALE = resolve_locale(os.getenv("EXTRACTION_LOCALE", "en_US"), "en_US")
+
+def locale_extractor(locale: Optional[str] = None):
+    """Extractor for a request's locale; EXTRACTION_LOCALE when it is absent or unsupported"""
+    return get_extractor(resolve_locale(locale, EXTRACTION_LOCALE) if locale else EXTRACTION_LOCALE)
+
+def extract_price_from_text(text: str, locale: Optional[str] = None) -> Optional[str]:
     """Extract price information from text"""
-    price_patterns = [
-        r'\$\d+\.?\d*',  # $10.99, $10
-        r'\d+\.?\d*\s*(?:USD|usd|\$)',  # 10.99 USD, 10$
-        r'(?:Price|price|PRICE)[\s:]*\$?\d+\.?\d*',  # Price: $10.99
-        r'\d+\.?\d*\s*(?:dollars?|cents?)',  # 10.99 dollars
-    ]
-    
-    for pattern in price_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return match.group()
-    return None
+    match = locale_extractor(locale).extract_price(text)
+    return match.text if match else None
+
+def extract_expiry_from_text(text: str, locale: Optional[str] = None) -> Optional[str]:
+    """Extract expiration date from text as an ISO date string"""
+    match = locale_extractor(locale).extract_expiry(text)
+    return match.iso if match else None
+
+EXPIRY_ATTRIBUTE_KEYS = ("expiry_date", "expiry", "expiration_date", "expiration", "expires", "best_by", "use_by")
+
+def parse_expiry_date(value: Any) -> Optional[date]:
+    """Parse an expiry value from an attribute or OCR text into a date"""
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    match = locale_extractor().extract_expiry(value)
+    return match.date if match else None
 
-def extract_expiry_from_text(text: str) -> Optional[str]:
-    """Extract expiration date from text"""
-    date_patterns = [
-        r'(?:exp|expire[sd]?|expiry|best\s+by|use\s+by)[\s:]*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})',
-        r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})(?:\s*(?:exp|expire[sd]?))?',
-        r'(?:exp|expire[sd]?|expiry)[\s:]*(\d{1,2}\s+\w+\s+\d{2,4})',  # 15 Jan 2024
+def normalize_price_and_expiry(attribute_sets: List[Dict[str, Any]], locale: Optional[str],
+                               detect_price: bool, detect_expiry: bool) -> List[Dict[str, Any]]:
+    """
+    Post-process AI attributes for many items in one batch: price becomes a structured
+    amount/currency and expiry_date an ISO date (so the item write indexes it)
+    """
+    extractor = locale_extractor(locale)
+    texts = [
+        f"price: {attrs.get('price', '') if detect_price else ''} | "
+        f"exp {attrs.get('expiry_date', '') if detect_expiry else ''}"
+        for attrs in attribute_sets
     ]
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            try:
-                date_str = match.group(1)
-                # Try to parse and validate the date
-                if '/' in date_str or '-' in date_str:
-                    separator = '/' if '/' in date_str else '-'
-                    parts = date_str.split(separator)
-                    if len(parts) == 3:
-                        month, day, year = parts
-                        if len(year) == 2:
-                            year = '20' + year
-                        return f"{month}/{day}/{year}"
-                return date_str
-            except:
-                continue
+    extracted = []
+    for attrs, result in zip(attribute_sets, extractor.extract_batch(texts)):
+        values: Dict[str, Any] = {}
+        if detect_price and 'price' in attrs and result.price:
+            values['price'] = result.price.to_dict()
+        if detect_expiry and 'expiry_date' in attrs and result.expiry:
+            attrs['expiry_date'] = result.expiry.iso
+            values['expiry_date'] = result.expiry.iso
+        extracted.append(values)
+    return extracted
+
+def expiry_from_attributes(custom_attributes: Optional[Dict[str, Any]]) -> Optional[date]:
+    for key, value in (custom_attributes or {}).items():
+        if re.sub(r'[\s\-]+', '_', key.strip().lower()) in EXPIRY_ATTRIBUTE_KEYS:
+            parsed = parse_expiry_date(value)
+            if parsed is not None:
+                return parsed
     return None
 
 # Enhanced SmartAdd models
 class EnhancedSmartAddRequest(BaseModel):
     photos: List[str]  # Base64 encoded images
     batch_mode: bool = False  # Process multiple items in one request
+    parallel: bool = False  # Batch mode: analyze each photo separately and merge the detected items
     detect_price: bool = False  # Enable price detection
     detect_expiry: bool = False  # Enable expiration date detection
+    locale: Optional[str] = None  # Locale for price/date parsing, e.g. en_US, de_DE
 
 class EnhancedSmartAddResponse(BaseModel):
     success: bool
@@ -415,40 +2349,132 @@ class EnhancedSmartAddResponse(BaseModel):
     batch_results: Optional[List[Dict[str, Any]]] = None  # For batch processing
     suggestions: Optional[Dict[str, Any]] = None  # Single item suggestions
     price_estimate: Optional[str] = None
-    expiry_date: Optional[str] = None
+    price_value: Optional[Dict[str, str]] = None  # Structured price: amount, currency
+    expiry_date: Optional[str] = None  # ISO date when it could be parsed
     error_message: Optional[str] = None
+    source: Optional[str] = None  # "barcode" when resolved locally, "ai" otherwise
+    decoded_codes: Optional[List[Dict[str, str]]] = None
+    failed_photos: Optional[List[Dict[str, Any]]] = None  # Parallel batch mode: photos whose analysis failed
+
+# Per-photo time budget in parallel batch mode; slower photos are reported as failed
+SMART_ADD_PHOTO_TIMEOUT = float(os.getenv("SMART_ADD_PHOTO_TIMEOUT", "30"))
+
+def parse_ai_json(response_text: str) -> Dict[str, Any]:
+    """The JSON object in a provider response, fenced in ```json or bare"""
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        json_text = response_text[json_start:json_end].strip()
+    elif "{" in response_text:
+        json_start = response_text.find("{")
+        json_end = response_text.rfind("}") + 1
+        json_text = response_text[json_start:json_end]
+    else:
+        raise ValueError("No JSON found in response")
+    return json.loads(json_text)
 
-@app.post("/enhanced-smart-add/", response_model=EnhancedSmartAddResponse)
+def batch_item_from_ai(item_data: Dict[str, Any]) -> Dict[str, Any]:
+    # Clean custom attributes
+    custom_attrs = item_data.get('custom_attributes', {}) or {}
+    cleaned_attrs = {k: v for k, v in custom_attrs.items() if v and str(v).strip()}
+    return {
+        'name': item_data.get('name', 'Unknown Item'),
+        'category': item_data.get('category', 'Miscellaneous'),
+        'quantity': max(1, int(item_data.get('quantity', 1))),
+        'custom_attributes': cleaned_attrs,
+        'confidence': float(item_data.get('confidence', 0.5))
+    }
+
+async def analyze_photos(provider, prompt: str, images: List[Any],
+                         photos: List[str]) -> Tuple[List[Tuple[int, List[Dict[str, Any]]]], List[Dict[str, Any]]]:
+    """
+    One provider call per photo, at most ai_max_concurrency at once (ai_slots still
+    caps the process-wide concurrency). Each call gets SMART_ADD_PHOTO_TIMEOUT once
+    it holds a slot, so photos queued behind others are not failed for waiting.
+    Returns (photo index, items) for the photos that were analyzed and an error
+    entry for each photo that failed or timed out
+    """
+    # Photos past the slot count wait here instead of parking a worker thread each
+    in_flight = asyncio.Semaphore(settings.ai_max_concurrency)
+
+    async def analyze(index: int) -> List[Dict[str, Any]]:
+        async with in_flight:
+            response_text = await asyncio.to_thread(
+                generate_ai_response, provider, prompt, [images[index]], [photos[index]], SMART_ADD_PHOTO_TIMEOUT,
+            )
+        return [batch_item_from_ai(item_data) for item_data in parse_ai_json(response_text.strip()).get("items", [])]
+
+    outcomes = await asyncio.gather(*(analyze(index) for index in range(len(images))), return_exceptions=True)
+    detections, failures = [], []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, AIProviderTimeout):
+            failures.append({"photo": index, "error": f"Timed out after {SMART_ADD_PHOTO_TIMEOUT:g}s"})
+        elif isinstance(outcome, Exception):
+            failures.append({"photo": index, "error": str(outcome)})
+        else:
+            detections.append((index, outcome))
+    return detections, failures
+
+def detection_key(name: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+
+def merge_photo_detections(detections: List[Tuple[int, List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    One result per distinct item across photos, matched by normalized name.
+    Confidence combines the independent sightings (1 - prod(1 - c)); the quantity
+    is the largest any photo shows, since photos of one shelf show the same units;
+    name, category and attributes prefer the most confident sighting
+    """
+    sightings: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for photo, items in detections:
+        per_photo: Dict[str, Dict[str, Any]] = {}
+        for item in items:
+            key = detection_key(item['name'])
+            if key in per_photo:
+                # Listed twice in one photo: separate units of the same item
+                per_photo[key]['quantity'] += item['quantity']
+                per_photo[key]['confidence'] = max(per_photo[key]['confidence'], item['confidence'])
+            else:
+                per_photo[key] = dict(item)
+        for key, item in per_photo.items():
+            sightings.setdefault(key, []).append((photo, item))
+
+    merged = []
+    for seen in sightings.values():
+        ranked = sorted(seen, key=lambda sighting: sighting[1]['confidence'], reverse=True)
+        best = ranked[0][1]
+        attributes: Dict[str, Any] = {}
+        for _, item in reversed(ranked):
+            attributes.update(item['custom_attributes'])
+        missed = 1.0
+        for _, item in seen:
+            missed *= 1.0 - min(max(item['confidence'], 0.0), 1.0)
+        merged.append({
+            'name': best['name'],
+            'category': best['category'],
+            'quantity': max(item['quantity'] for _, item in seen),
+            'custom_attributes': attributes,
+            'confidence': round(1.0 - missed, 4),
+            'photos': sorted(photo for photo, _ in seen),
+        })
+    return merged
+
+@router.post("/enhanced-smart-add/", response_model=EnhancedSmartAddResponse)
 async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Session = Depends(get_db)):
     """
-    Enhanced SmartAdd with batch processing, price detection, and expiry detection
-    (Simplified version without barcode scanning)
+    Enhanced SmartAdd with batch processing, price detection, and expiry detection.
+    Barcodes / QR codes are decoded locally first; known codes skip the AI call.
     """
     try:
-        # Configure Gemini API
-        api_key = os.getenv("GOOGLE_AI_API_KEY")
-        if not api_key:
-            return EnhancedSmartAddResponse(
-                success=False,
-                confidence=0.0,
-                error_message="Gemini API key not configured"
-            )
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
         # Get existing categories for context
-        existing_categories = db.query(Item.category).distinct().all()
-        categories_list = [cat[0] for cat in existing_categories]
+        categories_list = await asyncio.to_thread(get_categories, db)
         
         # Prepare images for analysis
         images = []
         
         for photo_b64 in request.photos[:5]:  # Max 5 photos for enhanced mode
             try:
-                # Decode base64 image
-                image_data = base64.b64decode(photo_b64.split(',')[1] if ',' in photo_b64 else photo_b64)
-                image = Image.open(io.BytesIO(image_data))
+                image = open_photo(photo_b64)
                 images.append(image)
                 
             except Exception as e:
@@ -458,12 +2484,36 @@ async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Sessi
                     error_message=f"Failed to process image: {str(e)}"
                 )
         
+        # Local barcode / QR decoding: a known code skips the AI call entirely
+        decoded_codes, matched_item = await asyncio.to_thread(resolve_decoded_codes, db, images)
+        if matched_item is not None and not request.batch_mode:
+            return EnhancedSmartAddResponse(
+                success=True,
+                confidence=1.0,
+                suggestions=existing_item_suggestions(matched_item),
+                source="barcode",
+                decoded_codes=[code.to_dict() for code in decoded_codes]
+            )
+        
+        # Resolve the configured AI provider (Gemini, local stub, local vision model)
+        provider = get_ai_provider()
+        if not provider.is_configured():
+            return EnhancedSmartAddResponse(
+                success=False,
+                confidence=0.0,
+                error_message=provider.not_configured_message()
+            )
+        
+        # Visually near-duplicate items from the perceptual-hash index (single item mode)
+        visual_matches = [] if request.batch_mode else await asyncio.to_thread(find_visual_matches, db, images)
+        
         # Enhanced prompt for batch processing and additional features
         if request.batch_mode:
             prompt = f"""
             Analyze these images and identify ALL distinct household inventory items visible. Process each item separately.
             
             Existing categories: {', '.join(categories_list) if categories_list else 'None'}
+            {barcode_prompt_hint(decoded_codes)}
             
             Additional analysis requested:
             - Price detection: {request.detect_price}
@@ -506,6 +2556,7 @@ async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Sessi
             Analyze these images and identify the primary household inventory item.
             
             Existing categories: {', '.join(categories_list) if categories_list else 'None'}
+            {barcode_prompt_hint(decoded_codes)}
             
             Additional analysis requested:
             - Price detection: {request.detect_price}
@@ -537,70 +2588,52 @@ async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Sessi
             - Set confidence based on image clarity and identification certainty
             """
         
-        # Send request to Gemini
-        response = model.generate_content([prompt] + images)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            json_text = response_text[json_start:json_end].strip()
-        elif "{" in response_text:
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            json_text = response_text[json_start:json_end]
+        batch_results = None
+        failed_photos = None
+        if request.batch_mode and request.parallel:
+            # One call per photo: latency follows the slowest photo, and a bad photo only loses its own items
+            detections, failed_photos = await analyze_photos(provider, prompt, images, request.photos)
+            if not detections:
+                return EnhancedSmartAddResponse(
+                    success=False,
+                    confidence=0.0,
+                    error_message="Enhanced SmartAdd analysis failed for every photo",
+                    failed_photos=failed_photos
+                )
+            ai_response: Dict[str, Any] = {}
+            batch_results = merge_photo_detections(detections)
+            overall_confidence = (
+                sum(result['confidence'] for result in batch_results) / len(batch_results) if batch_results else 0.0
+            )
         else:
-            raise ValueError("No JSON found in response")
+            # Send request to the AI provider
+            response_text = (await asyncio.to_thread(generate_ai_response, provider, prompt, images, request.photos)).strip()
+            ai_response = parse_ai_json(response_text)
+            if request.batch_mode and "items" in ai_response:
+                # Process batch results
+                batch_results = [batch_item_from_ai(item_data) for item_data in ai_response["items"]]
+                overall_confidence = float(ai_response.get('overall_confidence', 0.5))
         
-        ai_response = json.loads(json_text)
-        
-        if request.batch_mode and "items" in ai_response:
-            # Process batch results
-            batch_results = []
-            for item_data in ai_response["items"]:
-                # Clean custom attributes
-                custom_attrs = item_data.get('custom_attributes', {})
-                cleaned_attrs = {k: v for k, v in custom_attrs.items() if v and str(v).strip()}
-                
-                processed_item = {
-                    'name': item_data.get('name', 'Unknown Item'),
-                    'category': item_data.get('category', 'Miscellaneous'),
-                    'quantity': max(1, int(item_data.get('quantity', 1))),
-                    'custom_attributes': cleaned_attrs,
-                    'confidence': float(item_data.get('confidence', 0.5))
-                }
-                
-                # Check for similar items
-                similar_items = []
-                suggested_category = processed_item['category']
-                suggested_name = processed_item['name'].lower()
-                
-                if suggested_category:
-                    category_items = db.query(Item).filter(Item.category == suggested_category).all()
-                    for item in category_items:
-                        item_name_lower = item.name.lower()
-                        if (suggested_name in item_name_lower or 
-                            item_name_lower in suggested_name or
-                            len(set(suggested_name.split()) & set(item_name_lower.split())) >= 2):
-                            similar_items.append({
-                                'id': item.id,
-                                'name': item.name,
-                                'quantity': item.quantity,
-                                'category': item.category
-                            })
-                
-                if similar_items:
-                    processed_item['similar_items'] = similar_items
-                
-                batch_results.append(processed_item)
+        if batch_results is not None:
+            await asyncio.to_thread(attach_similar_items, db, batch_results)
+            
+            if request.detect_price or request.detect_expiry:
+                extracted = normalize_price_and_expiry(
+                    [result['custom_attributes'] for result in batch_results],
+                    request.locale, request.detect_price, request.detect_expiry
+                )
+                for result, values in zip(batch_results, extracted):
+                    result.update(values)
             
             return EnhancedSmartAddResponse(
                 success=True,
-                confidence=float(ai_response.get('overall_confidence', 0.5)),
+                confidence=overall_confidence,
                 batch_results=batch_results,
                 price_estimate=ai_response.get('price_estimate', None),
-                expiry_date=ai_response.get('expiry_date', None)
+                expiry_date=ai_response.get('expiry_date', None),
+                source="ai",
+                decoded_codes=[code.to_dict() for code in decoded_codes] or None,
+                failed_photos=failed_photos or None
             )
         else:
             # Single item processing (enhanced existing logic)
@@ -611,11 +2644,18 @@ async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Sessi
             cleaned_attrs = {k: v for k, v in custom_attrs.items() if v and str(v).strip()}
             
             # Extract price and expiry if present
+            price_estimate = None
+            expiry_date = None
             if request.detect_price and 'price' in cleaned_attrs:
-                price_estimate = cleaned_attrs['price']
+                price_estimate = str(cleaned_attrs['price'])
             
             if request.detect_expiry and 'expiry_date' in cleaned_attrs:
-                expiry_date = cleaned_attrs['expiry_date']
+                expiry_date = str(cleaned_attrs['expiry_date'])
+            
+            extracted = normalize_price_and_expiry(
+                [cleaned_attrs], request.locale, request.detect_price, request.detect_expiry
+            )[0]
+            expiry_date = extracted.get('expiry_date', expiry_date)
             
             final_suggestions = {
                 'name': ai_response.get('name', 'Unknown Item'),
@@ -624,34 +2664,19 @@ async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Sessi
                 'custom_attributes': cleaned_attrs
             }
             
-            # Check for existing similar items
-            similar_items = []
-            suggested_category = final_suggestions['category']
-            suggested_name = final_suggestions['name'].lower()
-            
-            if suggested_category:
-                category_items = db.query(Item).filter(Item.category == suggested_category).all()
-                for item in category_items:
-                    item_name_lower = item.name.lower()
-                    if (suggested_name in item_name_lower or 
-                        item_name_lower in suggested_name or
-                        len(set(suggested_name.split()) & set(item_name_lower.split())) >= 2):
-                        similar_items.append({
-                            'id': item.id,
-                            'name': item.name,
-                            'quantity': item.quantity,
-                            'category': item.category
-                        })
-            
-            if similar_items:
-                final_suggestions['similar_items'] = similar_items
+            await asyncio.to_thread(attach_similar_items, db, [final_suggestions])
             
+            attach_unmatched_barcode(final_suggestions, decoded_codes)
+            attach_visual_matches(final_suggestions, visual_matches)
             return EnhancedSmartAddResponse(
                 success=True,
                 confidence=confidence,
                 suggestions=final_suggestions,
                 price_estimate=price_estimate,
-                expiry_date=expiry_date
+                price_value=extracted.get('price'),
+                expiry_date=expiry_date,
+                source="ai",
+                decoded_codes=[code.to_dict() for code in decoded_codes] or None
             )
         
     except Exception as e:
@@ -661,7 +2686,187 @@ async def enhanced_smart_add_analyze(request: EnhancedSmartAddRequest, db: Sessi
             error_message=f"Enhanced SmartAdd analysis failed: {str(e)}"
         )
 
+def create_database_engine(app_settings: Settings, url: Optional[str] = None):
+    url = url or app_settings.database_url
+    if url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # In-memory SQLite uses a single-connection pool without size options
+            return create_engine(url, connect_args=connect_args)
+    else:
+        connect_args = {}
+    return create_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=app_settings.db_pool_size,
+        max_overflow=app_settings.db_max_overflow,
+        pool_timeout=app_settings.db_pool_timeout,
+        pool_recycle=app_settings.db_pool_recycle,
+    )
+
+def configure(app_settings: Settings):
+    """
+    Bind the process-wide engine, session factory, cache and AI call limit to
+    app_settings. Nothing connects here, so it is safe before a fork (gunicorn --preload)
+    """
+    global settings, engine, read_router, cache, ai_slots, media
+    if engine is not None:
+        engine.dispose()
+    if read_router is not None:
+        read_router.dispose()
+    settings = app_settings
+    engine = create_database_engine(app_settings)
+    SessionLocal.configure(bind=engine)
+    read_router = None
+    if app_settings.database_read_urls:
+        read_router = ReplicaRouter(
+            [create_database_engine(app_settings, url) for url in app_settings.database_read_urls],
+            read_your_writes=app_settings.read_your_writes_seconds,
+            max_lag=app_settings.replica_max_lag_seconds,
+            health_interval=app_settings.replica_health_interval,
+        )
+    cache = create_cache(
+        app_settings.cache_backend,
+        ttl=app_settings.cache_ttl,
+        max_entries=app_settings.cache_max_entries,
+        path=app_settings.cache_path,
+        redis_url=app_settings.redis_url,
+    )
+    ai_slots = threading.BoundedSemaphore(app_settings.ai_max_concurrency)
+    media = create_media_storage(
+        app_settings.media_backend,
+        upload_dir=app_settings.upload_dir,
+        qrcode_dir=app_settings.qrcode_dir,
+        bucket=app_settings.s3_bucket,
+        prefix=app_settings.s3_prefix,
+        endpoint_url=app_settings.s3_endpoint_url,
+        region=app_settings.s3_region,
+        public_url=app_settings.s3_public_url,
+        url_ttl=app_settings.media_url_ttl,
+        archive_dir=app_settings.media_archive_dir,
+    )
+
+async def concurrent_write_conflict(request: Request, exc: StaleDataError):
+    # An item's version changed between reading and writing it (optimistic locking)
+    return JSONResponse(status_code=409, content={"detail": "Item was changed by another request; reload and retry"})
+
+# Expensive endpoints (image decode + AI call) guarded by rate_limit.AdmissionMiddleware
+AI_ENDPOINTS = ("/smart-add/", "/enhanced-smart-add/")
+
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the API for app_settings (defaults to Settings.from_env()). One app per
+    process: the engine, cache and indexes are process-wide
+    """
+    app_settings = app_settings or Settings.from_env()
+    configure(app_settings)
+
+    app = FastAPI(title="Stuf - Smart Inventory Management", description="API for managing household items like 3D printer filament, ammunition, IoT supplies, etc.")
+    app.state.settings = app_settings
+    # Smart Add is rate limited and queued before its body is read, so bursts cannot starve the item endpoints.
+    # Added before CORS so rejections still carry the CORS headers
+    app.add_middleware(
+        AdmissionMiddleware,
+        paths=AI_ENDPOINTS,
+        limiter=create_rate_limiter(
+            app_settings.ai_rate_per_minute,
+            app_settings.ai_rate_burst,
+            app_settings.rate_limit_backend,
+            path=app_settings.cache_path,
+            redis_url=app_settings.redis_url,
+        ),
+        gate=AdmissionGate(app_settings.ai_max_active, app_settings.ai_max_queue, app_settings.ai_queue_timeout)
+        if app_settings.ai_max_active > 0 else None,
+    )
+    app.add_middleware(CompressionMiddleware, min_size=app_settings.compression_min_size)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(app_settings.cors_origins),  # Environment-configurable origins
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Serve media: straight from disk, or by redirecting to the storage service
+    if isinstance(media, LocalStorage):
+        for prefix in MEDIA_PREFIXES:
+            os.makedirs(media.directories[prefix], exist_ok=True)
+            app.mount(f"/{prefix}", StaticFiles(directory=media.directories[prefix]), name=prefix)
+    else:
+        for prefix in MEDIA_PREFIXES:
+            app.add_api_route(f"/{prefix}/{{name}}", media_redirect(prefix), methods=["GET"], include_in_schema=False)
+    app.include_router(router)
+    app.add_exception_handler(StaleDataError, concurrent_write_conflict)
+
+    # Migrations first so later startup hooks see the current schema
+    app.add_event_handler("startup", migrate_on_startup)
+    if app_settings.background_jobs:
+        app.add_event_handler("startup", start_expiry_sweeps)
+        # Normally left to the --worker process, so API workers don't all scan for missing QR codes
+        if app_settings.qr_backfill_on_startup:
+            app.add_event_handler("startup", start_qr_backfill)
+    # Persist the embedding matrix (when EMBEDDING_INDEX_PATH is set) so the next start maps it
+    app.add_event_handler("shutdown", semantic_index.save)
+    return app
+
+async def run_worker():
+    """Background jobs without the HTTP API, for a separate worker process"""
+    migrate_on_startup()
+    await run_qr_backfill()
+    sweeps = []
+    if settings.expiry_sweep_interval > 0:
+        sweeps.append(run_expiry_sweeps())
+    if MEDIA_GC_MODE != "off" and MEDIA_GC_INTERVAL > 0:
+        sweeps.append(run_media_gc_sweeps())
+    await asyncio.gather(*sweeps)
+
+def __getattr__(name: str):
+    # `uvicorn main:app` builds the app on first access. Importing main (tests, scripts, alembic,
+    # `uvicorn --factory main:create_app`) builds nothing and needs no DATABASE_URL
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Stuf API server")
+    parser.add_argument("--migrate", action="store_true", help="apply pending database migrations and exit")
+    parser.add_argument("--backfill-qr-codes", action="store_true", help="render missing item QR codes and exit")
+    parser.add_argument("--worker", action="store_true",
+                        help="run background jobs (QR backfill, expiry sweeps, MEDIA_GC_MODE media GC) "
+                             "without serving the API")
+    parser.add_argument("--media-gc", action="store_true",
+                        help="remove uploads and QR codes no item uses, print the report and exit")
+    parser.add_argument("--archive", action="store_true", help="with --media-gc: archive orphans instead of deleting")
+    parser.add_argument("--dry-run", action="store_true", help="with --media-gc: only report what would be reclaimed")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print an import / startup / first-request time breakdown and exit")
+    args = parser.parse_args()
+
+    if args.startup_report:
+        from startup_report import run_report
+        sys.exit(run_report())
+    configure(Settings.from_env())
+    if args.migrate or args.backfill_qr_codes:
+        if args.migrate:
+            print("Migrated" if upgrade_database() else "Schema already current")
+        if args.backfill_qr_codes:
+            backfill_qr_codes()
+        sys.exit(0)
+    if args.media_gc:
+        report = collect_orphaned_media(archive=args.archive, dry_run=args.dry_run)
+        if report is None:
+            sys.exit("Media GC is already running")
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+    if args.worker:
+        asyncio.run(run_worker())
+        sys.exit(0)
+
     import uvicorn
     # Run the server on all interfaces (0.0.0.0) so it's accessible from mobile devices
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(create_app(settings), host="0.0.0.0", port=8000)
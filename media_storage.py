@@ -0,0 +1,379 @@
+"""
+Media storage for uploaded photos and QR codes.
+
+Media is addressed by key ("uploads/shelf.jpg", "qrcodes/12.png") and items keep
+the matching URL path ("/uploads/shelf.jpg"), so stored URLs stay valid when the
+backend changes:
+
+    MEDIA_BACKEND     local (default) | s3
+    UPLOAD_DIR        local directory for uploads/ keys (./uploads)
+    QRCODE_DIR        local directory for qrcodes/ keys (./qrcodes)
+    S3_BUCKET         bucket used by the s3 backend
+    S3_ENDPOINT_URL   S3-compatible endpoint (MinIO, R2, ...); unset for AWS
+    S3_REGION         bucket region
+    S3_PREFIX         key prefix inside the bucket, to share one bucket between deployments
+    S3_PUBLIC_URL     base URL of a publicly readable bucket; media URLs point there
+                      instead of being presigned
+    MEDIA_URL_TTL     lifetime of presigned download and upload URLs in seconds (3600)
+    MEDIA_ARCHIVE_DIR local directory archived media is moved to (./media-archive); the
+                      s3 backend archives under archive/ in the bucket instead
+
+Credentials for s3 come from boto3's usual chain (AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY, a profile, or an instance role).
+
+With `local` the API serves /uploads and /qrcodes from disk, which ties media to
+one host. With `s3` those paths redirect to presigned (or public) bucket URLs
+and clients can upload straight to the bucket (POST /upload/presign), so media
+bytes never pass through an API worker. Backends implement blocking methods for
+sync endpoints and worker threads; the async methods run them off the event
+loop. Writes stream in chunks (a multipart upload on S3) and only become
+visible once complete.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterable, Dict, Iterator, List, NamedTuple, Optional
+
+DEFAULT_URL_TTL = 3600
+CHUNK_SIZE = 1024 * 1024
+# S3 parts must be at least 5 MiB, except the last one
+S3_PART_SIZE = 8 * 1024 * 1024
+
+
+class MediaObject(NamedTuple):
+    key: str
+    size: int
+    modified: float  # unix time
+
+
+class MediaWriter(ABC):
+    """One chunked object write; nothing appears under the key until commit()"""
+
+    @abstractmethod
+    def write(self, chunk: bytes):
+        ...
+
+    @abstractmethod
+    def commit(self):
+        ...
+
+    @abstractmethod
+    def abort(self):
+        ...
+
+
+class MediaStorage(ABC):
+    """Base class: subclasses implement the abstract blocking object operations"""
+
+    name = "base"
+
+    def __init__(self, url_ttl: int = DEFAULT_URL_TTL):
+        self.url_ttl = url_ttl
+
+    @abstractmethod
+    def open_writer(self, key: str, content_type: Optional[str] = None) -> MediaWriter:
+        ...
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[MediaObject]:
+        """Objects under prefix/ in key order, after start_after when given, read page by page"""
+
+    @abstractmethod
+    def archive(self, key: str):
+        """Move an object out of the served media, keeping its bytes for recovery"""
+
+    def download_url(self, key: str) -> Optional[str]:
+        """Where clients fetch the object directly, or None when the API serves it"""
+        return None
+
+    def upload_url(self, key: str, content_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """A request clients can send the object with directly, or None when unsupported"""
+        return None
+
+    def write_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        writer = self.open_writer(key, content_type)
+        try:
+            writer.write(data)
+            writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+
+    async def save(self, key: str, chunks: AsyncIterable[bytes], content_type: Optional[str] = None) -> int:
+        """Stream chunks into key without holding the whole object; returns its size"""
+        writer = await asyncio.to_thread(self.open_writer, key, content_type)
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                await asyncio.to_thread(writer.write, chunk)
+            await asyncio.to_thread(writer.commit)
+        except BaseException:
+            await asyncio.to_thread(writer.abort)
+            raise
+        return size
+
+    async def save_bytes(self, key: str, data: bytes, content_type: Optional[str] = None):
+        await asyncio.to_thread(self.write_bytes, key, data, content_type)
+
+    async def load(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.read, key)
+
+    async def remove(self, key: str):
+        await asyncio.to_thread(self.delete, key)
+
+
+class _FileWriter(MediaWriter):
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", delete=False)
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.file.name, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+
+class LocalStorage(MediaStorage):
+    """Files on this host's disk, one directory per key prefix"""
+
+    name = "local"
+
+    def __init__(self, directories: Dict[str, str], archive_dir: str = "media-archive", url_ttl: int = DEFAULT_URL_TTL):
+        super().__init__(url_ttl)
+        self.directories = directories
+        self.archive_dir = archive_dir
+
+    def path(self, key: str) -> str:
+        prefix, _, name = key.partition("/")
+        directory = self.directories.get(prefix)
+        if directory is None or not name or name != os.path.basename(name) or name.startswith("."):
+            raise ValueError(f"Invalid media key: {key!r}")
+        return os.path.join(directory, name)
+
+    def open_writer(self, key: str, content_type: Optional[str] = None) -> MediaWriter:
+        return _FileWriter(self.path(key))
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[MediaObject]:
+        directory = self.directories[prefix]
+        try:
+            # Names only (temporary .upload- files excluded); sizes are read as the listing is consumed
+            names = sorted(entry.name for entry in os.scandir(directory)
+                           if not entry.name.startswith(".") and entry.is_file())
+        except FileNotFoundError:
+            return
+        for name in names:
+            key = f"{prefix}/{name}"
+            if start_after is not None and key <= start_after:
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            yield MediaObject(key, stat.st_size, stat.st_mtime)
+
+    def archive(self, key: str):
+        prefix, _, name = key.partition("/")
+        source = self.path(key)
+        target = os.path.join(self.archive_dir, prefix)
+        os.makedirs(target, exist_ok=True)
+        # Outside the served directories; shutil.move copies when the archive is on another disk
+        try:
+            shutil.move(source, os.path.join(target, name))
+        except FileNotFoundError:
+            pass  # already archived or deleted
+
+
+def _missing(error: Exception) -> bool:
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("NoSuchKey", "NotFound", "404")
+
+
+class _MultipartWriter(MediaWriter):
+    """Buffers up to one part; small objects become a single put_object"""
+
+    def __init__(self, storage: "S3Storage", key: str, content_type: Optional[str]):
+        self.storage = storage
+        self.key = key
+        self.extra = {"ContentType": content_type} if content_type else {}
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts: List[Dict[str, Any]] = []
+
+    def _upload_part(self, body: bytes):
+        client, bucket = self.storage.client, self.storage.bucket
+        if self.upload_id is None:
+            self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=self.key, **self.extra)["UploadId"]
+        number = len(self.parts) + 1
+        response = client.upload_part(Bucket=bucket, Key=self.key, UploadId=self.upload_id,
+                                      PartNumber=number, Body=body)
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def write(self, chunk: bytes):
+        self.buffer += chunk
+        while len(self.buffer) >= S3_PART_SIZE:
+            self._upload_part(bytes(self.buffer[:S3_PART_SIZE]))
+            del self.buffer[:S3_PART_SIZE]
+
+    def commit(self):
+        client, bucket = self.storage.client, self.storage.bucket
+        if self.upload_id is None:
+            client.put_object(Bucket=bucket, Key=self.key, Body=bytes(self.buffer), **self.extra)
+            return
+        if self.buffer:
+            self._upload_part(bytes(self.buffer))
+        client.complete_multipart_upload(Bucket=bucket, Key=self.key, UploadId=self.upload_id,
+                                         MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.storage.client.abort_multipart_upload(Bucket=self.storage.bucket, Key=self.key,
+                                                       UploadId=self.upload_id)
+
+
+class S3Storage(MediaStorage):
+    """An S3 bucket (or an S3-compatible service such as MinIO)"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, public_url: Optional[str] = None,
+                 url_ttl: int = DEFAULT_URL_TTL, client: Any = None):
+        super().__init__(url_ttl)
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        self.public_url = public_url.rstrip("/") if public_url else None
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    def open_writer(self, key: str, content_type: Optional[str] = None) -> MediaWriter:
+        return _MultipartWriter(self, self.object_key(key), content_type)
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if _missing(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if _missing(e):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[MediaObject]:
+        options = {"Bucket": self.bucket, "Prefix": self.object_key(f"{prefix}/")}
+        if start_after is not None:
+            options["StartAfter"] = self.object_key(start_after)
+        for page in self.client.get_paginator("list_objects_v2").paginate(**options):
+            for entry in page.get("Contents", []):
+                yield MediaObject(entry["Key"][len(self.prefix):], entry["Size"], entry["LastModified"].timestamp())
+
+    def archive(self, key: str):
+        # The media routes only resolve uploads/ and qrcodes/ keys, so archive/ is never served
+        try:
+            self.client.copy_object(Bucket=self.bucket, Key=self.object_key(f"archive/{key}"),
+                                    CopySource={"Bucket": self.bucket, "Key": self.object_key(key)})
+        except Exception as e:
+            if _missing(e):
+                return  # already archived or deleted
+            raise
+        self.delete(key)
+
+    def download_url(self, key: str) -> Optional[str]:
+        if self.public_url:
+            return f"{self.public_url}/{self.object_key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.object_key(key)}, ExpiresIn=self.url_ttl
+        )
+
+    def upload_url(self, key: str, content_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        params = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        headers = {}
+        if content_type:
+            params["ContentType"] = content_type
+            headers["Content-Type"] = content_type
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=self.url_ttl)
+        return {"url": url, "method": "PUT", "headers": headers, "expires_in": self.url_ttl}
+
+
+def create_media_storage(backend: Optional[str] = None, upload_dir: Optional[str] = None,
+                         qrcode_dir: Optional[str] = None, bucket: Optional[str] = None,
+                         prefix: Optional[str] = None, endpoint_url: Optional[str] = None,
+                         region: Optional[str] = None, public_url: Optional[str] = None,
+                         url_ttl: Optional[int] = None, archive_dir: Optional[str] = None) -> MediaStorage:
+    """Build the backend selected by MEDIA_BACKEND; arguments override the environment"""
+    backend = (backend or os.getenv("MEDIA_BACKEND", "local")).lower()
+    url_ttl = url_ttl if url_ttl is not None else int(os.getenv("MEDIA_URL_TTL", str(DEFAULT_URL_TTL)))
+
+    if backend == "s3":
+        bucket = bucket or os.getenv("S3_BUCKET")
+        if not bucket:
+            # Unlike the cache there is no safe fallback: media written locally is lost to other hosts
+            raise RuntimeError("MEDIA_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(
+            bucket,
+            prefix=prefix if prefix is not None else os.getenv("S3_PREFIX", ""),
+            endpoint_url=endpoint_url or os.getenv("S3_ENDPOINT_URL") or None,
+            region=region or os.getenv("S3_REGION") or None,
+            public_url=public_url or os.getenv("S3_PUBLIC_URL") or None,
+            url_ttl=url_ttl,
+        )
+    return LocalStorage({
+        "uploads": upload_dir or os.getenv("UPLOAD_DIR", "uploads"),
+        "qrcodes": qrcode_dir or os.getenv("QRCODE_DIR", "qrcodes"),
+    }, archive_dir=archive_dir or os.getenv("MEDIA_ARCHIVE_DIR", "media-archive"), url_ttl=url_ttl)
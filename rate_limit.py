@@ -0,0 +1,298 @@
+"""
+Rate limiting and admission control for the expensive endpoints.
+
+Smart Add requests carry large bodies, decode images and wait on a remote model,
+so a few busy clients could otherwise take every worker from the cheap item
+endpoints. AdmissionMiddleware guards the configured paths before the body is
+read:
+
+  1. a token bucket per client (API key from X-API-Key, else client address)
+     answers 429 with Retry-After once the client's burst is spent
+  2. an admission gate caps the guarded requests running at once in this
+     process; extra requests wait in a bounded FIFO queue and get 503 with
+     Retry-After when the queue is full or their wait runs out
+
+    AI_RATE_PER_MINUTE   sustained Smart Add requests per client (0 disables the limit)
+    AI_RATE_BURST        requests a client may make back to back
+    AI_MAX_ACTIVE        Smart Add requests running at once per process (0 disables the gate)
+    AI_MAX_QUEUE         requests allowed to wait for a slot
+    AI_QUEUE_TIMEOUT     seconds a request waits for a slot before 503
+    RATE_LIMIT_BACKEND   memory (default, per process) | sqlite | redis
+
+`sqlite` (CACHE_PATH) and `redis` (REDIS_URL) share the buckets between workers
+so a client's limit holds across the pool. Behind a reverse proxy run uvicorn
+with --proxy-headers so client addresses are the real ones.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Iterable, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> Tuple[float, float]:
+    """Take one token from a bucket: (tokens left, seconds to wait; 0 when allowed)"""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class RateLimiter(ABC):
+    """Base class: token buckets of `burst` tokens refilled at `per_minute`"""
+
+    name = "base"
+    # Backends doing I/O are called from a worker thread, off the event loop
+    blocking = False
+
+    def __init__(self, per_minute: float, burst: int, clock: Callable[[], float] = time.time):
+        self.rate = per_minute / 60.0
+        self.burst = float(max(1, burst))
+        self.clock = clock
+
+    @abstractmethod
+    def take(self, key: str) -> float:
+        """Spend a token for key; returns 0 when allowed, else seconds until one is available"""
+
+    async def take_async(self, key: str) -> float:
+        if self.blocking:
+            return await asyncio.to_thread(self.take, key)
+        return self.take(key)
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Buckets in this process; the least recently seen clients are forgotten past max_entries"""
+
+    name = "memory"
+
+    def __init__(self, per_minute: float, burst: int, max_entries: int = 10000, clock: Callable[[], float] = time.time):
+        super().__init__(per_minute, burst, clock)
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens, wait = refill(tokens, updated, now, self.rate, self.burst)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Buckets in a shared SQLite file, so all workers on a host share each client's limit"""
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, per_minute: float, burst: int, path: str = "cache.sqlite3", clock: Callable[[], float] = time.time):
+        super().__init__(per_minute, burst, clock)
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str) -> float:
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, so concurrent workers serialize the read-modify-write
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self.clock()
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = refill(*(row or (self.burst, now)), now, self.rate, self.burst)
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            # Buckets that have refilled completely carry no state; drop them now and then
+            self._takes += 1
+            if self._takes % 500 == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.burst / self.rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RedisRateLimiter(RateLimiter):
+    """Buckets in Redis, updated atomically by a script; shared by every host"""
+
+    name = "redis"
+    blocking = True
+
+    SCRIPT = """
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, per_minute: float, burst: int, url: str = "redis://localhost:6379/0"):
+        super().__init__(per_minute, burst)
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key: str) -> float:
+        return float(self._script(keys=[f"__rate__:{key}"], args=[self.rate, self.burst]))
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionGate:
+    """
+    At most max_active holders at once; up to max_waiting more queue in arrival
+    order for at most max_wait seconds. Released slots pass straight to the
+    next waiter
+    """
+
+    def __init__(self, max_active: int, max_waiting: int, max_wait: float):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (tests, worker restart): state of the old one is gone
+            self._loop = loop
+            self.active = 0
+            self._waiters = deque()
+        return loop
+
+    async def acquire(self):
+        loop = self._bind()
+        if self.active < self.max_active and not self.waiting:
+            self.active += 1
+            return
+        if self.waiting >= self.max_waiting:
+            raise Overloaded(self.max_wait, "queue full")
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            raise Overloaded(self.max_wait, "timed out waiting for a slot") from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the client went away
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def client_key(scope) -> str:
+    """API key when the client sends one (hashed, never stored raw), else its address"""
+    for name, value in scope.get("headers", ()):
+        if name == b"x-api-key" and value:
+            return "key:" + hashlib.sha256(value).hexdigest()[:32]
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the limiter and the gate to `paths` before the app reads the body"""
+
+    def __init__(self, app, paths: Iterable[str], limiter: Optional[RateLimiter] = None,
+                 gate: Optional[AdmissionGate] = None):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.limiter = limiter
+        self.gate = gate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        if self.limiter is not None:
+            try:
+                wait = await self.limiter.take_async(client_key(scope))
+            except Exception as e:
+                # A broken shared store must not take the endpoints down with it
+                logger.warning("Rate limiter unavailable: %s", e)
+                wait = 0.0
+            if wait > 0:
+                await self._reject(scope, receive, send, 429, wait, "Rate limit exceeded; retry later")
+                return
+        if self.gate is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.gate.acquire()
+        except Overloaded as e:
+            await self._reject(scope, receive, send, 503, e.retry_after, f"Server busy ({e.reason}); retry later")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.gate.release()
+
+    @staticmethod
+    async def _reject(scope, receive, send, status: int, retry_after: float, detail: str):
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+        await JSONResponse({"detail": detail}, status_code=status, headers=headers)(scope, receive, send)
+
+
+def create_rate_limiter(per_minute: float, burst: int, backend: Optional[str] = None,
+                        path: Optional[str] = None, redis_url: Optional[str] = None) -> Optional[RateLimiter]:
+    """The limiter selected by RATE_LIMIT_BACKEND, or None when per_minute is 0"""
+    if per_minute <= 0:
+        return None
+    backend = (backend or os.getenv("RATE_LIMIT_BACKEND", "memory")).lower()
+    if backend == "redis":
+        try:
+            return RedisRateLimiter(per_minute, burst, redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        except Exception as e:
+            logger.warning("Redis rate limiter unavailable (%s), falling back to sqlite", e)
+            backend = "sqlite"
+    if backend == "sqlite":
+        return SQLiteRateLimiter(per_minute, burst, path or os.getenv("CACHE_PATH", "cache.sqlite3"))
+    return MemoryRateLimiter(per_minute, burst)
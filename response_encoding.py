@@ -0,0 +1,168 @@
+"""
+Response compression and the compact item list format.
+
+CompressionMiddleware compresses responses with the best encoding the client
+accepts (Accept-Encoding, q-values honored) once they pass a size threshold:
+
+    COMPRESSION_MIN_SIZE   smallest body worth compressing, in bytes (1024; 0 disables)
+
+zstd and br are offered when the zstandard / brotli packages are installed; gzip
+always is. Streamed responses (the change feed, static media) pass through
+untouched, and large bodies are compressed off the event loop.
+
+Item lists can also be requested as MessagePack with `Accept: application/msgpack`.
+The body is columnar, so field names are sent once instead of once per item:
+
+    {"columns": ["id", "name", ...], "rows": [[1, "PLA", ...], [2, "PETG", ...]]}
+
+That needs the msgpack package; without it the endpoints answer in JSON, so
+clients should check the response Content-Type.
+"""
+import asyncio
+import gzip
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+# Server preference when the client accepts several encodings equally
+ENCODING_PREFERENCE = ("zstd", "br", "gzip")
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/x-msgpack",
+                      "application/javascript", "image/svg+xml", "text/")
+# Compressing a few megabytes takes tens of milliseconds; do that in a thread
+OFFLOAD_SIZE = 256 * 1024
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output deterministic, so identical bodies compress identically
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def available_codecs() -> Dict[str, Callable[[bytes], bytes]]:
+    codecs: Dict[str, Callable[[bytes], bytes]] = {"gzip": _gzip}
+    try:
+        import brotli
+
+        # Quality 5 is most of brotli's gain at a fraction of the default (11) cost
+        codecs["br"] = lambda data: brotli.compress(data, quality=5)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+
+        # Compressor objects are not thread-safe, so one per call (they are cheap)
+        codecs["zstd"] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+    except ImportError:
+        pass
+    return codecs
+
+
+def parse_qualities(header: Optional[str]) -> Dict[str, float]:
+    """{"gzip": 1.0, "br": 0.5, ...} from an Accept / Accept-Encoding header"""
+    qualities: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, *params = [piece.strip() for piece in part.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: Optional[str], codecs) -> Optional[str]:
+    qualities = parse_qualities(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in codecs:
+            continue
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete (non-streamed) responses per Accept-Encoding"""
+
+    def __init__(self, app, min_size: int = 1024):
+        self.app = app
+        self.min_size = min_size
+        self.codecs = available_codecs()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.min_size <= 0:
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"), self.codecs)
+        start: Optional[Dict[str, Any]] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if compressible(headers.get("content-type")):
+                # Caches must keep the encodings apart even when this response is not compressed
+                headers.add_vary_header("Accept-Encoding")
+            if (encoding is None or message.get("more_body", False) or "content-encoding" in headers
+                    or not compressible(headers.get("content-type")) or len(body) < self.min_size):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            codec = self.codecs[encoding]
+            body = await asyncio.to_thread(codec, body) if len(body) > OFFLOAD_SIZE else codec(body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """Whether the client prefers MessagePack over JSON"""
+    qualities = parse_qualities(accept)
+    msgpack_quality = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return msgpack_quality > 0 and msgpack_quality >= qualities.get("application/json", 0.0)
+
+
+def msgpack_available() -> bool:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def columnar(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rows of one shape as column names once plus a value array per row"""
+    columns = list(rows[0]) if rows else []
+    return {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        import msgpack
+
+        return msgpack.packb(content, use_bin_type=True)
@@ -0,0 +1,340 @@
+"""
+Embedding index for semantic item search.
+
+Item text (name, category, attribute values) is embedded into a float32 vector
+and all vectors live in one contiguous (n, dim) NumPy matrix, so a batch of
+queries is a single matrix product followed by a top-k partition.
+
+Embedders:
+
+    HashedNgramEmbedder     default; word and character trigram features hashed
+                            into `dim` buckets (no model download, deterministic)
+    SentenceTransformerEmbedder
+                            used when EMBEDDING_MODEL names a sentence-transformers
+                            model and the package is installed
+
+The index is kept current incrementally: writes in this process upsert single
+rows, and `sync()` compares a digest of each item's text with the stored digest
+so only changed items are re-embedded. The first sync reads every item; after
+another worker's writes (shared version bump) only items changed since the
+index's watermark are read. With a path configured, the matrix is
+saved as .npy files and memory-mapped (copy-on-write) on the next start
+instead of being rebuilt.
+
+NumPy, the embedder and any saved matrix are loaded on first use, not at import.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+class HashedNgramEmbedder:
+    """Signed feature hashing of word unigrams, word bigrams and character trigrams"""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashed-ngram-{dim}"
+        self._features: Dict[str, Tuple[int, float]] = {}
+
+    def _feature(self, feature: str) -> Tuple[int, float]:
+        cached = self._features.get(feature)
+        if cached is None:
+            h = zlib.crc32(feature.encode("utf-8"))
+            cached = (h % self.dim, 1.0 if (h >> 31) & 1 else -1.0)
+            if len(self._features) < 200_000:
+                self._features[feature] = cached
+        return cached
+
+    def _features_for(self, text: str) -> List[Tuple[str, float]]:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        features: List[Tuple[str, float]] = [("w:" + word, 1.0) for word in words]
+        features.extend(("b:" + a + " " + b, 0.5) for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(("c:" + padded[i:i + 3], 0.3) for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: Sequence[str]):
+        import numpy as np
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vector = matrix[row]
+            for feature, weight in self._features_for(text):
+                index, sign = self._feature(feature)
+                vector[index] += sign * weight
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(model_name)
+        self.dim = int(self._model.get_sentence_embedding_dimension())
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: Sequence[str]):
+        import numpy as np
+
+        vectors = self._model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+
+
+def create_embedder(model_name: Optional[str] = None):
+    model_name = model_name if model_name is not None else os.getenv("EMBEDDING_MODEL")
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            logger.warning("Embedding model %s unavailable (%s), using hashed n-grams", model_name, e)
+    return HashedNgramEmbedder(int(os.getenv("EMBEDDING_DIM", "512")))
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little") >> 1
+
+
+class EmbeddingIndex:
+    """Contiguous float32 matrix of item embeddings with incremental updates"""
+
+    def __init__(self, embedder=None, path: Optional[str] = None,
+                 version: Callable[[], int] = lambda: 0, ttl: float = 300.0,
+                 embedder_factory: Callable[[], Any] = HashedNgramEmbedder):
+        self.embedder = embedder
+        self._embedder_factory = embedder_factory
+        self.path = path
+        self._version = version
+        self.ttl = ttl
+        self._synced = False
+        self._synced_version = 0
+        self._synced_at = 0.0
+        self._watermark: Any = None
+        self._lock = threading.RLock()
+        self._ready = False
+        self.count = 0
+
+    def _ensure_ready(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if self.embedder is None:
+                self.embedder = self._embedder_factory()
+            self._reset()
+            if self.path:
+                self._load()
+            self._ready = True
+
+    def _reset(self):
+        import numpy as np
+
+        self.count = 0
+        self._vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._digests = np.zeros(0, dtype=np.int64)
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    # -- persistence -------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{self.embedder.name}.{name}.npy")
+
+    def _load(self):
+        import numpy as np
+
+        try:
+            ids = np.load(self._file("ids"))
+            digests = np.load(self._file("digests"))
+            # Copy-on-write mapping: pages are shared with the OS cache until modified
+            vectors = np.load(self._file("vectors"), mmap_mode="c")
+        except (OSError, ValueError):
+            return
+        if vectors.shape != (len(ids), self.embedder.dim) or len(digests) != len(ids):
+            return
+        with self._lock:
+            self._vectors, self._ids, self._digests = vectors, ids, digests
+            self.count = len(ids)
+            self._rows = {int(item_id): row for row, item_id in enumerate(ids.tolist())}
+
+    def save(self):
+        if not self.path or not self._ready:
+            return
+        import numpy as np
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            arrays = {
+                "ids": self._ids[:self.count],
+                "digests": self._digests[:self.count],
+                "vectors": np.ascontiguousarray(self._vectors[:self.count]),
+            }
+        for name, array in arrays.items():
+            tmp = self._file(name) + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, self._file(name))
+
+    # -- updates -----------------------------------------------------------
+
+    def _grow(self, needed: int):
+        import numpy as np
+
+        capacity = len(self._ids)
+        if needed <= capacity:
+            if not self._vectors.flags.writeable:
+                self._vectors = np.array(self._vectors)
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        vectors = np.zeros((new_capacity, self.embedder.dim), dtype=np.float32)
+        vectors[:self.count] = self._vectors[:self.count]
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        ids[:self.count] = self._ids[:self.count]
+        digests = np.zeros(new_capacity, dtype=np.int64)
+        digests[:self.count] = self._digests[:self.count]
+        self._vectors, self._ids, self._digests = vectors, ids, digests
+
+    def upsert_many(self, documents: Dict[int, str]):
+        if not documents:
+            return
+        self._ensure_ready()
+        item_ids = list(documents)
+        vectors = self.embedder.embed([documents[item_id] for item_id in item_ids])
+        with self._lock:
+            self._grow(self.count + len(item_ids))
+            for item_id, vector in zip(item_ids, vectors):
+                row = self._rows.get(item_id)
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self._rows[item_id] = row
+                    self._ids[row] = item_id
+                self._vectors[row] = vector
+                self._digests[row] = _digest(documents[item_id])
+
+    def upsert(self, item_id: int, text: str):
+        self.upsert_many({item_id: text})
+
+    def remove(self, item_id: int):
+        """Swap the last row into the freed slot so the matrix stays contiguous"""
+        self._ensure_ready()
+        with self._lock:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                return
+            self._grow(self.count)
+            last = self.count - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = moved_id
+                self._digests[row] = self._digests[last]
+                self._rows[moved_id] = row
+            self.count -= 1
+
+    def clear(self):
+        with self._lock:
+            self._ready = False
+            self._synced = False
+            self._watermark = None
+            self.count = 0
+
+    def _fresh(self, version: int) -> bool:
+        return self._synced and version == self._synced_version and time.monotonic() - self._synced_at < self.ttl
+
+    def ensure_synced(self, loader: Callable[[Any], Tuple[Dict[int, str], Any]]):
+        """
+        Sync on first use, after a shared version bump or ttl expiry. loader(since)
+        returns (documents, watermark): every item when since is None, otherwise
+        only the items changed since the watermark of the previous sync
+        """
+        version = self._version()
+        if self._fresh(version):
+            return
+        with self._lock:
+            if self._fresh(version):
+                return
+            since = self._watermark if self._synced else None
+            documents, watermark = loader(since)
+            if self.sync(documents, complete=since is None):
+                self.save()
+            self._watermark = watermark
+            self._synced = True
+            self._synced_version = version
+            self._synced_at = time.monotonic()
+
+    def sync(self, documents: Dict[int, str], complete: bool = True) -> int:
+        """
+        Bring the index in line with documents, re-embedding only changed texts.
+        With complete=False documents holds only changed items and nothing is removed
+        """
+        self._ensure_ready()
+        with self._lock:
+            stale = [item_id for item_id in self._rows if item_id not in documents] if complete else []
+            for item_id in stale:
+                self.remove(item_id)
+            changed = {
+                item_id: text for item_id, text in documents.items()
+                if item_id not in self._rows or int(self._digests[self._rows[item_id]]) != _digest(text)
+            }
+            self.upsert_many(changed)
+        return len(changed) + len(stale)
+
+    # -- queries -----------------------------------------------------------
+
+    def search(self, queries: Iterable[str], k: int = 10, min_score: float = 0.0,
+               candidates: Optional[Iterable[int]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Batched cosine top-k: one matrix product for all queries. With candidates
+        only those item ids are scored, so a filtered search still finds k matches
+        """
+        import numpy as np
+
+        queries = list(queries)
+        if not queries:
+            return []
+        self._ensure_ready()
+        query_vectors = self.embedder.embed(queries)
+        with self._lock:
+            if candidates is None:
+                vectors, ids = self._vectors[:self.count], self._ids[:self.count].copy()
+            else:
+                rows = np.fromiter((self._rows[item_id] for item_id in candidates if item_id in self._rows),
+                                   dtype=np.int64)
+                vectors, ids = self._vectors[rows], self._ids[rows]
+            if len(ids) == 0:
+                return [[] for _ in queries]
+            scores = query_vectors @ vectors.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([
+                (int(ids[col]), float(scores[row, col]))
+                for col in ordered if scores[row, col] >= min_score
+            ])
+        return results
+
+
+def item_text(name: str, category: str, custom_attributes: Optional[Dict[str, Any]]) -> str:
+    """Text embedded for an item: name, category and attribute values"""
+    values = " ".join(str(value) for value in (custom_attributes or {}).values() if value not in (None, ""))
+    return f"{name} {category} {values}".strip()
@@ -0,0 +1,129 @@
+"""
+Typed deployment settings.
+
+Settings.from_env() reads the environment variables documented in the README.
+main.create_app(settings) takes a Settings, so API workers and background
+workers can run from the same code with different resource profiles:
+
+    # API process: bigger pool, no background jobs
+    api = create_app(Settings.from_env().replace(db_pool_size=20, background_jobs=False))
+
+    # Worker process: small pool, runs the QR backfill and expiry sweeps
+    python main.py --worker
+
+Feature tuning (match thresholds, alert windows, extraction locale) stays in
+the environment variables next to the code that uses it.
+"""
+import dataclasses
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+def _bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str
+    # SQLAlchemy connection pool (ignored for in-memory SQLite)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    # Read replicas for read-only endpoints, see db_routing.py
+    database_read_urls: Tuple[str, ...] = ()
+    read_your_writes_seconds: float = 5.0
+    replica_max_lag_seconds: float = 10.0
+    replica_health_interval: float = 5.0
+    # Shared cache, see cache.py
+    cache_backend: str = "none"
+    cache_ttl: int = 300
+    cache_max_entries: int = 1024
+    cache_path: str = "cache.sqlite3"
+    redis_url: str = "redis://localhost:6379/0"
+    # Simultaneous AI provider calls per process
+    ai_max_concurrency: int = 4
+    # Smart Add admission control, see rate_limit.py
+    ai_rate_per_minute: float = 60.0
+    ai_rate_burst: int = 20
+    ai_max_active: int = 8
+    ai_max_queue: int = 32
+    ai_queue_timeout: float = 15.0
+    rate_limit_backend: str = "memory"
+    # Media storage, see media_storage.py; the local directories are served under /uploads and /qrcodes
+    media_backend: str = "local"
+    upload_dir: str = "uploads"
+    qrcode_dir: str = "qrcodes"
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = ""
+    s3_endpoint_url: Optional[str] = None
+    s3_region: Optional[str] = None
+    s3_public_url: Optional[str] = None
+    media_url_ttl: int = 3600
+    media_archive_dir: str = "media-archive"
+    # Smallest response body worth compressing (0 disables), see response_encoding.py
+    compression_min_size: int = 1024
+    debug: bool = True
+    allowed_origins: Tuple[str, ...] = ("*",)
+    auto_migrate: bool = True
+    # Expiry sweeps in the API process; turn off in API-only processes
+    background_jobs: bool = True
+    # Missing QR codes are rendered by `python main.py --worker`; this also starts the backfill in API processes
+    qr_backfill_on_startup: bool = False
+    expiry_sweep_interval: int = 3600
+
+    @property
+    def cors_origins(self) -> Tuple[str, ...]:
+        return ("*",) if self.debug else self.allowed_origins
+
+    def replace(self, **changes) -> "Settings":
+        return dataclasses.replace(self, **changes)
+
+    @classmethod
+    def from_env(cls, database_url: Optional[str] = None) -> "Settings":
+        database_url = database_url or os.getenv("DATABASE_URL")
+        if not database_url:
+            raise RuntimeError("DATABASE_URL environment variable is not set.")
+        env = os.getenv
+        return cls(
+            database_url=database_url,
+            db_pool_size=int(env("DB_POOL_SIZE", "5")),
+            db_max_overflow=int(env("DB_MAX_OVERFLOW", "10")),
+            db_pool_timeout=float(env("DB_POOL_TIMEOUT", "30")),
+            db_pool_recycle=int(env("DB_POOL_RECYCLE", "1800")),
+            database_read_urls=tuple(url.strip() for url in env("DATABASE_READ_URLS", "").split(",") if url.strip()),
+            read_your_writes_seconds=float(env("READ_YOUR_WRITES_SECONDS", "5")),
+            replica_max_lag_seconds=float(env("REPLICA_MAX_LAG_SECONDS", "10")),
+            replica_health_interval=float(env("REPLICA_HEALTH_INTERVAL", "5")),
+            cache_backend=env("CACHE_BACKEND", "none").lower(),
+            cache_ttl=int(env("CACHE_TTL", "300")),
+            cache_max_entries=int(env("CACHE_MAX_ENTRIES", "1024")),
+            cache_path=env("CACHE_PATH", "cache.sqlite3"),
+            redis_url=env("REDIS_URL", "redis://localhost:6379/0"),
+            ai_max_concurrency=int(env("AI_MAX_CONCURRENCY", "4")),
+            ai_rate_per_minute=float(env("AI_RATE_PER_MINUTE", "60")),
+            ai_rate_burst=int(env("AI_RATE_BURST", "20")),
+            ai_max_active=int(env("AI_MAX_ACTIVE", "8")),
+            ai_max_queue=int(env("AI_MAX_QUEUE", "32")),
+            ai_queue_timeout=float(env("AI_QUEUE_TIMEOUT", "15")),
+            rate_limit_backend=env("RATE_LIMIT_BACKEND", "memory").lower(),
+            media_backend=env("MEDIA_BACKEND", "local").lower(),
+            upload_dir=env("UPLOAD_DIR", "uploads"),
+            qrcode_dir=env("QRCODE_DIR", "qrcodes"),
+            s3_bucket=env("S3_BUCKET") or None,
+            s3_prefix=env("S3_PREFIX", ""),
+            s3_endpoint_url=env("S3_ENDPOINT_URL") or None,
+            s3_region=env("S3_REGION") or None,
+            s3_public_url=env("S3_PUBLIC_URL") or None,
+            media_url_ttl=int(env("MEDIA_URL_TTL", "3600")),
+            media_archive_dir=env("MEDIA_ARCHIVE_DIR", "media-archive"),
+            compression_min_size=int(env("COMPRESSION_MIN_SIZE", "1024")),
+            debug=_bool(env("DEBUG", "true")),
+            allowed_origins=tuple(origin.strip() for origin in env("ALLOWED_ORIGINS", "*").split(",")),
+            auto_migrate=_bool(env("AUTO_MIGRATE", "true")),
+            background_jobs=_bool(env("BACKGROUND_JOBS", "true")),
+            qr_backfill_on_startup=_bool(env("QR_BACKFILL_ON_STARTUP", "false")),
+            expiry_sweep_interval=int(env("EXPIRY_SWEEP_INTERVAL", "3600")),
+        )
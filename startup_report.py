@@ -0,0 +1,119 @@
+"""
+Cold-start report: where the time goes between starting Python and serving the
+first request.
+
+    python main.py --startup-report
+
+A fresh interpreter imports main with `-X importtime`, builds the app, runs every startup hook
+and sends one GET /items/?limit=1 straight into the ASGI app, so the numbers
+match a newly booted worker. It uses the configured DATABASE_URL, so pending
+migrations and startup work really run.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+_PROBE = r"""
+import asyncio, json, time
+
+start = time.perf_counter()
+import main
+timings = {"import": time.perf_counter() - start, "hooks": []}
+start = time.perf_counter()
+main.app
+timings["create_app"] = time.perf_counter() - start
+
+async def boot():
+    for handler in main.app.router.on_startup:
+        start = time.perf_counter()
+        result = handler()
+        if asyncio.iscoroutine(result):
+            await result
+        timings["hooks"].append([handler.__name__, time.perf_counter() - start])
+
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/items/", "raw_path": b"/items/", "root_path": "",
+        "query_string": b"limit=1", "headers": [], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 8000),
+    }
+    start = time.perf_counter()
+    await main.app(scope, receive, send)
+    timings["first_request"] = time.perf_counter() - start
+    timings["status"] = messages[0]["status"] if messages else None
+
+asyncio.run(boot())
+print("STARTUP_REPORT " + json.dumps(timings))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, depth, self_us, cumulative_us) for every -X importtime line"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def direct_imports(entries: List[Tuple[str, int, int, int]], parent: str = "main") -> List[Tuple[str, int]]:
+    """Cumulative time of each module imported directly by parent, slowest first"""
+    # importtime prints children before their parent, one level deeper
+    children: List[Tuple[str, int]] = []
+    pending: List[Tuple[str, int]] = []
+    for module, depth, _self_us, cumulative_us in entries:
+        if depth == 1:
+            pending.append((module, cumulative_us))
+        elif depth == 0:
+            if module == parent:
+                children = pending
+            pending = []
+    return sorted(children, key=lambda child: -child[1])
+
+
+def by_package(entries: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for module, _depth, self_us, _cumulative_us in entries:
+        package = module.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def run_report(top: int = 12) -> int:
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=here, capture_output=True, text=True,
+    )
+    report_line = next((line for line in proc.stdout.splitlines() if line.startswith("STARTUP_REPORT ")), None)
+    if proc.returncode != 0 or report_line is None:
+        sys.stderr.write(proc.stderr[-4000:])
+        return proc.returncode or 1
+    timings = json.loads(report_line[len("STARTUP_REPORT "):])
+    entries = parse_importtime(proc.stderr)
+
+    rows = [("import main", timings["import"]), ("create app", timings["create_app"])]
+    rows += [(f"startup: {name}", seconds) for name, seconds in timings["hooks"]]
+    rows += [(f"first request ({timings['status']})", timings["first_request"])]
+    rows += [("time to first request", sum(seconds for _, seconds in rows))]
+    for label, seconds in rows:
+        print(f"{label:<32}{seconds * 1000:8.1f} ms")
+
+    print("\nimported by main (cumulative):")
+    for module, cumulative_us in direct_imports(entries)[:top]:
+        print(f"  {module:<30}{cumulative_us / 1000:8.1f} ms")
+    print("\nself time by package:")
+    for package, self_us in sorted(by_package(entries).items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<30}{self_us / 1000:8.1f} ms")
+    return 0
@@ -0,0 +1,153 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import tempfile
+import os
+from datetime import datetime, timezone
+
+import main
+from main import app, get_db, Base, scan_codes, image_hashes, semantic_index
+
+
+@pytest.fixture
+def test_db():
+    """Create a temporary test database"""
+    # Create temporary database file
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    database_url = f"sqlite:///{db_path}"
+    
+    # Create test engine and session
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    
+    # Create tables
+    Base.metadata.create_all(bind=engine)
+    
+    def override_get_db():
+        try:
+            db = TestingSessionLocal()
+            yield db
+        finally:
+            db.close()
+    
+    app.dependency_overrides[get_db] = override_get_db
+    # Background readers (change feed) open their own sessions
+    main.SessionLocal.configure(bind=engine)
+    scan_codes.clear()
+    image_hashes.clear()
+    semantic_index.clear()
+    
+    yield TestingSessionLocal
+    
+    # Cleanup
+    os.close(db_fd)
+    os.unlink(db_path)
+    app.dependency_overrides.clear()
+    main.SessionLocal.configure(bind=main.engine)
+
+
+@pytest.fixture
+def client(test_db):
+    """Create test client"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def restore_main():
+    """Re-bind main's process-wide engine and cache after a test calls create_app()"""
+    previous = main.settings
+    yield
+    main.configure(previous)
+
+
+@pytest.fixture
+def make_photo():
+    """Factory for deterministic test 'photos': smooth random blobs"""
+    import numpy as np
+    from PIL import Image
+
+    def make(seed, size=128):
+        rng = np.random.default_rng(seed)
+        small = rng.integers(0, 255, size=(8, 8, 3), dtype=np.uint8)
+        return Image.fromarray(small).resize((size, size), Image.Resampling.BICUBIC)
+    return make
+
+
+class FakeS3:
+    """Just enough of a boto3 S3 client, keeping objects in memory"""
+
+    class Body:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self):
+            return self.data
+
+    class Missing(Exception):
+        response = {"Error": {"Code": "NoSuchKey"}}
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        self.calls.append("put_object")
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, **extra):
+        self.calls.append("create_multipart_upload")
+        self.uploads["u1"] = {}
+        return {"UploadId": "u1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append("upload_part")
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append("abort_multipart_upload")
+        self.uploads.pop(UploadId)
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.Missing()
+        return {"Body": self.Body(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.Missing()
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, StartAfter=""):
+                keys = sorted(key for key in client.objects if key.startswith(Prefix) and key > StartAfter)
+                modified = datetime(2026, 1, 1, tzinfo=timezone.utc)
+                # One object per page, to exercise paging
+                for key in keys:
+                    yield {"Contents": [{"Key": key, "Size": len(client.objects[key]), "LastModified": modified}]}
+
+        return Paginator()
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?op={operation}&expires={ExpiresIn}"
+
+
+@pytest.fixture
+def fake_s3():
+    """In-memory S3 client for S3Storage(client=...)"""
+    return FakeS3()
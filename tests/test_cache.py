@@ -0,0 +1,90 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from cache import CacheBackend, LRUCache, SQLiteCache, NullCache, create_cache
+
+
+@pytest.fixture
+def cached_client(test_db, monkeypatch):
+    """Test client with an in-process cache in front of the database"""
+    monkeypatch.setattr(main, "cache", LRUCache(max_entries=64))
+    return TestClient(main.app)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_backend_missing_an_operation_fails_at_construction():
+    class GetOnly(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        GetOnly()
+
+
+def test_get_or_load_skips_loader_until_invalidated():
+    cache = LRUCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ["value"]
+
+    assert cache.get_or_load("items", "list", loader) == ["value"]
+    assert cache.get_or_load("items", "list", loader) == ["value"]
+    assert len(calls) == 1
+
+    cache.invalidate("items")
+    cache.get_or_load("items", "list", loader)
+    assert len(calls) == 2
+
+
+def test_sqlite_cache_invalidation_is_shared_between_workers(tmp_path):
+    """Two cache instances on the same file behave like two worker processes"""
+    path = str(tmp_path / "cache.sqlite3")
+    worker_a = SQLiteCache(path)
+    worker_b = SQLiteCache(path)
+
+    worker_a.set(worker_a.key("items", "list"), [{"id": 1}])
+    assert worker_b.get(worker_b.key("items", "list")) == [{"id": 1}]
+
+    worker_b.invalidate("items")
+    assert worker_a.get(worker_a.key("items", "list")) is None
+
+
+def test_create_cache_defaults_to_disabled(monkeypatch):
+    monkeypatch.delenv("CACHE_BACKEND", raising=False)
+    assert isinstance(create_cache(), NullCache)
+
+
+def test_redis_backend_falls_back_to_sqlite(monkeypatch, tmp_path):
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:1/0")
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    assert isinstance(create_cache("redis"), SQLiteCache)
+
+
+def test_item_writes_invalidate_cached_reads(cached_client):
+    created = cached_client.post("/items/", json={"name": "Spool", "category": "Filament", "quantity": 2}).json()
+    assert len(cached_client.get("/items/").json()) == 1
+    assert cached_client.get("/categories/").json() == ["Filament"]
+
+    cached_client.post(f"/items/{created['id']}/increment?increment_by=3")
+    assert cached_client.get(f"/items/{created['id']}").json()["quantity"] == 5
+    assert cached_client.get("/items/").json()[0]["quantity"] == 5
+
+    cached_client.put(f"/items/{created['id']}", json={"name": "Spool", "category": "PLA", "quantity": 5})
+    assert cached_client.get("/categories/").json() == ["PLA"]
+
+    cached_client.delete(f"/items/{created['id']}")
+    assert cached_client.get("/items/").json() == []
+    assert cached_client.get(f"/items/{created['id']}").status_code == 404
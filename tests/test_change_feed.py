@@ -0,0 +1,83 @@
+import asyncio
+
+from change_feed import ChangeFeed, diff_fields, format_sse
+
+
+class FakeLog:
+    def __init__(self):
+        self.events = []
+
+    def append(self, item_id, op="update"):
+        self.events.append({"seq": len(self.events) + 1, "op": op, "item_id": item_id, "changes": {}})
+
+    def since(self, seq, limit):
+        return [event for event in self.events if event["seq"] > seq][:limit]
+
+    def latest(self):
+        return self.events[-1]["seq"] if self.events else 0
+
+
+def test_stream_replays_backlog_then_follows_live_events():
+    log = FakeLog()
+    for item_id in (1, 2, 3):
+        log.append(item_id)
+    feed = ChangeFeed(log.since, log.latest, poll_interval=10, batch_size=2)
+
+    async def run():
+        received = []
+        stream = feed.stream(since=1)
+        received.append(await stream.__anext__())
+        received.append(await stream.__anext__())
+        log.append(4)
+        feed.notify()
+        received.append(await asyncio.wait_for(stream.__anext__(), 1))
+        await stream.aclose()
+        return received
+
+    assert [event["seq"] for event in asyncio.run(run())] == [2, 3, 4]
+    assert len(feed) == 0
+
+
+def test_stream_from_now_and_heartbeats():
+    log = FakeLog()
+    log.append(1)
+    feed = ChangeFeed(log.since, log.latest, poll_interval=0.01)
+
+    async def run():
+        stream = feed.stream(heartbeat=0.01)
+        first = await stream.__anext__()
+        log.append(2)
+        event = None
+        while event is None:
+            event = await asyncio.wait_for(stream.__anext__(), 1)
+        await stream.aclose()
+        return first, event
+
+    first, event = asyncio.run(run())
+    assert first is None
+    assert event["seq"] == 2
+
+
+def test_lagging_subscriber_is_dropped():
+    log = FakeLog()
+    feed = ChangeFeed(log.since, log.latest, poll_interval=10, queue_size=2)
+
+    async def run():
+        stream = feed.stream(since=0, heartbeat=0.01)
+        assert await stream.__anext__() is None
+        for item_id in range(5):
+            log.append(item_id)
+        feed.notify()
+        await asyncio.sleep(0.05)
+        return [event["seq"] async for event in stream if event is not None]
+
+    # The two queued events are delivered, then the stream ends so the client reconnects
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_format_sse_and_diff_fields():
+    assert format_sse({"seq": 7, "op": "delete", "item_id": 3, "changes": None}) == (
+        'id: 7\ndata: {"seq":7,"op":"delete","item_id":3,"changes":null}\n\n'
+    )
+    assert format_sse(None).startswith(":")
+    assert diff_fields({"quantity": 1, "name": "PLA"}, {"quantity": 2, "name": "PLA"}) == {"quantity": 2}
@@ -0,0 +1,114 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import main
+from db_routing import ReplicaRouter
+from settings import Settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_round_robin_failover_and_recovery(tmp_path):
+    good = [create_engine(f"sqlite:///{tmp_path / name}") for name in ("a.db", "b.db")]
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'c.db'}")
+    clock = FakeClock()
+    router = ReplicaRouter(good + [broken], health_interval=5, clock=clock, wall_clock=clock)
+
+    picks = [router.choose() for _ in range(6)]
+    assert broken not in picks and set(picks) == set(good)
+    assert [replica["healthy"] for replica in router.status()] == [True, True, False]
+
+    for engine in good:
+        router.mark_failed(engine, RuntimeError("connection reset"))
+    assert router.choose() is None  # primary
+
+    clock.now += 5
+    assert router.choose() in good  # re-probed and back in rotation
+
+
+def test_read_your_writes_window():
+    clock = FakeClock()
+    router = ReplicaRouter([create_engine("sqlite://")], read_your_writes=5, clock=clock, wall_clock=clock)
+
+    cookie = router.record_write("10.0.0.1")
+    assert router.route("10.0.0.1", None) is None
+    assert router.route("10.0.0.2", cookie) is None
+    assert router.route("10.0.0.2", None) is not None
+
+    clock.now += 6
+    assert router.route("10.0.0.1", cookie) is not None
+
+
+def test_reads_use_replica_until_client_writes(tmp_path, restore_main):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica = create_engine(replica_url)
+    main.upgrade_database(replica)
+    with replica.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO items (name, category, quantity, custom_attributes) VALUES ('Replica only', 'Tools', 1, '{}')"
+        ))
+
+    app = main.create_app(Settings(
+        database_url=f"sqlite:///{tmp_path / 'primary.db'}",
+        database_read_urls=(replica_url,),
+        upload_dir=str(tmp_path / "uploads"),
+        qrcode_dir=str(tmp_path / "qrcodes"),
+        background_jobs=False,
+    ))
+    with TestClient(app) as client:
+        assert [item["name"] for item in client.get("/items/").json()] == ["Replica only"]
+
+        client.post("/items/", json={"name": "Primary", "category": "Tools", "quantity": 1})
+        assert [item["name"] for item in client.get("/items/").json()] == ["Primary"]
+
+        assert client.get("/health/database").json()["replicas"][0]["healthy"] is True
+
+
+def test_replica_reads_are_not_cached_for_primary_readers(tmp_path, restore_main):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    main.upgrade_database(create_engine(replica_url))
+
+    app = main.create_app(Settings(
+        database_url=f"sqlite:///{tmp_path / 'primary.db'}",
+        database_read_urls=(replica_url,),
+        upload_dir=str(tmp_path / "uploads"),
+        qrcode_dir=str(tmp_path / "qrcodes"),
+        cache_backend="memory",
+        background_jobs=False,
+    ))
+    with TestClient(app) as client:
+        client.post("/items/", json={"name": "Primary", "category": "Tools", "quantity": 1})
+
+        # Another reader hits the lagging replica after the write bumped the cache version
+        window, main.read_router.read_your_writes = main.read_router.read_your_writes, 0
+        assert client.get("/items/", cookies={main.WRITE_COOKIE: ""}).json() == []
+        main.read_router.read_your_writes = window
+
+        assert [item["name"] for item in client.get("/items/").json()] == ["Primary"]
+
+
+def test_replica_failure_mid_request_is_served_by_the_primary(tmp_path, restore_main):
+    # Answers the health probe but has no schema, so every read fails
+    replica_url = f"sqlite:///{tmp_path / 'empty.db'}"
+
+    app = main.create_app(Settings(
+        database_url=f"sqlite:///{tmp_path / 'primary.db'}",
+        database_read_urls=(replica_url,),
+        upload_dir=str(tmp_path / "uploads"),
+        qrcode_dir=str(tmp_path / "qrcodes"),
+        background_jobs=False,
+    ))
+    with TestClient(app) as client:
+        item = client.post("/items/", json={"name": "Primary", "category": "Tools", "quantity": 1}).json()
+        window, main.read_router.read_your_writes = main.read_router.read_your_writes, 0
+
+        response = client.get(f"/items/{item['id']}", cookies={main.WRITE_COOKIE: ""})
+        assert response.status_code == 200 and response.json()["name"] == "Primary"
+        assert client.get("/health/database").json()["replicas"][0]["healthy"] is False
+        main.read_router.read_your_writes = window
@@ -0,0 +1,66 @@
+import random
+
+from PIL import ImageEnhance
+
+from image_index import HashIndex, dhash, phash, hamming
+
+
+def test_hashes_tolerate_resize_and_brightness(make_photo):
+    photo = make_photo(1)
+    variant = ImageEnhance.Brightness(photo.resize((300, 300))).enhance(1.1)
+    other = make_photo(2)
+
+    assert hamming(phash(photo), phash(variant)) <= 6
+    assert hamming(dhash(photo), dhash(variant)) <= 6
+    assert hamming(phash(photo), phash(other)) > 10
+
+
+def test_index_query_matches_brute_force():
+    rng = random.Random(0)
+    index = HashIndex()
+    hashes = {}
+    for key in range(5000):
+        hashes[key] = rng.getrandbits(64)
+        index.add(key, hashes[key])
+    # Plant near-duplicates of a probe hash
+    probe = rng.getrandbits(64)
+    for key, flips in [(9001, 0), (9002, 3), (9003, 7)]:
+        value = probe
+        for bit in rng.sample(range(64), flips):
+            value ^= 1 << bit
+        hashes[key] = value
+        index.add(key, value)
+
+    for radius in (3, 7, 12):
+        expected = sorted(k for k, v in hashes.items() if hamming(probe, v) <= radius)
+        assert sorted(k for k, _ in index.query(probe, radius)) == expected
+
+    index.remove(9001)
+    assert [k for k, _ in index.query(probe, 3)] == [9002]
+
+
+def test_index_syncs_only_changes_after_the_first_load():
+    version = [0]
+    index = HashIndex(version=lambda: version[0])
+    calls = []
+
+    def loader(since):
+        calls.append(since)
+        if since is None:
+            return {1: 0, 2: 0xFF}, 10
+        return {2: None, 3: 0}, 20
+
+    index.ensure_synced(loader)
+    index.ensure_synced(loader)
+    assert calls == [None]
+    assert [k for k, _ in index.query(0, 0)] == [1]
+
+    version[0] = 1  # another worker wrote
+    index.ensure_synced(loader)
+    assert calls == [None, 10]
+    # Changed keys are upserted, a removed image dropped, the rest kept
+    assert [k for k, _ in index.query(0, 8)] == [1, 3] and len(index) == 2
+
+    index.clear()
+    index.ensure_synced(loader)
+    assert calls == [None, 10, None]
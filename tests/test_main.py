@@ -1,48 +1,5 @@
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import tempfile
-import os
-
-from main import app, get_db, Base
-
-
-@pytest.fixture
-def test_db():
-    """Create a temporary test database"""
-    # Create temporary database file
-    db_fd, db_path = tempfile.mkstemp(suffix='.db')
-    database_url = f"sqlite:///{db_path}"
-    
-    # Create test engine and session
-    engine = create_engine(database_url, connect_args={"check_same_thread": False})
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    # Create tables
-    Base.metadata.create_all(bind=engine)
-    
-    def override_get_db():
-        try:
-            db = TestingSessionLocal()
-            yield db
-        finally:
-            db.close()
-    
-    app.dependency_overrides[get_db] = override_get_db
-    
-    yield TestingSessionLocal
-    
-    # Cleanup
-    os.close(db_fd)
-    os.unlink(db_path)
-    app.dependency_overrides.clear()
-
-
-@pytest.fixture
-def client(test_db):
-    """Create test client"""
-    return TestClient(app)
+from datetime import datetime, timedelta
 
 
 def test_read_root(client):
@@ -245,4 +202,828 @@ def test_get_categories_with_items(client):
     categories = response.json()
     assert "Electronics" in categories
     assert "Books" in categories
-    assert len(categories) == 2 
\ No newline at end of file
+    assert len(categories) == 2
+
+
+PIXEL_PNG = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg=="
+
+
+def test_smart_add_with_stub_provider(client, monkeypatch):
+    """Test SmartAdd against the deterministic local stub provider"""
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    client.post("/items/", json={"name": "Stub Item Large", "category": "Miscellaneous", "quantity": 2})
+
+    response = client.post("/smart-add/", json={"photos": [PIXEL_PNG]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert data["suggestions"]["name"] == "Stub Item"
+    assert data["suggestions"]["similar_items"][0]["name"] == "Stub Item Large"
+
+    metrics = client.get("/ai/metrics").json()["providers"]
+    stub_metrics = [m for m in metrics if m["provider"] == "stub"]
+    assert stub_metrics and stub_metrics[0]["calls"] >= 1
+
+
+def test_smart_add_blocking_work_runs_off_the_event_loop(client, monkeypatch):
+    """Test barcode decoding and other blocking Smart Add steps run in worker threads"""
+    import asyncio
+    import main
+
+    on_loop = []
+
+    def off_loop(func):
+        def run(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(func.__name__)
+            except RuntimeError:
+                pass
+            return func(*args, **kwargs)
+        return run
+
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    for name in ("resolve_decoded_codes", "find_visual_matches", "attach_similar_items", "get_categories"):
+        monkeypatch.setattr(main, name, off_loop(getattr(main, name)))
+    for endpoint in ("/smart-add/", "/enhanced-smart-add/"):
+        assert client.post(endpoint, json={"photos": [PIXEL_PNG]}).json()["success"] is True
+    assert on_loop == []
+
+
+def test_enhanced_smart_add_with_stub_fixture(client, monkeypatch, tmp_path):
+    """Test Enhanced SmartAdd batch mode with a fixture-driven stub provider"""
+    fixture = tmp_path / "fixture.json"
+    fixture.write_text('{"batch": {"items": [{"name": "Red PLA", "category": "Filament", "quantity": 3, "confidence": 0.8}], "overall_confidence": 0.8}}')
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    monkeypatch.setenv("AI_STUB_FIXTURE", str(fixture))
+
+    response = client.post("/enhanced-smart-add/", json={"photos": [PIXEL_PNG], "batch_mode": True})
+    data = response.json()
+    assert data["success"] is True
+    assert data["batch_results"][0]["name"] == "Red PLA"
+    assert data["batch_results"][0]["quantity"] == 3
+
+
+def test_low_stock_alerts_on_quantity_changes(client, monkeypatch, tmp_path):
+    """Test per-item reorder thresholds are evaluated on increment and update"""
+    import json
+    import main
+    from alerts import FileSink
+
+    alert_file = tmp_path / "alerts.jsonl"
+    monkeypatch.setattr(main, "alert_sinks", [FileSink(str(alert_file))])
+
+    created = client.post("/items/", json={"name": "PLA", "category": "Filament", "quantity": 5, "reorder_threshold": 2}).json()
+    assert created["low_stock"] is False
+    assert client.get("/alerts/low-stock").json() == []
+
+    client.post(f"/items/{created['id']}/increment?increment_by=-3")
+    low = client.get("/alerts/low-stock").json()
+    assert [item["id"] for item in low] == [created["id"]]
+
+    # Already low: a further decrement must not raise a second alert
+    client.post(f"/items/{created['id']}/increment?increment_by=-1")
+    alerts = [json.loads(line) for line in alert_file.read_text().splitlines()]
+    assert len(alerts) == 1
+    assert alerts[0]["type"] == "low_stock"
+    assert alerts[0]["item_id"] == created["id"]
+
+    # Restocking via PUT without a threshold keeps the item's threshold
+    updated = client.put(f"/items/{created['id']}", json={"name": "PLA", "category": "Filament", "quantity": 10}).json()
+    assert updated["reorder_threshold"] == 2
+    assert updated["low_stock"] is False
+    assert client.get("/alerts/low-stock").json() == []
+
+    # Items inheriting the category threshold report it in the alert
+    client.put("/categories/Filament/reorder-threshold", json={"reorder_threshold": 4})
+    inherited = client.post("/items/", json={"name": "PETG", "category": "Filament", "quantity": 6}).json()
+    client.post(f"/items/{inherited['id']}/increment?increment_by=-3")
+    alerts = [json.loads(line) for line in alert_file.read_text().splitlines()]
+    assert alerts[-1]["item_id"] == inherited["id"]
+    assert alerts[-1]["reorder_threshold"] == 4
+
+
+def test_category_reorder_threshold(client):
+    """Test category thresholds apply to items without their own threshold"""
+    ammo = client.post("/items/", json={"name": "9mm", "category": "Ammo", "quantity": 50}).json()
+    own = client.post("/items/", json={"name": ".22", "category": "Ammo", "quantity": 50, "reorder_threshold": 10}).json()
+
+    response = client.put("/categories/Ammo/reorder-threshold", json={"reorder_threshold": 100})
+    assert response.status_code == 200
+    assert [item["id"] for item in client.get("/alerts/low-stock?category=Ammo").json()] == [ammo["id"]]
+
+    client.post(f"/items/{own['id']}/increment?increment_by=-45")
+    assert len(client.get("/alerts/low-stock").json()) == 2
+
+    client.put("/categories/Ammo/reorder-threshold", json={"reorder_threshold": None})
+    assert [item["id"] for item in client.get("/alerts/low-stock").json()] == [own["id"]]
+
+
+def test_expiry_normalized_and_queried_by_range(client):
+    """Test expiry attributes are normalized to a date and served by /items/expiring"""
+    from datetime import date, timedelta
+
+    soon = date.today() + timedelta(days=5)
+    later = date.today() + timedelta(days=90)
+    past = date.today() - timedelta(days=3)
+    first = client.post("/items/", json={"name": "Milk", "category": "Food", "quantity": 1,
+                                         "custom_attributes": {"Expiry Date": soon.strftime("%m/%d/%Y")}}).json()
+    client.post("/items/", json={"name": "Rice", "category": "Food", "quantity": 1,
+                                 "custom_attributes": {"best_by": later.isoformat()}})
+    expired = client.post("/items/", json={"name": "Yogurt", "category": "Food", "quantity": 1,
+                                           "custom_attributes": {"expiry": past.isoformat()}}).json()
+    client.post("/items/", json={"name": "Nails", "category": "Hardware", "quantity": 100})
+
+    assert first["expiry_date"] == soon.isoformat()
+
+    response = client.get("/items/expiring?within=30d")
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()] == ["Milk"]
+
+    names = [item["name"] for item in client.get("/items/expiring?within=2w&include_expired=true").json()]
+    assert names == ["Yogurt", "Milk"]
+    assert len(client.get("/items/expiring?within=13w").json()) == 2
+    assert client.get("/items/expiring?within=soon").status_code == 422
+
+    client.put(f"/items/{expired['id']}", json={"name": "Yogurt", "category": "Food", "quantity": 1, "custom_attributes": {}})
+    assert client.get(f"/items/{expired['id']}").json()["expiry_date"] is None
+
+
+def test_expiry_sweep_only_alerts_once(client, monkeypatch, tmp_path):
+    """Test the expiry sweep emits each soon-to-expire item a single time"""
+    import json
+    from datetime import date, timedelta
+    import main
+    from alerts import FileSink
+
+    alert_file = tmp_path / "alerts.jsonl"
+    monkeypatch.setattr(main, "alert_sinks", [FileSink(str(alert_file))])
+
+    soon = (date.today() + timedelta(days=3)).isoformat()
+    client.post("/items/", json={"name": "Batteries", "category": "Power", "quantity": 4,
+                                 "custom_attributes": {"expiry_date": soon}})
+
+    assert client.post("/alerts/expiry-sweep").json() == {"alerts_sent": 1}
+    assert client.post("/alerts/expiry-sweep").json() == {"alerts_sent": 0}
+
+    # Items written inside the already-swept window are alerted on write
+    client.post("/items/", json={"name": "Sunscreen", "category": "Health", "quantity": 1,
+                                 "custom_attributes": {"expiry_date": soon}})
+    alerts = [json.loads(line) for line in alert_file.read_text().splitlines()]
+    assert [(a["type"], a["name"]) for a in alerts] == [("expiring_soon", "Batteries"), ("expiring_soon", "Sunscreen")]
+
+
+def test_concurrent_expiry_sweeps_claim_the_window_once(client, test_db, monkeypatch, tmp_path):
+    """Test two workers sweeping at once alert each item once, including the first sweep"""
+    import json
+    from datetime import date, timedelta
+    import main
+    from alerts import FileSink
+
+    alert_file = tmp_path / "alerts.jsonl"
+    monkeypatch.setattr(main, "alert_sinks", [FileSink(str(alert_file))])
+    client.post("/items/", json={"name": "Milk", "category": "Food", "quantity": 1,
+                                 "custom_attributes": {"expiry_date": (date.today() + timedelta(days=2)).isoformat()}})
+
+    first, second = test_db(), test_db()
+    # Both workers read "no sweep yet" before either claims the window
+    assert first.get(main.JobState, "expiry_sweep") is None
+    assert second.get(main.JobState, "expiry_sweep") is None
+    assert main.sweep_expiring_items(first) == 1
+    assert main.sweep_expiring_items(second) == 0
+    # The slower worker's insert of the first watermark loses instead of raising
+    assert not main.claim_job_state(second, "expiry_sweep", None, "2099-01-01")
+
+    # A later window: both read the same watermark, only one advances it
+    tomorrow = date.today() + timedelta(days=1)
+    covered = first.get(main.JobState, "expiry_sweep").value
+    assert second.get(main.JobState, "expiry_sweep").value == covered
+    assert main.claim_job_state(first, "expiry_sweep", covered, "2099-01-01")
+    assert not main.claim_job_state(second, "expiry_sweep", covered, "2099-01-02")
+    assert main.sweep_expiring_items(second, today=tomorrow) == 0
+    first.close()
+    second.close()
+    assert len(alert_file.read_text().splitlines()) == 1
+
+
+def test_enhanced_smart_add_normalizes_price_and_expiry(client, monkeypatch, tmp_path):
+    """Test Enhanced SmartAdd post-processes price and expiry into structured values"""
+    fixture = tmp_path / "fixture.json"
+    fixture.write_text('{"single": {"name": "Milk", "category": "Food", "quantity": 1, "confidence": 0.9,'
+                       ' "custom_attributes": {"price": "2,49 €", "expiry_date": "MHD 31.12.2030"}}}')
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    monkeypatch.setenv("AI_STUB_FIXTURE", str(fixture))
+
+    response = client.post("/enhanced-smart-add/", json={
+        "photos": [PIXEL_PNG], "detect_price": True, "detect_expiry": True, "locale": "de_DE"
+    })
+    data = response.json()
+    assert data["success"] is True
+    assert data["price_estimate"] == "2,49 €"
+    assert data["price_value"]["amount"] == "2.49"
+    assert data["price_value"]["currency"] == "EUR"
+    assert data["expiry_date"] == "2030-12-31"
+    assert data["suggestions"]["custom_attributes"]["expiry_date"] == "2030-12-31"
+
+    # BCP 47 tags and bare languages resolve to the same locale; unknown ones fall back instead of failing
+    for locale in ("de-DE", "de"):
+        data = client.post("/enhanced-smart-add/", json={
+            "photos": [PIXEL_PNG], "detect_price": True, "locale": locale
+        }).json()
+        assert (data["price_value"]["amount"], data["price_value"]["currency"]) == ("2.49", "EUR")
+    data = client.post("/enhanced-smart-add/", json={"photos": [PIXEL_PNG], "detect_price": True, "locale": "xx-YY"}).json()
+    assert data["success"] is True
+
+
+def _qr_photo(data):
+    """Base64 PNG of a QR code encoding data"""
+    import base64
+    import io
+    import qrcode
+
+    buffer = io.BytesIO()
+    qrcode.make(data).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_smart_add_resolves_item_qr_without_ai(client, monkeypatch):
+    """Test a Stuf item QR code resolves locally and never reaches the AI provider"""
+    pytest.importorskip("cv2")
+    created = client.post("/items/", json={"name": "Black PETG", "category": "Filament", "quantity": 2}).json()
+    monkeypatch.delenv("GOOGLE_AI_API_KEY", raising=False)
+
+    response = client.post("/smart-add/", json={"photos": [_qr_photo(f"http://localhost:5174/item/{created['id']}")]})
+    data = response.json()
+    assert data["success"] is True
+    assert data["source"] == "barcode"
+    assert data["suggestions"]["matched_item"]["id"] == created["id"]
+    assert data["suggestions"]["similar_items"][0]["id"] == created["id"]
+
+
+def test_barcode_index_from_attributes(client):
+    """Test barcode attributes are indexed on write and resolvable by code"""
+    created = client.post("/items/", json={"name": "Ammo 9mm", "category": "Ammo", "quantity": 50,
+                                           "custom_attributes": {"UPC": "012345678905"}}).json()
+    assert client.get("/barcodes/0012345678905").json()["id"] == created["id"]
+    assert client.get("/barcodes/012345678905").json()["id"] == created["id"]
+
+    other = client.post("/items/", json={"name": "Ammo .22", "category": "Ammo", "quantity": 10}).json()
+    assert client.post(f"/items/{other['id']}/barcodes", json={"code": "4006381333931"}).status_code == 200
+    assert client.get("/barcodes/4006381333931").json()["id"] == other["id"]
+
+    # Editing the attribute moves the index (and /scan) to the new code; assigned codes stay
+    assert client.post("/scan", json={"code": "012345678905"}).json()["item_id"] == created["id"]
+    assert client.post(f"/items/{created['id']}/barcodes", json={"code": "5901234123457"}).status_code == 200
+    client.put(f"/items/{created['id']}", json={"name": "Ammo 9mm", "category": "Ammo", "quantity": 50,
+                                                "custom_attributes": {"UPC": "036000291452"}})
+    assert client.get("/barcodes/012345678905").status_code == 404
+    assert client.post("/scan", json={"code": "012345678905"}).status_code == 404
+    assert client.get("/barcodes/036000291452").json()["id"] == created["id"]
+    assert client.get("/barcodes/5901234123457").json()["id"] == created["id"]
+
+    client.delete(f"/items/{created['id']}")
+    assert client.get("/barcodes/036000291452").status_code == 404
+
+
+def test_scan_single_code_increments_atomically(client):
+    """Test /scan resolves QR URLs, barcodes and item ids in one round trip"""
+    created = client.post("/items/", json={"name": "M3 screws", "category": "Hardware", "quantity": 10,
+                                           "custom_attributes": {"ean": "4006381333931"}}).json()
+    item_id = created["id"]
+
+    response = client.post("/scan", json={"code": f"http://192.168.1.10:5173/item/{item_id}", "delta": 2})
+    assert response.status_code == 200
+    assert response.json() == {"code": f"http://192.168.1.10:5173/item/{item_id}", "item_id": item_id, "new_quantity": 12}
+
+    assert client.post("/scan", json={"code": "4006381333931"}).json()["new_quantity"] == 13
+    assert client.post("/scan", json={"code": str(item_id), "delta": -3}).json()["new_quantity"] == 10
+    assert client.get(f"/items/{item_id}").json()["quantity"] == 10
+
+    assert client.post("/scan", json={"code": "9999999999999"}).status_code == 404
+    assert client.post("/scan", json={}).status_code == 422
+
+
+def test_scan_batch(client):
+    """Test batched scans fold repeated codes and report unknown ones"""
+    first = client.post("/items/", json={"name": "AA", "category": "Power", "quantity": 0, "reorder_threshold": 1}).json()
+    second = client.post("/items/", json={"name": "AAA", "category": "Power", "quantity": 5}).json()
+    client.post(f"/items/{second['id']}/barcodes", json={"code": "012345678905"})
+
+    response = client.post("/scan", json={"scans": [
+        {"code": str(first["id"])},
+        {"code": str(first["id"])},
+        {"code": "0012345678905", "delta": 4},
+        {"code": "unknown"},
+    ]})
+    results = response.json()["results"]
+    assert [r.get("new_quantity") for r in results] == [2, 2, 9, None]
+    assert results[3]["error"] == "Unknown code"
+
+    # Crossing the reorder threshold through /scan keeps the low-stock flag current
+    assert client.get(f"/items/{first['id']}").json()["low_stock"] is False
+    client.post("/scan", json={"code": str(first["id"]), "delta": -2})
+    assert [item["id"] for item in client.get("/alerts/low-stock").json()] == [first["id"]]
+
+
+def test_smart_add_returns_visual_near_duplicates(client, test_db, monkeypatch, tmp_path, make_photo):
+    """Test Smart Add surfaces items whose uploaded photo looks like the new one"""
+    import base64
+    import io
+    from PIL import ImageEnhance
+    from image_index import phash
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "uploads").mkdir()
+    make_photo(1).save(tmp_path / "uploads" / "spool.png")
+    make_photo(2).save(tmp_path / "uploads" / "box.png")
+    spool = client.post("/items/", json={"name": "Filament spool", "category": "Filament", "quantity": 1,
+                                         "image_url": "/uploads/spool.png"}).json()
+    client.post("/items/", json={"name": "Cardboard box", "category": "Storage", "quantity": 1,
+                                 "image_url": "/uploads/box.png"})
+
+    buffer = io.BytesIO()
+    ImageEnhance.Brightness(make_photo(1).resize((256, 256))).enhance(0.9).save(buffer, format="PNG")
+    photo = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+
+    data = client.post("/smart-add/", json={"photos": [photo]}).json()
+    assert data["success"] is True
+    assert [match["id"] for match in data["suggestions"]["visual_matches"]] == [spool["id"]]
+    assert spool["id"] in [item["id"] for item in data["suggestions"]["similar_items"]]
+
+    # Another worker deletes the item: the index drops it once a query turns it up
+    import main
+    with test_db() as db:
+        db.query(main.Item).filter(main.Item.id == spool["id"]).delete()
+        db.commit()
+    data = client.post("/smart-add/", json={"photos": [photo]}).json()
+    assert "visual_matches" not in data["suggestions"]
+    assert main.image_hashes.query(phash(make_photo(1)), main.IMAGE_MATCH_DISTANCE) == []
+
+
+def test_semantic_search(client, test_db):
+    """Test semantic search ranks reworded names and follows item writes"""
+    spool = client.post("/items/", json={"name": "Red PLA spool", "category": "Filament", "quantity": 2}).json()
+    petg = client.post("/items/", json={"name": "Blue PETG filament", "category": "Filament", "quantity": 1}).json()
+    hammer = client.post("/items/", json={"name": "Claw hammer", "category": "Tools", "quantity": 1}).json()
+
+    results = client.get("/items/semantic-search", params={"q": "PLA filament red 1kg", "k": 2}).json()
+    assert [item["id"] for item in results] == [spool["id"], petg["id"]]
+    assert results[0]["score"] > results[1]["score"]
+
+    tools = client.get("/items/semantic-search", params={"q": "red pla", "category": "Tools"}).json()
+    assert [item["id"] for item in tools] == [hammer["id"]]
+
+    client.put(f"/items/{hammer['id']}", json={"name": "Red PLA offcuts", "category": "Tools", "quantity": 1})
+    client.delete(f"/items/{spool['id']}")
+    results = client.get("/items/semantic-search", params={"q": "red pla", "k": 1}).json()
+    assert results[0]["id"] == hammer["id"]
+
+    # Only the category's items are scored, however many closer matches other categories have
+    for index in range(6):
+        client.post("/items/", json={"name": f"Red PLA spool {index}", "category": "Filament", "quantity": 1})
+    tools = client.get("/items/semantic-search", params={"q": "red pla spool", "category": "Tools", "k": 1}).json()
+    assert [item["id"] for item in tools] == [hammer["id"]]
+
+    # Rows deleted by another worker are dropped from the index instead of taking a result slot
+    import main
+    with test_db() as db:
+        db.query(main.Item).filter(main.Item.id == hammer["id"]).delete()
+        db.commit()
+    results = client.get("/items/semantic-search", params={"q": "red pla offcuts", "k": 2}).json()
+    assert len(results) == 2 and hammer["id"] not in [item["id"] for item in results]
+
+
+def test_item_changes_catch_up(client, test_db):
+    """Test every item write lands in the change log as a compact delta"""
+    start = client.get("/items/changes").json()
+    assert start == {"changes": [], "last_seq": 0, "has_more": False}
+
+    item = client.post("/items/", json={"name": "PLA", "category": "Filament", "quantity": 2}).json()
+    client.put(f"/items/{item['id']}", json={"name": "PLA", "category": "Filament", "quantity": 5})
+    client.post(f"/items/{item['id']}/increment", params={"increment_by": 2})
+    client.post("/scan", json={"code": str(item["id"]), "delta": -1})
+    client.delete(f"/items/{item['id']}")
+
+    page = client.get("/items/changes", params={"since": 0}).json()
+    changes = page["changes"]
+    assert [change["op"] for change in changes] == ["create", "update", "update", "update", "delete"]
+    assert [change["seq"] for change in changes] == sorted(change["seq"] for change in changes)
+    assert changes[0]["changes"]["name"] == "PLA" and changes[0]["changes"]["qr_code_url"]
+    assert set(changes[1]["changes"]) == {"quantity", "updated_at", "version"} and changes[1]["changes"]["quantity"] == 5
+    assert changes[2]["changes"]["quantity"] == 7
+    assert changes[3]["changes"]["quantity"] == 6
+    assert changes[4]["changes"] is None
+    assert page["last_seq"] == changes[-1]["seq"] and page["has_more"] is False
+
+    resumed = client.get("/items/changes", params={"since": changes[2]["seq"], "limit": 1}).json()
+    assert [change["op"] for change in resumed["changes"]] == ["update"]
+    assert resumed["has_more"] is True
+
+    # Clients older than the pruned horizon have to reload the list
+    from main import prune_item_changes
+    db = test_db()
+    try:
+        assert prune_item_changes(db, retention_days=0, now=datetime.utcnow() + timedelta(seconds=1)) == 5
+    finally:
+        db.close()
+    assert client.get("/items/changes", params={"since": 0}).status_code == 410
+    assert client.get("/items/changes", params={"since": page["last_seq"]}).json()["changes"] == []
+
+
+def test_change_log_seq_follows_commit_order(client, test_db):
+    """Test a writer holds the change log until commit, so catch-up past a later seq never skips an earlier one"""
+    from types import SimpleNamespace
+    import pytest
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+    import main
+
+    item_id = client.post("/items/", json={"name": "PLA", "category": "Filament", "quantity": 1}).json()["id"]
+    start = client.get("/items/changes").json()["last_seq"]
+    first = test_db()
+    # A second worker that gives up quickly instead of waiting out the first transaction
+    second = sessionmaker(bind=create_engine(test_db.kw["bind"].url, connect_args={"timeout": 0.1}))()
+
+    def set_quantity(db, quantity):
+        item = db.get(main.Item, item_id)
+        before = main.item_to_dict(item)
+        item.quantity = quantity
+        main.record_change(db, "update", item, before)
+
+    set_quantity(first, 2)
+    first.flush()
+    assert client.get("/items/changes", params={"since": start}).json()["changes"] == []
+    with pytest.raises(OperationalError):
+        set_quantity(second, 3)
+    second.rollback()
+    first.commit()
+    set_quantity(second, 3)
+    second.commit()
+    first.close()
+    second.close()
+
+    changes = client.get("/items/changes", params={"since": start}).json()["changes"]
+    assert [change["changes"]["quantity"] for change in changes] == [2, 3]
+    assert changes[0]["seq"] < changes[1]["seq"]
+
+    # Postgres writers take the advisory lock for the same guarantee
+    statements = []
+    postgres = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=SimpleNamespace(name="postgresql")),
+                               execute=lambda statement, params: statements.append((str(statement), params)))
+    main.lock_change_log(postgres)
+    assert statements == [("SELECT pg_advisory_xact_lock(:key)", {"key": main.CHANGE_LOG_LOCK_KEY})]
+
+
+def test_item_changes_websocket(client, monkeypatch):
+    """Test the WebSocket feed replays from `since` and pushes new writes"""
+    import main
+    monkeypatch.setattr(main.change_feed, "poll_interval", 0.05)
+    first = client.post("/items/", json={"name": "Nails", "category": "Hardware", "quantity": 100}).json()
+
+    with client.websocket_connect("/items/changes/ws?since=0") as websocket:
+        assert websocket.receive_json()["item_id"] == first["id"]
+        client.post(f"/items/{first['id']}/increment", params={"increment_by": -10})
+        event = websocket.receive_json()
+        assert event["op"] == "update" and event["changes"]["quantity"] == 90
+
+
+def test_sync_pull_and_push(client):
+    """Test delta sync: tombstones, per-item versions and conflict detection"""
+    drill = client.post("/items/", json={"name": "Drill", "category": "Tools", "quantity": 1}).json()
+    saw = client.post("/items/", json={"name": "Saw", "category": "Tools", "quantity": 1}).json()
+    assert drill["version"] == 1
+
+    snapshot = client.get("/sync").json()
+    assert snapshot["full"] is True and [item["id"] for item in snapshot["items"]] == [drill["id"], saw["id"]]
+
+    client.put(f"/items/{drill['id']}", json={"name": "Cordless drill", "category": "Tools", "quantity": 1})
+    client.delete(f"/items/{saw['id']}")
+    delta = client.get("/sync", params={"since": snapshot["token"]}).json()
+    assert delta["full"] is False
+    assert [(item["id"], item["version"]) for item in delta["items"]] == [(drill["id"], 2)]
+    assert delta["deleted"] == [saw["id"]]
+    assert client.get("/sync", params={"since": delta["token"]}).json()["items"] == []
+
+    edit = {"name": "Drill (blue)", "category": "Tools", "quantity": 1}
+    pushed = client.post("/sync", json={"mutations": [
+        {"mutation_id": "m1", "op": "update", "item_id": drill["id"], "base_version": 1, "item": edit},
+        {"mutation_id": "m2", "op": "update", "item_id": drill["id"], "base_version": 2, "item": edit},
+        {"mutation_id": "m3", "op": "increment", "item_id": drill["id"], "base_version": 1, "delta": 2},
+        {"mutation_id": "m4", "op": "create", "item": {"name": "Level", "category": "Tools", "quantity": 1}},
+        {"mutation_id": "m5", "op": "delete", "item_id": saw["id"]},
+        {"mutation_id": "m6", "op": "update", "item_id": drill["id"]},
+    ]}).json()["results"]
+    assert [result["status"] for result in pushed] == ["conflict", "applied", "applied", "applied", "not_found", "invalid"]
+    assert pushed[0]["item"]["name"] == "Cordless drill" and pushed[0]["item"]["version"] == 2
+    assert pushed[2]["item"]["quantity"] == 3 and pushed[2]["item"]["version"] == 4
+
+    # A retried batch doesn't create the item twice
+    retried = client.post("/sync", json={"mutations": [
+        {"mutation_id": "m4", "op": "create", "item": {"name": "Level", "category": "Tools", "quantity": 1}},
+    ]}).json()["results"]
+    assert retried[0]["status"] == "duplicate" and retried[0]["item_id"] == pushed[3]["item_id"]
+    assert len(client.get("/items/").json()) == 2
+
+    after_push = client.get("/sync", params={"since": delta["token"]}).json()
+    assert {item["id"] for item in after_push["items"]} == {drill["id"], pushed[3]["item_id"]}
+    assert client.get("/sync", params={"since": "abc"}).status_code == 400
+
+
+def test_concurrent_increments_all_apply(client):
+    """Test parallel increments of one item each land instead of failing on the item version"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    item = client.post("/items/", json={"name": "Screws", "category": "Hardware", "quantity": 0}).json()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(
+            lambda _: client.post(f"/items/{item['id']}/increment", params={"increment_by": 1}), range(40)
+        ))
+    assert [response.status_code for response in responses] == [200] * 40
+    assert client.get(f"/items/{item['id']}").json()["quantity"] == 40
+    assert client.post("/items/999999/increment").status_code == 404
+
+
+def test_sync_push_item_deleted_during_write(client, test_db, monkeypatch):
+    """Test a mutation whose item is deleted between read and write comes back not_found"""
+    from sqlalchemy.orm.exc import StaleDataError
+    import main
+
+    drill = client.post("/items/", json={"name": "Drill", "category": "Tools", "quantity": 1}).json()
+
+    def deleted_meanwhile(db, mutation):
+        with test_db() as other:
+            other.delete(other.get(main.Item, mutation.item_id))
+            other.commit()
+        raise StaleDataError("item row is gone")
+
+    monkeypatch.setattr(main, "apply_sync_mutation", deleted_meanwhile)
+    result = client.post("/sync", json={"mutations": [
+        {"mutation_id": "m1", "op": "update", "item_id": drill["id"], "base_version": 1,
+         "item": {"name": "Drill", "category": "Tools", "quantity": 2}},
+    ]}).json()["results"][0]
+    assert result["status"] == "not_found" and result["item"] is None
+
+
+def test_stats_rollups_follow_writes(client):
+    """Test /stats totals and attribute breakdowns stay equal to a full recompute"""
+    def filament(name, material, quantity, **extra):
+        attributes = {"material": material, "diameter": 1.75}
+        return client.post("/items/", json={"name": name, "category": "Filament", "quantity": quantity,
+                                            "custom_attributes": attributes, **extra}).json()
+
+    red = filament("Red PLA", "PLA", 2)
+    blue = filament("Blue PLA", "PLA", 1, reorder_threshold=1)
+    petg = filament("Clear PETG", "PETG", 4)
+    client.post("/items/", json={"name": "Hammer", "category": "Tools", "quantity": 1})
+
+    assert client.get("/stats/summary").json() == {"items": 4, "total_quantity": 8, "low_stock": 1, "categories": 2}
+    assert client.get("/stats/categories").json() == [
+        {"category": "Filament", "items": 3, "total_quantity": 7, "low_stock": 1},
+        {"category": "Tools", "items": 1, "total_quantity": 1, "low_stock": 0},
+    ]
+    materials = client.get("/stats/attributes/material", params={"category": "Filament"}).json()
+    assert materials["source"] == "rollup"
+    assert [(v["value"], v["items"], v["total_quantity"]) for v in materials["values"]] == [("PLA", 2, 3), ("PETG", 1, 4)]
+
+    # Every write path moves the rollups incrementally
+    client.put(f"/items/{red['id']}", json={"name": "Red PETG", "category": "Filament", "quantity": 2,
+                                            "custom_attributes": {"material": "PETG"}})
+    client.post(f"/items/{blue['id']}/increment", params={"increment_by": 3})
+    client.post("/scan", json={"code": str(petg["id"]), "delta": -4})
+    client.put("/categories/Filament/reorder-threshold", json={"reorder_threshold": 0})
+    client.post("/sync", json={"mutations": [{"mutation_id": "s1", "op": "delete", "item_id": blue["id"]}]})
+
+    incremental = [client.get(path).json() for path in ("/stats/summary", "/stats/categories", "/stats/attributes/material")]
+    assert incremental[0] == {"items": 3, "total_quantity": 3, "low_stock": 1, "categories": 2}
+    client.post("/stats/rebuild")
+    assert [client.get(path).json() for path in ("/stats/summary", "/stats/categories", "/stats/attributes/material")] == incremental
+
+    diameters = client.get("/stats/attributes/diameter").json()
+    assert diameters["source"] == "query"
+    assert diameters["values"] == [{"value": "1.75", "items": 1, "total_quantity": 0, "low_stock": 1}]
+    assert client.get("/stats/attributes/not-a-key").status_code == 422
+
+
+def test_location_tree_queries_and_moves(client):
+    def location(name, parent_id=None):
+        return client.post("/locations", json={"name": name, "parent_id": parent_id}).json()["id"]
+
+    garage = location("Garage")
+    shelf = location("Shelf A", garage)
+    bin_ = location("Bin 3", shelf)
+    basement = location("Basement")
+    for name, quantity, location_id in (("Hammer", 1, garage), ("Screws", 200, bin_), ("Paint", 4, basement)):
+        response = client.post("/items/", json={"name": name, "category": "Tools", "quantity": quantity,
+                                                "custom_attributes": {}, "location_id": location_id})
+        assert response.json()["location_id"] == location_id
+    assert client.post("/items/", json={"name": "Lost", "category": "Tools", "quantity": 1,
+                                        "custom_attributes": {}, "location_id": 999}).status_code == 422
+
+    detail = client.get(f"/locations/{bin_}").json()
+    assert [node["name"] for node in detail["path"]] == ["Garage", "Shelf A", "Bin 3"]
+    names = lambda response: sorted(item["name"] for item in response.json())
+    assert names(client.get(f"/locations/{garage}/items")) == ["Hammer", "Screws"]
+    assert names(client.get(f"/locations/{garage}/items", params={"recursive": False})) == ["Hammer"]
+
+    stats = client.get(f"/locations/{garage}/stats").json()
+    assert (stats["location"]["items"], stats["location"]["total_quantity"]) == (2, 201)
+    assert [(child["name"], child["items"]) for child in stats["children"]] == [("Shelf A", 1)]
+
+    # Moving a shelf takes its bins and their items along
+    assert client.put(f"/locations/{shelf}", json={"parent_id": bin_}).status_code == 409
+    moved = client.put(f"/locations/{shelf}", json={"parent_id": basement}).json()
+    assert [node["name"] for node in moved["path"]] == ["Basement", "Shelf A"]
+    assert [node["name"] for node in client.get(f"/locations/{bin_}").json()["path"]] == ["Basement", "Shelf A", "Bin 3"]
+    assert names(client.get(f"/locations/{garage}/items")) == ["Hammer"]
+    assert names(client.get(f"/locations/{basement}/items")) == ["Paint", "Screws"]
+
+    assert client.delete(f"/locations/{shelf}").status_code == 409
+    assert client.put(f"/locations/{shelf}", json={"name": "Shelf B"}).json()["parent_id"] == basement
+    assert client.get(f"/locations/{garage}/items", params={"limit": 0}).status_code == 422
+    assert client.get(f"/locations/{garage}/items", params={"limit": 1001}).status_code == 422
+
+    empty = location("Attic")
+    assert client.delete(f"/locations/{empty}").json() == {"detail": "Location deleted successfully"}
+
+
+def test_enhanced_smart_add_parallel_batch_merges_photos(client, monkeypatch):
+    """Test parallel batch mode: per-photo calls, merged items, partial results on failures"""
+    import base64
+    import io
+    import json
+    import time
+    from PIL import Image
+    import main
+    from ai_providers import AIProviderTimeout
+
+    def photo(color):
+        buffer = io.BytesIO()
+        Image.new("RGB", (4, 4), color).save(buffer, format="PNG")
+        return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    photos = [photo("red"), photo("green"), photo("blue"), photo("white")]
+    answers = {
+        photos[0]: {"items": [{"name": "Red PLA", "category": "Filament", "quantity": 2, "confidence": 0.6,
+                               "custom_attributes": {"color": "red"}}]},
+        photos[1]: {"items": [{"name": "red pla", "category": "Filament", "quantity": 3, "confidence": 0.5,
+                               "custom_attributes": {"brand": "Prusa", "color": "crimson"}},
+                              {"name": "Spatula", "category": "Tools", "quantity": 1, "confidence": 0.9}]},
+    }
+    calls = []
+
+    def fake_response(provider, prompt, images, request_photos, timeout=None):
+        calls.append(len(images))
+        if request_photos[0] == photos[2]:
+            raise RuntimeError("model overloaded")
+        if request_photos[0] == photos[3]:
+            time.sleep(timeout)
+            raise AIProviderTimeout(f"No response within {timeout:g}s")
+        return json.dumps(answers.get(request_photos[0], {"items": []}))
+
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    monkeypatch.setattr(main, "generate_ai_response", fake_response)
+    monkeypatch.setattr(main, "SMART_ADD_PHOTO_TIMEOUT", 0.2)
+
+    data = client.post("/enhanced-smart-add/", json={"photos": photos, "batch_mode": True, "parallel": True}).json()
+    assert data["success"] is True and calls == [1, 1, 1, 1]
+    results = {result["name"]: result for result in data["batch_results"]}
+    assert set(results) == {"Red PLA", "Spatula"}
+    pla = results["Red PLA"]
+    assert pla["photos"] == [0, 1] and pla["quantity"] == 3 and pla["confidence"] == 0.8
+    assert pla["custom_attributes"] == {"color": "red", "brand": "Prusa"}
+    assert sorted(failure["photo"] for failure in data["failed_photos"]) == [2, 3]
+
+    data = client.post("/enhanced-smart-add/", json={"photos": [photos[2]], "batch_mode": True, "parallel": True}).json()
+    assert data["success"] is False and data["failed_photos"][0]["error"] == "model overloaded"
+
+
+def test_parallel_photo_timeout_starts_once_a_slot_is_held(client, monkeypatch):
+    """Test photos queued behind a busy AI slot are not timed out, slow provider calls are"""
+    import asyncio
+    import threading
+    from PIL import Image
+    import main
+    from ai_providers import StubProvider
+
+    monkeypatch.setattr(main, "ai_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(main, "SMART_ADD_PHOTO_TIMEOUT", 0.3)
+    images = [Image.new("RGB", (4, 4), color) for color in ("red", "green", "blue", "white")]
+    photos = [f"photo-{index}" for index in range(len(images))]
+    batch_prompt = 'Return {"items": [...]}'
+
+    # Four 0.15s calls one at a time take 0.6s, but each call is well inside its 0.3s
+    detections, failures = asyncio.run(main.analyze_photos(StubProvider(latency_ms=150), batch_prompt, images, photos))
+    assert failures == [] and [index for index, _ in detections] == [0, 1, 2, 3]
+
+    detections, failures = asyncio.run(main.analyze_photos(StubProvider(latency_ms=500), batch_prompt, images[:1], photos[:1]))
+    assert detections == [] and failures == [{"photo": 0, "error": "Timed out after 0.3s"}]
+    # The timed-out call gave its slot back
+    assert main.ai_slots.acquire(blocking=False)
+    main.ai_slots.release()
+
+
+def test_media_gc_removes_orphans_incrementally(client, monkeypatch, tmp_path):
+    import os
+    import time
+    import main
+    from media_storage import LocalStorage
+
+    storage = LocalStorage({"uploads": str(tmp_path / "uploads"), "qrcodes": str(tmp_path / "qrcodes")},
+                           archive_dir=str(tmp_path / "archive"))
+    monkeypatch.setattr(main, "media", storage)
+    monkeypatch.setattr(main, "MEDIA_GC_BATCH_SIZE", 2)
+    for name in ("kept.jpg", "orphan.jpg", "fresh.jpg"):
+        storage.write_bytes(f"uploads/{name}", b"x" * 10)
+    kept = client.post("/items/", json={"name": "Drill", "category": "Tools", "quantity": 1,
+                                        "image_url": "/uploads/kept.jpg"}).json()
+    gone = client.post("/items/", json={"name": "Saw", "category": "Tools", "quantity": 1}).json()
+    client.delete(f"/items/{gone['id']}")
+    day_ago = time.time() - 86400 * 2
+    for key in ("uploads/kept.jpg", "uploads/orphan.jpg", f"qrcodes/{kept['id']}.png", f"qrcodes/{gone['id']}.png"):
+        os.utime(storage.path(key), (day_ago, day_ago))
+
+    report = client.post("/media/gc", params={"dry_run": True}).json()
+    assert (report["scanned"], report["orphaned"], report["recent"]) == (5, 2, 1)
+    assert storage.exists("uploads/orphan.jpg")
+
+    # Two objects per run: the cursor carries the walk over to the next call
+    first = client.post("/media/gc", params={"max_objects": 2}).json()
+    assert first["complete"] is False and first["scanned"] == 2
+    second = client.post("/media/gc", params={"archive": True}).json()
+    assert second["complete"] is True and first["orphaned"] + second["orphaned"] == 2
+    assert not storage.exists(f"qrcodes/{gone['id']}.png") and not storage.exists("uploads/orphan.jpg")
+    assert (tmp_path / "archive" / "uploads" / "orphan.jpg").read_bytes() == b"x" * 10
+    assert storage.exists("uploads/kept.jpg") and storage.exists("uploads/fresh.jpg")
+    assert storage.exists(f"qrcodes/{kept['id']}.png")
+
+
+def test_worker_runs_media_gc_without_expiry_sweeps(monkeypatch):
+    """Test the --worker media GC loop has its own schedule, independent of EXPIRY_SWEEP_INTERVAL"""
+    import asyncio
+    import dataclasses
+    import main
+
+    class Stop(Exception):
+        pass
+
+    async def stop(delay):
+        raise Stop
+
+    async def no_backfill():
+        pass
+
+    runs = []
+    monkeypatch.setattr(main, "settings", dataclasses.replace(main.settings, expiry_sweep_interval=0))
+    monkeypatch.setattr(main, "MEDIA_GC_MODE", "archive")
+    monkeypatch.setattr(main, "migrate_on_startup", lambda: None)
+    monkeypatch.setattr(main, "run_qr_backfill", no_backfill)
+    monkeypatch.setattr(main, "collect_orphaned_media", lambda **kwargs: runs.append(kwargs))
+    monkeypatch.setattr(main.asyncio, "sleep", stop)
+    with pytest.raises(Stop):
+        asyncio.run(main.run_worker())
+    assert runs == [{"archive": True, "max_objects": main.MEDIA_GC_MAX_OBJECTS}]
+
+
+def test_media_gc_runs_once_at_a_time_and_rechecks_references(client, test_db, monkeypatch, tmp_path):
+    import os
+    import time
+    import main
+    from media_storage import LocalStorage
+
+    storage = LocalStorage({"uploads": str(tmp_path / "uploads"), "qrcodes": str(tmp_path / "qrcodes")},
+                           archive_dir=str(tmp_path / "archive"))
+    monkeypatch.setattr(main, "media", storage)
+    storage.write_bytes("uploads/old.jpg", b"x")
+    day_ago = time.time() - 86400 * 2
+    os.utime(storage.path("uploads/old.jpg"), (day_ago, day_ago))
+
+    # Another worker is collecting: this run leaves everything alone
+    with test_db() as db:
+        lease = main.claim_media_gc_lease(db)
+    assert client.post("/media/gc").status_code == 409
+    assert storage.exists("uploads/old.jpg")
+    with test_db() as db:
+        assert main.claim_job_state(db, "media_gc_lease", lease, "")
+
+    # The old upload is saved on an item after the batch was checked
+    batch_checks = []
+    real_referenced_media = main.referenced_media
+
+    def referenced_media(db, keys):
+        if not batch_checks:
+            batch_checks.append(keys)
+            client.post("/items/", json={"name": "Drill", "category": "Tools", "quantity": 1,
+                                         "image_url": "/uploads/old.jpg"})
+            return set()
+        return real_referenced_media(db, keys)
+
+    monkeypatch.setattr(main, "referenced_media", referenced_media)
+    report = client.post("/media/gc").json()
+    assert report["orphaned"] == 0 and storage.exists("uploads/old.jpg")
+
+    # Archiving an object a concurrent run already moved is not an error
+    storage.archive("uploads/old.jpg")
+    storage.archive("uploads/old.jpg")
+    assert (tmp_path / "archive" / "uploads" / "old.jpg").read_bytes() == b"x"
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+import media_storage
+from media_storage import LocalStorage, S3Storage, create_media_storage
+
+
+async def chunked(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_local_storage_streams_and_rejects_escaping_keys(tmp_path):
+    storage = LocalStorage({"uploads": str(tmp_path / "uploads")})
+
+    assert asyncio.run(storage.save("uploads/a.jpg", chunked(b"ab", b"cd"))) == 4
+    assert storage.read("uploads/a.jpg") == b"abcd"
+    assert asyncio.run(storage.load("uploads/missing.jpg")) is None
+    assert storage.download_url("uploads/a.jpg") is None and storage.upload_url("uploads/a.jpg") is None
+
+    async def failing():
+        yield b"partial"
+        raise IOError("client went away")
+
+    with pytest.raises(IOError):
+        asyncio.run(storage.save("uploads/b.jpg", failing()))
+    # Nothing half-written is left behind
+    assert os.listdir(tmp_path / "uploads") == ["a.jpg"]
+
+    for key in ("uploads/../x", "qrcodes/1.png", "uploads/"):
+        with pytest.raises(ValueError):
+            storage.path(key)
+    assert [(obj.key, obj.size) for obj in storage.list("uploads")] == [("uploads/a.jpg", 4)]
+    assert list(storage.list("uploads", start_after="uploads/a.jpg")) == []
+    storage.delete("uploads/a.jpg")
+    assert not storage.exists("uploads/a.jpg")
+
+
+def test_s3_storage_multipart_and_presigned_urls(monkeypatch, fake_s3):
+    monkeypatch.setattr(media_storage, "S3_PART_SIZE", 4)
+    client = fake_s3
+    storage = S3Storage("media", prefix="/stuf/", client=client, url_ttl=60)
+
+    storage.write_bytes("qrcodes/1.png", b"png")
+    assert client.calls == ["put_object"] and storage.read("qrcodes/1.png") == b"png"
+
+    client.calls.clear()
+    asyncio.run(storage.save("uploads/big.jpg", chunked(b"abc", b"defgh", b"ij")))
+    assert client.calls == ["create_multipart_upload", "upload_part", "upload_part",
+                            "upload_part", "complete_multipart_upload"]
+    assert client.objects["stuf/uploads/big.jpg"] == b"abcdefghij"
+
+    assert storage.read("uploads/missing.jpg") is None and not storage.exists("uploads/missing.jpg")
+    assert storage.download_url("uploads/big.jpg") == "https://s3.test/media/stuf/uploads/big.jpg?op=get_object&expires=60"
+    upload = storage.upload_url("uploads/new.jpg", "image/jpeg")
+    assert upload["method"] == "PUT" and upload["headers"] == {"Content-Type": "image/jpeg"}
+
+    assert [obj.key for obj in storage.list("uploads")] == ["uploads/big.jpg"]
+    storage.write_bytes("qrcodes/2.png", b"png")
+    assert [obj.key for obj in storage.list("qrcodes", start_after="qrcodes/1.png")] == ["qrcodes/2.png"]
+    storage.archive("qrcodes/2.png")
+    assert "stuf/archive/qrcodes/2.png" in client.objects and not storage.exists("qrcodes/2.png")
+
+    public = S3Storage("media", client=client, public_url="https://cdn.test/")
+    assert public.download_url("uploads/big.jpg") == "https://cdn.test/uploads/big.jpg"
+
+
+def test_create_media_storage(tmp_path, monkeypatch):
+    monkeypatch.delenv("MEDIA_BACKEND", raising=False)
+    storage = create_media_storage(upload_dir=str(tmp_path / "u"), qrcode_dir=str(tmp_path / "q"))
+    assert isinstance(storage, LocalStorage) and storage.directories["qrcodes"] == str(tmp_path / "q")
+    monkeypatch.delenv("S3_BUCKET", raising=False)
+    with pytest.raises(RuntimeError):
+        create_media_storage("s3")
+
+
+def test_backend_missing_an_operation_fails_at_construction():
+    class ReadOnlyStorage(media_storage.MediaStorage):
+        def open_writer(self, key, content_type=None):
+            raise PermissionError(key)
+
+        def read(self, key):
+            return None
+
+        def exists(self, key):
+            return False
+
+        def delete(self, key):
+            pass
+
+    # No list() or archive(), so media GC could never run against it
+    with pytest.raises(TypeError, match="abstract"):
+        ReadOnlyStorage()
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv("S3_TEST_ENDPOINT_URL"), reason="set S3_TEST_ENDPOINT_URL (and S3_TEST_BUCKET) to run against MinIO")
+def test_s3_storage_against_minio():
+    """e.g. docker run -p 9000:9000 minio/minio server /data, with AWS_ACCESS_KEY_ID=minioadmin ..."""
+    storage = S3Storage(os.getenv("S3_TEST_BUCKET", "stuf-test"), prefix=f"test-{uuid.uuid4().hex}",
+                        endpoint_url=os.environ["S3_TEST_ENDPOINT_URL"], region="us-east-1")
+    data = os.urandom(media_storage.S3_PART_SIZE + 1024)
+    asyncio.run(storage.save("uploads/large.bin", chunked(data[:1000], data[1000:])))
+    try:
+        assert storage.read("uploads/large.bin") == data
+    finally:
+        storage.delete("uploads/large.bin")
+    assert not storage.exists("uploads/large.bin")
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, inspect, text
+
+from main import upgrade_database
+
+
+def _indexes(engine):
+    # The inspector skips expression indexes on SQLite, so read the catalog directly
+    with engine.connect() as conn:
+        return set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'items'"
+        )).scalars())
+
+
+def test_upgrade_creates_schema_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    assert upgrade_database(engine) is True
+    tables = set(inspect(engine).get_table_names())
+    assert {"items", "job_state", "item_barcodes", "category_thresholds", "item_changes", "stats_rollups",
+            "locations", "location_closure"} <= tables
+    assert {"ix_items_category_name", "ix_items_category_id", "ix_items_updated_at",
+            "ix_items_attr_color", "ix_items_low_stock", "ix_items_image_url"} <= _indexes(engine)
+    # Already at head: nothing to run
+    assert upgrade_database(engine) is False
+
+
+def test_upgrade_rechecks_version_under_the_lock(tmp_path, monkeypatch):
+    import main
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'race.db'}")
+    assert upgrade_database(engine) is True
+    # A worker that read the version before another one finished migrating
+    monkeypatch.setattr(main, "schema_revision", lambda bind=None: None)
+    assert upgrade_database(engine) is False
+
+    # Postgres workers queue on an advisory lock before running any DDL
+    statements = []
+    postgres = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"),
+                               execute=lambda statement, params: statements.append((str(statement), params)))
+    main.lock_migrations(postgres)
+    assert statements == [("SELECT pg_advisory_xact_lock(:key)", {"key": main.MIGRATION_LOCK_KEY})]
+
+
+def test_upgrade_adopts_pre_migration_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, name VARCHAR, category VARCHAR, quantity INTEGER, "
+            "custom_attributes JSON, image_url VARCHAR, qr_code_url VARCHAR)"
+        ))
+        conn.execute(text("CREATE INDEX ix_items_id ON items (id)"))
+        conn.execute(text("CREATE INDEX ix_items_category ON items (category)"))
+        conn.execute(text(
+            "INSERT INTO items (name, category, quantity, custom_attributes) "
+            "VALUES ('PLA', 'Filament', 3, '{\"color\": \"red\"}')"
+        ))
+
+    upgrade_database(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("items")}
+    assert {"low_stock", "expiry_date", "image_hash", "updated_at", "version", "location_id"} <= columns
+    assert not {"ix_items_id", "ix_items_category"} & _indexes(engine)
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT name, low_stock, updated_at FROM items")).one()
+    assert row.name == "PLA" and row.low_stock == 0 and row.updated_at is not None
+    assert {"ix_items_attr_color", "ix_items_low_stock"} <= _indexes(engine)
+
+    # The rebuilt table never hands a deleted item's id to a new item
+    with engine.begin() as conn:
+        deleted_id = conn.execute(text("SELECT id FROM items")).scalar()
+        conn.execute(text("DELETE FROM items"))
+        conn.execute(text(
+            "INSERT INTO items (name, category, quantity, custom_attributes) VALUES ('PETG', 'Filament', 1, '{}')"
+        ))
+        assert conn.execute(text("SELECT id FROM items")).scalar() > deleted_id
+
+
+def test_query_plans_use_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    upgrade_database(engine)
+
+    def plan(sql):
+        with engine.connect() as conn:
+            return " ".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+    assert "ix_items_category_id" in plan("SELECT * FROM items WHERE category = 'Tools' AND id > 10 ORDER BY id")
+    assert "ix_items_category_name" in plan("SELECT id FROM items WHERE category = 'Tools' AND name = 'Hammer'")
+    assert "ix_items_attr_color" in plan(
+        "SELECT id FROM items WHERE json_extract(custom_attributes, '$.color') = 'red'"
+    )
+    subtree = plan(
+        "SELECT items.id FROM items JOIN location_closure ON location_closure.descendant_id = items.location_id "
+        "WHERE location_closure.ancestor_id = 1"
+    )
+    assert "sqlite_autoindex_location_closure_1" in subtree and "ix_items_location_id" in subtree
+
+
+def test_migrated_nullability_matches_models(tmp_path):
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+
+    from main import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'compare.db'}")
+    upgrade_database(engine)
+
+    with engine.connect() as conn:
+        diffs = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    # Column changes come back as a list of tuples per table
+    nullable = [change for diff in diffs if isinstance(diff, list) for change in diff
+                if change[0] == "modify_nullable"]
+    assert nullable == []
+
+
+def test_schema_revision_matches_alembic_head():
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    from main import ALEMBIC_INI, SCHEMA_REVISION
+
+    assert ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_current_head() == SCHEMA_REVISION
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from rate_limit import (
+    AdmissionGate, MemoryRateLimiter, Overloaded, RateLimiter, SQLiteRateLimiter, client_key, create_rate_limiter,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_refills():
+    clock = Clock()
+    limiter = MemoryRateLimiter(per_minute=60, burst=2, clock=clock)
+
+    assert limiter.take("a") == 0 and limiter.take("a") == 0
+    assert limiter.take("a") == pytest.approx(1.0)
+    # Other clients have their own bucket
+    assert limiter.take("b") == 0
+    clock.now += 1
+    assert limiter.take("a") == 0
+    assert limiter.take("a") > 0
+
+
+def test_backend_without_take_fails_at_construction():
+    class Unfinished(RateLimiter):
+        name = "unfinished"
+
+    with pytest.raises(TypeError, match="abstract"):
+        Unfinished(per_minute=60, burst=2)
+
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "limits.sqlite3")
+    first = SQLiteRateLimiter(per_minute=30, burst=1, path=path, clock=clock)
+    second = SQLiteRateLimiter(per_minute=30, burst=1, path=path, clock=clock)
+
+    assert first.take("client") == 0
+    assert second.take("client") == pytest.approx(2.0)
+    assert create_rate_limiter(0, 5) is None
+    assert isinstance(create_rate_limiter(10, 5, "memory"), MemoryRateLimiter)
+
+
+def test_admission_gate_queues_then_sheds():
+    gate = AdmissionGate(max_active=1, max_waiting=1, max_wait=0.05)
+
+    async def run():
+        await gate.acquire()
+        queued = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        # Queue full: rejected at once
+        with pytest.raises(Overloaded, match="queue full"):
+            await gate.acquire()
+        gate.release()
+        await queued  # the released slot passed to the waiter
+        assert gate.active == 1
+        with pytest.raises(Overloaded, match="timed out"):
+            await gate.acquire()
+        gate.release()
+        assert gate.active == 0
+
+    asyncio.run(run())
+
+
+def test_client_key_prefers_api_key():
+    scope = {"client": ("10.0.0.5", 1234), "headers": [(b"x-api-key", b"secret")]}
+    assert client_key(scope).startswith("key:") and "secret" not in client_key(scope)
+    assert client_key({"client": ("10.0.0.5", 1234), "headers": []}) == "ip:10.0.0.5"
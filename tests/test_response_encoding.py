@@ -0,0 +1,52 @@
+import pytest
+
+from response_encoding import available_codecs, choose_encoding, columnar, wants_msgpack
+
+
+def test_choose_encoding_honors_quality_and_availability():
+    codecs = {"gzip": None, "br": None}
+    assert choose_encoding("gzip, deflate, br", codecs) == "br"
+    assert choose_encoding("br;q=0.5, gzip", codecs) == "gzip"
+    assert choose_encoding("br;q=0, *", codecs) == "gzip"
+    assert choose_encoding("zstd", codecs) is None
+    assert choose_encoding(None, codecs) is None
+    assert "gzip" in available_codecs()
+
+
+def test_msgpack_negotiation_and_columnar_rows():
+    assert wants_msgpack("application/msgpack")
+    assert wants_msgpack("application/x-msgpack, application/json;q=0.5")
+    assert not wants_msgpack("application/json, application/msgpack;q=0.5")
+    assert not wants_msgpack("*/*")
+    assert columnar([{"id": 1, "name": "PLA"}, {"id": 2, "name": "PETG"}]) == {
+        "columns": ["id", "name"], "rows": [[1, "PLA"], [2, "PETG"]]
+    }
+    assert columnar([]) == {"columns": [], "rows": []}
+
+
+def test_item_list_is_compressed_when_large(client):
+    for index in range(30):
+        client.post("/items/", json={"name": f"Filament {index}", "category": "Filament", "quantity": index,
+                                     "custom_attributes": {"color": "red", "material": "PLA"}})
+
+    response = client.get("/items/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 30
+
+    # Content-Length is the compressed size; the client hands back the decoded body
+    assert int(response.headers["content-length"]) * 3 < len(response.content)
+
+    # Below the size threshold and without Accept-Encoding the body is left alone
+    assert "content-encoding" not in client.get("/items/1").headers
+    assert "content-encoding" not in client.get("/items/", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_item_list_as_msgpack(client):
+    msgpack = pytest.importorskip("msgpack")
+    client.post("/items/", json={"name": "PLA", "category": "Filament", "quantity": 2})
+
+    response = client.get("/items/", headers={"Accept": "application/msgpack"})
+    assert response.headers["content-type"] == "application/msgpack"
+    body = msgpack.unpackb(response.content)
+    assert body["columns"][:2] == ["id", "name"] and body["rows"][0][1] == "PLA"
@@ -0,0 +1,70 @@
+import numpy as np
+
+from semantic_index import EmbeddingIndex, HashedNgramEmbedder, item_text
+
+
+def test_hashed_embeddings_rank_reworded_names_first():
+    index = EmbeddingIndex(HashedNgramEmbedder())
+    index.sync({
+        1: "Red PLA spool",
+        2: "Blue PETG filament",
+        3: "Claw hammer",
+        4: "Phillips screwdriver",
+    })
+
+    results = index.search(["PLA filament red 1kg", "hammer"], k=2)
+    assert [item_id for item_id, _ in results[0]] == [1, 2]
+    assert results[1][0][0] == 3
+    assert results[0][0][1] > results[0][1][1] > 0
+
+
+def test_incremental_updates_keep_matrix_contiguous():
+    index = EmbeddingIndex(HashedNgramEmbedder(dim=64))
+    index.sync({item_id: f"item {item_id}" for item_id in range(100)})
+    index.remove(10)
+    index.upsert(5, "brand new text")
+
+    assert len(index) == 99
+    assert index.search(["brand new text"], k=1)[0][0][0] == 5
+    assert 10 not in {item_id for item_id, _ in index.search(["item 10"], k=99)[0]}
+    # Only the changed document is re-embedded on the next sync
+    documents = {item_id: f"item {item_id}" for item_id in range(100) if item_id != 10}
+    documents[5] = "brand new text"
+    documents[42] = "changed"
+    assert index.sync(documents) == 1
+
+
+def test_saved_index_is_memory_mapped_on_load(tmp_path):
+    embedder = HashedNgramEmbedder(dim=64)
+    index = EmbeddingIndex(embedder, path=str(tmp_path))
+    index.sync({1: item_text("Red PLA spool", "Filament", {"color": "red"}), 2: "Claw hammer"})
+    index.save()
+
+    loaded = EmbeddingIndex(HashedNgramEmbedder(dim=64), path=str(tmp_path))
+    assert loaded.search(["red pla"], k=1)[0][0][0] == 1
+    assert isinstance(loaded._vectors, np.memmap)
+    assert loaded.sync({1: item_text("Red PLA spool", "Filament", {"color": "red"}), 2: "Claw hammer"}) == 0
+    loaded.upsert(3, "Tape measure")
+    assert loaded.search(["tape measure"], k=1)[0][0][0] == 3
+
+
+def test_ensure_synced_reads_only_changes_after_the_first_sync():
+    version = [0]
+    index = EmbeddingIndex(HashedNgramEmbedder(dim=64), version=lambda: version[0])
+    calls = []
+
+    def loader(since):
+        calls.append(since)
+        if since is None:
+            return {1: "Red PLA spool", 2: "Claw hammer"}, 10
+        return {2: "Tape measure"}, 20
+
+    index.ensure_synced(loader)
+    version[0] += 1  # another worker wrote
+    index.ensure_synced(loader)
+    assert calls == [None, 10]
+    # A partial sync only upserts; items it did not mention stay
+    assert len(index) == 2
+    assert index.search(["tape measure"], k=1)[0][0][0] == 2
+    assert [item_id for item_id, _ in index.search(["red pla"], k=2, min_score=-1.0, candidates=[2, 99])[0]] == [2]
+    assert index.search(["red pla"], k=1, candidates=[]) == [[]]
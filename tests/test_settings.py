@@ -0,0 +1,88 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from settings import Settings
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///./env.db")
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    monkeypatch.setenv("AI_MAX_CONCURRENCY", "2")
+    monkeypatch.setenv("DEBUG", "false")
+    monkeypatch.setenv("ALLOWED_ORIGINS", "http://a.example, http://b.example")
+    monkeypatch.setenv("BACKGROUND_JOBS", "false")
+    monkeypatch.delenv("QR_BACKFILL_ON_STARTUP", raising=False)
+
+    settings = Settings.from_env()
+    assert settings.db_pool_size == 12
+    assert settings.ai_max_concurrency == 2
+    assert settings.cors_origins == ("http://a.example", "http://b.example")
+    assert settings.background_jobs is False
+    # The QR backfill is left to the --worker process unless asked for
+    assert settings.qr_backfill_on_startup is False
+    assert settings.replace(debug=True).cors_origins == ("*",)
+
+    monkeypatch.delenv("DATABASE_URL")
+    with pytest.raises(RuntimeError):
+        Settings.from_env()
+
+
+def test_create_app_uses_settings(tmp_path, restore_main):
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'api.db'}",
+        db_pool_size=3,
+        ai_max_concurrency=1,
+        upload_dir=str(tmp_path / "media" / "uploads"),
+        qrcode_dir=str(tmp_path / "media" / "qrcodes"),
+        background_jobs=False,
+    )
+    app = main.create_app(settings)
+
+    assert (tmp_path / "media" / "uploads").is_dir() and (tmp_path / "media" / "qrcodes").is_dir()
+    assert [handler.__name__ for handler in app.router.on_startup] == ["migrate_on_startup"]
+    assert main.engine.pool.size() == 3
+
+    with TestClient(app) as client:
+        item = client.post("/items/", json={"name": "Drill", "category": "Tools", "quantity": 1}).json()
+        assert client.get("/items/").json()[0]["id"] == item["id"]
+        upload = client.post("/upload/", files={"file": ("photo.png", b"png-bytes", "image/png")}).json()
+    assert (tmp_path / "media" / "uploads" / "photo.png").read_bytes() == b"png-bytes"
+    assert upload["image_url"] == "/uploads/photo.png"
+    assert (tmp_path / "media" / "qrcodes" / f"{item['id']}.png").exists()
+
+
+def test_create_app_with_s3_media(tmp_path, monkeypatch, restore_main, fake_s3):
+    from media_storage import S3Storage
+
+    client = fake_s3
+    monkeypatch.setattr(main, "create_media_storage", lambda backend, **options: S3Storage(options["bucket"], client=client))
+    app = main.create_app(Settings(database_url=f"sqlite:///{tmp_path / 'api.db'}", media_backend="s3",
+                                   s3_bucket="media", background_jobs=False))
+
+    with TestClient(app) as api:
+        item = api.post("/items/", json={"name": "Drill", "category": "Tools", "quantity": 1}).json()
+        assert api.post("/upload/", files={"file": ("../photo.png", b"png-bytes", "image/png")}).json() == {
+            "image_url": "/uploads/photo.png"
+        }
+        redirect = api.get("/uploads/photo.png", follow_redirects=False)
+        presign = api.post("/upload/presign", json={"filename": "shelf.jpg", "content_type": "image/jpeg"}).json()
+    assert client.objects["uploads/photo.png"] == b"png-bytes"
+    assert f"qrcodes/{item['id']}.png" in client.objects
+    assert redirect.status_code == 307 and redirect.headers["location"].startswith("https://s3.test/media/uploads/photo.png")
+    assert presign["image_url"] == "/uploads/shelf.jpg" and presign["upload"]["method"] == "PUT"
+
+
+def test_smart_add_is_rate_limited_per_client(tmp_path, monkeypatch, restore_main):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    app = main.create_app(Settings(database_url=f"sqlite:///{tmp_path / 'api.db'}", ai_rate_per_minute=6,
+                                   ai_rate_burst=1, upload_dir=str(tmp_path / "uploads"),
+                                   qrcode_dir=str(tmp_path / "qrcodes"), background_jobs=False))
+
+    with TestClient(app) as client:
+        assert client.post("/smart-add/", json={"photos": []}).status_code == 200
+        limited = client.post("/smart-add/", json={"photos": []})
+        assert limited.status_code == 429 and limited.headers["Retry-After"] == "10"
+        # Another API key has its own budget, and the cheap endpoints are not limited
+        assert client.post("/smart-add/", json={"photos": []}, headers={"X-API-Key": "other"}).status_code == 200
+        assert client.get("/items/").status_code == 200
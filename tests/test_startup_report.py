@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+from startup_report import by_package, direct_imports, parse_importtime
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 | _io
+import time:       300 |        300 |     numpy._core
+import time:      1700 |       2000 |   numpy
+import time:        50 |         50 |     sqlalchemy.sql
+import time:       950 |       1000 |   sqlalchemy
+import time:       400 |       3400 | main
+"""
+
+
+def test_importtime_parsing():
+    entries = parse_importtime(SAMPLE)
+    assert entries[0] == ("_io", 0, 120, 120)
+    assert direct_imports(entries) == [("numpy", 2000), ("sqlalchemy", 1000)]
+    assert by_package(entries)["numpy"] == 2000
+
+
+def test_import_main_skips_heavy_optional_modules():
+    """Gemini SDK, QR rendering, PIL and NumPy load on first use, not at import"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        "import sys, main; "
+        "print(sorted(m for m in ('google.generativeai', 'qrcode', 'PIL', 'numpy', 'alembic') if m in sys.modules))"
+    )
+    env = dict(os.environ, DATABASE_URL=os.environ.get("DATABASE_URL", "sqlite:///./test_inventory.db"))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_import_main_builds_no_app():
+    """Only `main.app` builds the API; importing main needs no DATABASE_URL"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import main; print('app' in vars(main), main.settings is None)"
+    env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "False True"
@@ -0,0 +1,61 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+
+from text_extraction import TextExtractor, get_extractor, normalize_locale
+
+
+@pytest.mark.parametrize("text,locale,amount,currency", [
+    ("Price: $10.99", "en_US", "10.99", "USD"),
+    ("10.99 USD", "en_US", "10.99", "USD"),
+    ("99 cents", "en_US", "0.99", "USD"),
+    ("1,000 dollars", "en_US", "1000", "USD"),
+    ("12,99 €", "de_DE", "12.99", "EUR"),
+    ("€1.234,56", "fr_FR", "1234.56", "EUR"),
+    ("Preis: 5,49", "de_DE", "5.49", "EUR"),
+    ("£3.50 each", "en_GB", "3.50", "GBP"),
+])
+def test_extract_price(text, locale, amount, currency):
+    match = get_extractor(locale).extract_price(text)
+    assert match.amount == Decimal(amount)
+    assert match.currency == currency
+
+
+@pytest.mark.parametrize("text,locale,expected", [
+    ("best by 12/31/2024", "en_US", date(2024, 12, 31)),
+    ("EXP 03/04/25", "en_US", date(2025, 3, 4)),
+    ("EXP 03/04/25", "en_GB", date(2025, 4, 3)),
+    ("MHD 31.12.2024", "de_DE", date(2024, 12, 31)),
+    ("exp 15 Jan 2024", "en_US", date(2024, 1, 15)),
+    ("Jan 15, 2024", "en_US", date(2024, 1, 15)),
+    ("EXP 03/2025", "en_US", date(2025, 3, 31)),
+    ("à consommer avant 5 août 2025", "fr_FR", date(2025, 8, 5)),
+    ("caducidad 12 dic 2025", "es_ES", date(2025, 12, 12)),
+    ("lot 2024-01-02 exp 2025-06-30", "en_US", date(2025, 6, 30)),
+])
+def test_extract_expiry(text, locale, expected):
+    assert get_extractor(locale).extract_expiry(text).date == expected
+
+
+def test_extract_returns_none_without_matches():
+    result = get_extractor().extract("Screws M3 assorted, lot 4471")
+    assert result.price is None
+    assert result.expiry is None
+
+
+def test_extract_batch_matches_single_calls():
+    texts = ["$5 exp 01/02/2026", "nothing here", "Preis: 5,49 MHD 31.12.2024"]
+    extractor = get_extractor("de_DE")
+    assert extractor.extract_batch(texts) == [extractor.extract(text) for text in texts]
+
+
+def test_unsupported_locale():
+    with pytest.raises(ValueError):
+        TextExtractor("xx_XX")
+
+
+def test_normalize_locale():
+    assert normalize_locale("de-DE") == normalize_locale("de_de.UTF-8") == "de_DE"
+    assert normalize_locale("en") == "en_US"
+    assert normalize_locale("de-AT") == "de_DE"
+    assert normalize_locale("xx-YY") is None and normalize_locale(None) is None
@@ -0,0 +1,222 @@
+"""
+Price and expiry extraction from OCR / AI text.
+
+All patterns are compiled once at import into a single alternation per value
+type, so each call is one regex scan instead of a loop over pattern lists.
+Results are structured: prices as Decimal plus ISO currency code, expiry dates
+as datetime.date.
+
+Locales only change how ambiguous numeric input is read:
+
+    en_US   month-first dates (03/04/2025 = March 4), '.' decimal point
+    en_GB, de_DE, fr_FR, es_ES
+            day-first dates (03/04/2025 = 3 April), ',' decimal comma allowed
+"""
+import calendar
+import re
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+DAY_FIRST_LOCALES = {"en_GB", "de_DE", "fr_FR", "es_ES"}
+LOCALE_CURRENCIES = {"en_US": "USD", "en_GB": "GBP", "de_DE": "EUR", "fr_FR": "EUR", "es_ES": "EUR"}
+SUPPORTED_LOCALES = set(LOCALE_CURRENCIES)
+# A bare language, or a language with an unsupported region ("de-AT"), uses these
+LANGUAGE_LOCALES = {"en": "en_US", "de": "de_DE", "fr": "fr_FR", "es": "es_ES"}
+
+CURRENCY_SYMBOLS = {
+    "$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY",
+    "usd": "USD", "eur": "EUR", "gbp": "GBP", "jpy": "JPY", "cad": "CAD", "aud": "AUD",
+    "dollar": "USD", "dollars": "USD", "euro": "EUR", "euros": "EUR",
+    "pound": "GBP", "pounds": "GBP", "cent": "USD", "cents": "USD",
+}
+
+MONTHS = {}
+for number, names in enumerate([
+    "jan january janvier januar enero ene",
+    "feb february février fevrier févr fevr februar febrero",
+    "mar march mars märz maerz mär mrz marzo",
+    "apr april avril avr abril abr",
+    "may mai mayo",
+    "jun june juin juni junio",
+    "jul july juillet juil juli julio",
+    "aug august août aout agosto ago",
+    "sep sept september septembre septiembre setiembre",
+    "oct october octobre oktober okt octubre",
+    "nov november novembre noviembre",
+    "dec december décembre decembre dezember dez diciembre dic",
+], start=1):
+    for name in names.split():
+        MONTHS[name] = number
+
+_AMOUNT = r"\d{1,3}(?:[.,\s]\d{3})*(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?"
+_CURRENCY_WORDS = r"usd|eur|gbp|jpy|cad|aud|dollars?|euros?|pounds?|cents?"
+
+PRICE_PATTERN = re.compile(
+    rf"(?P<pre_sym>[$€£¥])\s?(?P<pre_amt>{_AMOUNT})"
+    rf"|(?=\d)\b(?P<post_amt>{_AMOUNT})\s?(?P<post_sym>[$€£¥]|(?:{_CURRENCY_WORDS})\b)"
+    rf"|(?=p)\b(?:price|preis|prix|precio)[\s:]*(?P<kw_pre>[$€£¥])?\s?(?P<kw_amt>{_AMOUNT})"
+    rf"(?:\s?(?P<kw_post>[$€£¥]|(?:{_CURRENCY_WORDS})\b))?",
+    re.IGNORECASE,
+)
+
+# Every branch is gated on its first character class so the scanner rejects most
+# positions immediately; month words are validated against MONTHS afterwards.
+DATE_PATTERN = re.compile(
+    r"(?=\d)(?:"
+    r"(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})"
+    r"|(?P<num_a>\d{1,2})[/.\-](?P<num_b>\d{1,2})[/.\-](?P<num_y>\d{4}|\d{2})(?!\d)"
+    r"|(?P<dmy_d>\d{1,2})\.?\s+(?P<dmy_m>[^\W\d_]{3,10})\.?,?\s+(?P<dmy_y>\d{4}|\d{2})(?!\d)"
+    r"|(?P<my_m>\d{1,2})/(?P<my_y>\d{4}))"
+    r"|(?=[^\W\d_])\b(?P<mdy_m>[^\W\d_]{3,10})\.?\s+(?:(?P<mdy_d>\d{1,2}),?\s+)?(?P<mdy_y>\d{4})",
+    re.IGNORECASE,
+)
+
+EXPIRY_KEYWORD_PATTERN = re.compile(
+    r"(?=[ebumàdc])\b(?:exp(?:ires?|ired|iry|iration)?|best\s+(?:by|before)|use\s+by|bb|"
+    r"mhd|mindestens\s+haltbar\s+bis|à\s+consommer\s+(?:avant|jusqu)|dlc|ddm|"
+    r"caducidad|consumir\s+antes\s+de|cad)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class PriceMatch:
+    amount: Decimal
+    currency: str
+    text: str
+
+    def to_dict(self):
+        return {"amount": str(self.amount), "currency": self.currency, "text": self.text}
+
+
+@dataclass(frozen=True)
+class DateMatch:
+    date: date
+    text: str
+
+    @property
+    def iso(self) -> str:
+        return self.date.isoformat()
+
+
+@dataclass(frozen=True)
+class ExtractionResult:
+    price: Optional[PriceMatch]
+    expiry: Optional[DateMatch]
+
+
+def _parse_amount(raw: str) -> Optional[Decimal]:
+    """'1,234.56', '1.234,56' and '12,99' all work: a separator followed by 1-2 digits is the decimal mark"""
+    raw = raw.replace(" ", "")
+    last_sep = max(raw.rfind("."), raw.rfind(","))
+    if last_sep != -1 and len(raw) - last_sep - 1 in (1, 2):
+        digits = re.sub(r"[.,]", "", raw[:last_sep]) + "." + raw[last_sep + 1:]
+    else:
+        digits = re.sub(r"[.,]", "", raw)
+    try:
+        return Decimal(digits)
+    except InvalidOperation:
+        return None
+
+
+def _year(raw: str) -> int:
+    year = int(raw)
+    return year + 2000 if year < 100 else year
+
+
+def _make_date(year: int, month: int, day: Optional[int]) -> Optional[date]:
+    try:
+        if day is None:
+            # Month-only expiry ("EXP 03/2025") means the end of that month
+            day = calendar.monthrange(year, month)[1]
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+class TextExtractor:
+    """Locale-aware extractor; instances are cheap, patterns are shared"""
+
+    def __init__(self, locale: str = "en_US"):
+        if locale not in SUPPORTED_LOCALES:
+            raise ValueError(f"Unsupported locale: {locale}")
+        self.locale = locale
+        self.day_first = locale in DAY_FIRST_LOCALES
+
+    def extract_price(self, text: str) -> Optional[PriceMatch]:
+        for match in PRICE_PATTERN.finditer(text):
+            groups = match.groupdict()
+            raw_amount = groups["pre_amt"] or groups["post_amt"] or groups["kw_amt"]
+            symbol = (groups["pre_sym"] or groups["post_sym"] or groups["kw_pre"] or groups["kw_post"] or "").lower()
+            amount = _parse_amount(raw_amount)
+            if amount is None:
+                continue
+            if symbol.startswith("cent"):
+                amount = amount / 100
+            currency = CURRENCY_SYMBOLS.get(symbol) or LOCALE_CURRENCIES[self.locale]
+            return PriceMatch(amount=amount, currency=currency, text=match.group().strip())
+        return None
+
+    def _match_date(self, match: "re.Match") -> Optional[date]:
+        g = match.groupdict()
+        if g["iso_y"]:
+            return _make_date(int(g["iso_y"]), int(g["iso_m"]), int(g["iso_d"]))
+        if g["num_a"]:
+            first, second, year = int(g["num_a"]), int(g["num_b"]), _year(g["num_y"])
+            day, month = (first, second) if self.day_first else (second, first)
+            if month > 12 and day <= 12:
+                day, month = month, day
+            return _make_date(year, month, day)
+        if g["dmy_d"]:
+            month = MONTHS.get(g["dmy_m"].lower())
+            return _make_date(_year(g["dmy_y"]), month, int(g["dmy_d"])) if month else None
+        if g["my_m"]:
+            return _make_date(int(g["my_y"]), int(g["my_m"]), None)
+        month = MONTHS.get(g["mdy_m"].lower())
+        day = int(g["mdy_d"]) if g["mdy_d"] else None
+        return _make_date(int(g["mdy_y"]), month, day) if month else None
+
+    def _first_date(self, text: str, pos: int = 0) -> Optional[DateMatch]:
+        for match in DATE_PATTERN.finditer(text, pos):
+            parsed = self._match_date(match)
+            if parsed is not None:
+                return DateMatch(date=parsed, text=match.group())
+        return None
+
+    def extract_expiry(self, text: str) -> Optional[DateMatch]:
+        """Prefer a date following an expiry keyword, otherwise the first date in the text"""
+        keyword = EXPIRY_KEYWORD_PATTERN.search(text)
+        if keyword:
+            found = self._first_date(text, keyword.end())
+            if found:
+                return found
+        return self._first_date(text)
+
+    def extract(self, text: str) -> ExtractionResult:
+        return ExtractionResult(price=self.extract_price(text), expiry=self.extract_expiry(text))
+
+    def extract_batch(self, texts: Iterable[str]) -> List[ExtractionResult]:
+        extract = self.extract
+        return [extract(text) for text in texts]
+
+
+def normalize_locale(locale: Optional[str]) -> Optional[str]:
+    """
+    The supported locale for a POSIX or BCP 47 tag ('de-DE', 'de_de.UTF-8' and 'de'
+    all give 'de_DE'), or None when its language is not supported either
+    """
+    if not locale:
+        return None
+    language, _, region = locale.strip().split(".")[0].replace("-", "_").partition("_")
+    candidate = f"{language.lower()}_{region.upper()}"
+    if candidate in SUPPORTED_LOCALES:
+        return candidate
+    return LANGUAGE_LOCALES.get(language.lower())
+
+
+@lru_cache(maxsize=None)
+def get_extractor(locale: str = "en_US") -> TextExtractor:
+    return TextExtractor(locale)